@@ -1,6 +1,16 @@
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import Config
 from .extensions import db, migrate, login_manager, bcrypt
+from .utils.compression import init_compression
+from .utils.rate_limit import init_rate_limiting
+from .utils.deadlines import init_deadlines
+from .utils.idempotency import init_idempotency
+from .sharding.services import init_sharding
+from .traffic.capture import init_traffic_capture
+from .profiling.services import init_profiling
+from .utils.coalescing import init_coalescing
+from .availability.services import init_availability
 
 
 def create_app():
@@ -11,19 +21,66 @@ def create_app():
     migrate.init_app(app, db)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    init_traffic_capture(app)
+    init_compression(app)
+    init_rate_limiting(app)
+    init_deadlines(app)
+    init_idempotency(app)
+    init_sharding(app)
+    init_profiling(app)
+    init_coalescing(app)
+    init_availability(app)
+    if app.config["TRUSTED_PROXY_HOPS"]:
+        # Outermost, so rate limits and every other layer see the real client
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXY_HOPS"])
 
     from app.auth import models
     from app.cars import models
     from app.rentals import models
+    from app.core import models
+    from app.events import models
+    from app.jobs import models
+    from app.sharding import models
+    from app.repricing import models
 
     from app.auth.routes import auth
     from app.core.routes import core
     from app.cars.routes import cars
     from app.rentals.routes import rentals
+    from app.events.routes import events
+    from app.exports.routes import exports
+    from app.repricing.routes import repricing
+    from app.profiling.routes import profiling
+    from app.batch.routes import batch
+    from app.availability.routes import availability
+    from app.rentals import commands
+    from app.core import commands
+    from app.exports import commands
+    from app.jobs import tasks
+    from app.jobs.commands import jobs_cli, worker_command
+    from app.sharding.commands import shards_cli
+    from app.repricing.commands import repricing_cli
+    from app.traffic.commands import traffic_cli
+    from app.profiling.commands import profiling_cli
+    from app.plans.commands import plans_cli
 
     app.register_blueprint(core, url_prefix="/")
     app.register_blueprint(auth, url_prefix="/auth")
     app.register_blueprint(cars, url_prefix="/cars")
     app.register_blueprint(rentals, url_prefix="/rentals")
+    app.register_blueprint(events, url_prefix="/events")
+    app.register_blueprint(exports, url_prefix="/exports")
+    app.register_blueprint(repricing, url_prefix="/repricing")
+    app.register_blueprint(profiling, url_prefix="/profiles")
+    app.register_blueprint(batch, url_prefix="/batch")
+    app.register_blueprint(availability, url_prefix="/availability")
+
+    app.cli.add_command(worker_command)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(repricing_cli)
+    app.cli.add_command(traffic_cli)
+    app.cli.add_command(profiling_cli)
+    app.cli.add_command(plans_cli)
 
     return app
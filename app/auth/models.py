@@ -1,4 +1,5 @@
 import enum
+from datetime import datetime
 from ..extensions import db
 from flask_login import UserMixin
 
@@ -30,6 +31,10 @@ class User(db.Model, UserMixin):
     def get_id(self):
         return self.id
 
+    @property
+    def merchant_id(self):
+        return self.merchant_profile.id if self.merchant_profile else None
+
 
 class Merchant(db.Model):
     __tablename__ = "merchants"
@@ -46,3 +51,20 @@ class Merchant(db.Model):
 
     def __repr__(self):
         return f"<Merchant {self.company_name} >"
+
+
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        db.Index("ix_revoked_tokens_token_type_expires_at", "token_type", "expires_at"),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RevokedToken {self.token_type} {self.jti}>"
@@ -4,8 +4,9 @@ from flask_login import login_user, logout_user, current_user, login_required
 from ..extensions import db, login_manager
 from app.auth.models import User
 
-from . import services
+from . import services, tokens
 from .services import ValidationError, UserAlreadyExistsError, InvalidCredentialsError
+from .tokens import InvalidTokenError, TokenUser
 
 auth = Blueprint("auth", __name__)
 
@@ -15,6 +16,11 @@ def load_user(id):
     return User.query.get(int(id))
 
 
+@login_manager.request_loader
+def load_user_from_token(request):
+    return tokens.load_token_user()
+
+
 @auth.route("/login", methods=["POST"])
 def login():
     try:
@@ -32,6 +38,31 @@ def login():
         return jsonify({"error": str(e)}), 500
 
 
+@auth.route("/token", methods=["POST"])
+def issue_token():
+    try:
+        data = request.get_json()
+        user = services.login_user_service(data)
+        return jsonify(tokens.issue_tokens(user)), 200
+
+    except (ValidationError, InvalidCredentialsError) as e:
+        return jsonify({"error": str(e)}), 401
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@auth.route("/token/refresh", methods=["POST"])
+def refresh_token():
+    try:
+        data = request.get_json(silent=True) or {}
+        return jsonify(tokens.refresh_tokens(data.get("refresh_token"))), 200
+
+    except InvalidTokenError as e:
+        return jsonify({"error": str(e)}), 401
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @auth.route("/register", methods=["POST"])
 def register():
     try:
@@ -54,8 +85,13 @@ def register():
 @login_required
 def logout():
     try:
+        if isinstance(current_user._get_current_object(), TokenUser):
+            data = request.get_json(silent=True) or {}
+            tokens.revoke_tokens(current_user, data.get("refresh_token"))
         logout_user()
         return jsonify({"message": "Successfully logged out!"})
+    except InvalidTokenError as e:
+        return jsonify({"error": str(e)}), 401
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -64,12 +100,14 @@ def logout():
 @login_required
 def me():
     try:
+        # Token callers carry only claims, so load the row (a no-op for sessions)
+        user = db.session.get(User, current_user.id)
         user_data = {
-            "id": current_user.id,
-            "email": current_user.email,
-            "name": current_user.name,
-            "surname": current_user.surname,
-            "role": current_user.role.value,
+            "id": user.id,
+            "email": user.email,
+            "name": user.name,
+            "surname": user.surname,
+            "role": user.role.value,
         }
         return jsonify(user_data), 200
     except Exception as e:
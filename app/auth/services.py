@@ -1,5 +1,6 @@
 from ..extensions import db, bcrypt
 from .models import User, UserRole, Merchant
+from app.sharding.services import assign_shard
 
 
 class AuthError(Exception):
@@ -53,6 +54,8 @@ def register_user(data):
     if user_role == UserRole.MERCHANT:
         new_merchant = Merchant(company_name=data.get("company_name"), user=new_user)
         db.session.add(new_merchant)
+        db.session.flush()
+        assign_shard(new_merchant)
 
     db.session.commit()
     return new_user
@@ -0,0 +1,214 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app, g, request
+from flask_login import UserMixin
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy.dialects.postgresql import insert
+
+from ..extensions import db
+from .models import RevokedToken, User, UserRole
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+
+class TokenError(Exception):
+    pass
+
+
+class InvalidTokenError(TokenError):
+    pass
+
+
+class TokenUser(UserMixin):
+    """The caller as described by a verified access token; built without a query."""
+
+    def __init__(self, claims):
+        self.id = claims["uid"]
+        self.role = UserRole(claims["role"])
+        self.merchant_id = claims.get("mid")
+        self.token_id = claims["jti"]
+        self.token_expires_at = claims["exp"]
+
+    def get_id(self):
+        return self.id
+
+
+class RevocationList:
+    """Ids of revoked, still-unexpired access tokens, kept in memory.
+
+    The set is re-read from ``revoked_tokens`` at most once per ``interval``
+    seconds, so token checks cost one small query per worker per interval
+    instead of one per request. Revocations made by this process apply at once.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def contains(self, jti, interval):
+        now = time.monotonic()
+        if self._synced_at is None or now - self._synced_at >= interval:
+            with self._lock:
+                if self._synced_at is None or now - self._synced_at >= interval:
+                    self._sync()
+                    self._synced_at = now
+        return jti in self._revoked
+
+    def _sync(self):
+        rows = db.session.execute(
+            db.select(RevokedToken.jti, RevokedToken.expires_at).where(
+                RevokedToken.token_type == ACCESS,
+                RevokedToken.expires_at > datetime.utcnow(),
+            )
+        ).all()
+        self._revoked = dict(rows)
+
+
+def _revocations():
+    return current_app.extensions.setdefault("token_revocations", RevocationList())
+
+
+def _serializer(token_type):
+    return URLSafeTimedSerializer(
+        current_app.config["SECRET_KEY"], salt=f"auth-{token_type}-token"
+    )
+
+
+def _ttl(token_type):
+    if token_type == ACCESS:
+        return current_app.config["AUTH_ACCESS_TOKEN_TTL"]
+    return current_app.config["AUTH_REFRESH_TOKEN_TTL"]
+
+
+def _load(token, token_type):
+    ttl = _ttl(token_type)
+    try:
+        claims, issued_at = _serializer(token_type).loads(
+            token, max_age=ttl, return_timestamp=True
+        )
+    except SignatureExpired:
+        raise InvalidTokenError("Token has expired")
+    except BadSignature:
+        raise InvalidTokenError("Invalid token")
+    claims["exp"] = issued_at.replace(tzinfo=None) + timedelta(seconds=ttl)
+    return claims
+
+
+def issue_tokens(user):
+    access_claims = {
+        "uid": user.id,
+        "role": user.role.value,
+        "mid": user.merchant_id,
+        "jti": uuid.uuid4().hex,
+    }
+    refresh_claims = {"uid": user.id, "jti": uuid.uuid4().hex}
+    return {
+        "access_token": _serializer(ACCESS).dumps(access_claims),
+        "refresh_token": _serializer(REFRESH).dumps(refresh_claims),
+        "token_type": "Bearer",
+        "expires_in": _ttl(ACCESS),
+    }
+
+
+def access_claims():
+    """Claims of the request's ``Authorization: Bearer`` token, or None.
+
+    Only the signature and age are checked here; the result is cached per request.
+    """
+    if "access_claims" not in g:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        claims = None
+        if scheme.lower() == "bearer" and token:
+            try:
+                claims = _load(token.strip(), ACCESS)
+            except InvalidTokenError:
+                pass
+        g.access_claims = claims
+    return g.access_claims
+
+
+def load_token_user():
+    claims = access_claims()
+    if claims is None:
+        return None
+    interval = current_app.config["AUTH_REVOCATION_SYNC_SECONDS"]
+    if _revocations().contains(claims["jti"], interval):
+        return None
+    return TokenUser(claims)
+
+
+def _revoke(claims, token_type):
+    """Record a token as revoked; False if it already was."""
+    inserted = db.session.execute(
+        insert(RevokedToken)
+        .values(
+            jti=claims["jti"],
+            token_type=token_type,
+            user_id=claims["uid"],
+            expires_at=claims["exp"],
+            revoked_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=["jti"])
+        .returning(RevokedToken.id)
+    ).first()
+    return inserted is not None
+
+
+def refresh_tokens(refresh_token):
+    """Swap a refresh token for a new token pair, revoking the one presented.
+
+    This is the only token path that reads the user row, so role or merchant
+    changes reach the claims here.
+    """
+    if not refresh_token:
+        raise InvalidTokenError("refresh_token is required")
+    claims = _load(refresh_token, REFRESH)
+    # The insert doubles as the check, so a token can be redeemed only once
+    if not _revoke(claims, REFRESH):
+        db.session.rollback()
+        raise InvalidTokenError("Token has been revoked")
+
+    user = db.session.get(User, claims["uid"])
+    if user is None:
+        db.session.rollback()
+        raise InvalidTokenError("Invalid token")
+    tokens = issue_tokens(user)
+    db.session.commit()
+    return tokens
+
+
+def revoke_tokens(token_user, refresh_token=None):
+    """Revoke the caller's access token and, if given, their refresh token."""
+    claims = {
+        "jti": token_user.token_id,
+        "uid": token_user.id,
+        "exp": token_user.token_expires_at,
+    }
+    _revoke(claims, ACCESS)
+    if refresh_token:
+        refresh_claims = _load(refresh_token, REFRESH)
+        if refresh_claims["uid"] != token_user.id:
+            db.session.rollback()
+            raise InvalidTokenError("Invalid token")
+        _revoke(refresh_claims, REFRESH)
+    db.session.commit()
+    _revocations().add(token_user.token_id, token_user.token_expires_at)
+
+
+def purge_expired_revocations(now=None):
+    result = db.session.execute(
+        db.delete(RevokedToken).where(
+            RevokedToken.expires_at <= (now or datetime.utcnow())
+        )
+    )
+    db.session.commit()
+    return result.rowcount
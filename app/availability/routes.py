@@ -0,0 +1,30 @@
+from flask import Blueprint, Response, jsonify, request
+
+from app.utils.decorators import not_batchable
+from app.utils.rate_limit import route_class
+from . import services
+from .services import StreamUnavailableError, ValidationError
+
+availability = Blueprint("availability", __name__)
+
+
+@availability.route("/stream", methods=["GET"])
+@not_batchable
+@route_class("long_poll")
+def stream_availability():
+    try:
+        query_params = request.args.to_dict()
+        subscription = services.subscribe(query_params)
+        response = Response(services.stream(subscription), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        # Tell nginx not to buffer the stream
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except StreamUnavailableError as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
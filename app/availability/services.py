@@ -0,0 +1,270 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import text
+
+from ..extensions import db
+from app.sharding.routing import shard_for_merchant
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "car_availability"
+# How often an idle listener checks that its connection is still alive
+LISTEN_PING_SECONDS = 30
+RECONNECT_DELAY_SECONDS = 1
+# How long EventSource clients wait before reconnecting after a stream ends
+CLIENT_RETRY_MILLISECONDS = 3000
+
+
+class AvailabilityError(Exception):
+    pass
+
+
+class ValidationError(AvailabilityError):
+    pass
+
+
+class StreamUnavailableError(AvailabilityError):
+    pass
+
+
+# Python versions of the query_cars filters, applied to to_dict() output
+MATCHERS = {
+    "make": lambda car, value: car["make"].lower() == value,
+    "model": lambda car, value: car["model"].lower() == value,
+    "year": lambda car, value: car["year"] == value,
+    "max_price": lambda car, value: Decimal(car["price_per_hour"]) <= value,
+    "min_price": lambda car, value: Decimal(car["price_per_hour"]) >= value,
+    "merchant_id": lambda car, value: car["merchant_id"] == value,
+}
+
+
+def matches(active, car):
+    return all(MATCHERS[name](car, value) for name, value in active.items())
+
+
+def notify_car_change(change, car, previous=None):
+    """Announce ``car``'s new state to stream subscribers when the caller commits.
+
+    ``previous`` holds the filtered fields before an update, so subscribers
+    whose filters the car just stopped matching hear about it too.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return
+    message = {"change": change, "car": car.to_dict()}
+    if previous:
+        message["previous"] = {**message["car"], **previous}
+    # NOTIFY is transactional: nothing is sent if the change rolls back
+    db.session.execute(
+        text("SELECT pg_notify(:channel, :message)"),
+        {"channel": CHANNEL, "message": json.dumps(message)},
+        bind_arguments={"shard_id": shard_for_merchant(car.merchant_id)},
+    )
+
+
+class Subscription:
+    def __init__(self, active, queue_size):
+        self.active = active
+        self.queue = queue.Queue(queue_size)
+        # Set when the client reads too slowly and changes were dropped
+        self.lagging = False
+
+    def wants(self, message):
+        previous = message.get("previous")
+        return matches(self.active, message["car"]) or (
+            previous is not None and matches(self.active, previous)
+        )
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.lagging = True
+
+
+class AvailabilityBroker:
+    """Fans car changes out to this worker's stream subscribers.
+
+    One listener thread per database receives the NOTIFY messages, so the
+    number of subscribers never changes the number of database connections.
+    Listeners start with the first subscriber, after gunicorn has forked.
+    """
+
+    def __init__(self, max_subscribers, queue_size):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.delivered = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+        self._listeners = []
+
+    def subscribe(self, active, engines):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise StreamUnavailableError("Too many open streams; try again later")
+            if not self._listeners:
+                self._start(engines)
+            subscription = Subscription(active, self.queue_size)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def wait_listening(self, timeout):
+        return self._listening.wait(timeout)
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.wants(message):
+                subscription.deliver(message)
+                self.delivered += 1
+
+    def _lag_everyone(self):
+        # Changes may have been missed, so every client must reload
+        with self._lock:
+            for subscription in self._subscribers:
+                subscription.lagging = True
+
+    def _start(self, engines):
+        ready = []
+        for engine in engines:
+            started = threading.Event()
+            ready.append(started)
+            listener = threading.Thread(
+                target=self._listen,
+                args=(engine, started),
+                name=f"availability-listener-{engine.url.database}",
+                daemon=True,
+            )
+            self._listeners.append(listener)
+            listener.start()
+
+        def mark_listening():
+            for started in ready:
+                started.wait()
+            self._listening.set()
+
+        threading.Thread(target=mark_listening, daemon=True).start()
+
+    def _listen(self, engine, started):
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                # A dedicated connection, taken out of the pool for good
+                connection = engine.raw_connection()
+                listener = connection.driver_connection
+                connection.detach()
+                listener.autocommit = True
+                listener.cursor().execute(f"LISTEN {CHANNEL}")
+                if reconnecting:
+                    self._lag_everyone()
+                started.set()
+                while True:
+                    readable, _, _ = select.select(
+                        [listener], [], [], LISTEN_PING_SECONDS
+                    )
+                    if not readable:
+                        listener.cursor().execute("SELECT 1")
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        self.publish(json.loads(listener.notifies.pop(0).payload))
+            except Exception:
+                logger.exception("Availability listener lost its connection")
+                reconnecting = True
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                time.sleep(RECONNECT_DELAY_SECONDS)
+
+    def stats(self):
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            "subscribers": subscribers,
+            "delivered": self.delivered,
+            "listening": self._listening.is_set(),
+        }
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def subscribe(query_params):
+    """Validate ``query_params`` like ``query_cars`` and open a subscription."""
+    from app.cars.services import AVAILABLE_CARS
+
+    try:
+        active = AVAILABLE_CARS.parse(query_params)
+    except AVAILABLE_CARS.error_class as e:
+        raise ValidationError(str(e))
+
+    broker = current_app.extensions["availability"]
+    postgres_engines = [
+        engine for engine in db.engines.values() if engine.dialect.name == "postgresql"
+    ]
+    if not postgres_engines:
+        raise StreamUnavailableError("Live availability needs PostgreSQL")
+    subscription = broker.subscribe(active, postgres_engines)
+    if not broker.wait_listening(current_app.config["AVAILABILITY_LISTEN_TIMEOUT"]):
+        broker.unsubscribe(subscription)
+        raise StreamUnavailableError("Live availability is starting; try again")
+    return subscription
+
+
+def stream(subscription):
+    """Server-sent events for ``subscription``, for ``AVAILABILITY_STREAM_SECONDS``.
+
+    ``ready`` comes first, once changes are being received; a client loads
+    its page after it. ``resync`` means changes were missed and the page must
+    be reloaded. The stream then ends and the client reconnects.
+    """
+    broker = current_app.extensions["availability"]
+    heartbeat_seconds = current_app.config["AVAILABILITY_HEARTBEAT_SECONDS"]
+    give_up_at = time.monotonic() + current_app.config["AVAILABILITY_STREAM_SECONDS"]
+
+    def events():
+        try:
+            yield f"retry: {CLIENT_RETRY_MILLISECONDS}\n" + _event("ready", {})
+            while True:
+                if subscription.lagging:
+                    yield _event("resync", {})
+                    return
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    message = subscription.queue.get(
+                        timeout=min(heartbeat_seconds, remaining)
+                    )
+                except queue.Empty:
+                    # Keeps proxies from closing the idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _event(message["change"], message["car"])
+        finally:
+            broker.unsubscribe(subscription)
+
+    return events()
+
+
+def init_availability(app):
+    app.extensions["availability"] = AvailabilityBroker(
+        app.config["AVAILABILITY_MAX_SUBSCRIBERS"],
+        app.config["AVAILABILITY_QUEUE_SIZE"],
+    )
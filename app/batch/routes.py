@@ -0,0 +1,20 @@
+from flask import Blueprint, jsonify, request
+
+from app.utils.rate_limit import route_class
+from . import services
+from .services import ValidationError
+
+batch = Blueprint("batch", __name__)
+
+
+@batch.route("", methods=["POST"])
+@route_class("expensive")
+def run_batch():
+    try:
+        data = request.get_json(silent=True)
+        responses = services.run_batch(data)
+        return jsonify({"responses": responses}), 200
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
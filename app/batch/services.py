@@ -0,0 +1,179 @@
+import io
+from urllib.parse import urlsplit
+
+from flask import current_app, g, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from app.extensions import db
+from app.utils.deadlines import remaining_time
+from app.utils.rate_limit import view_route_class
+
+FORWARDED_HEADERS = ("ETag", "Location", "Retry-After")
+# Meant for the batch request itself; a 304 or 206 cannot be batched
+CONDITIONAL_HEADERS = (
+    "HTTP_IF_MATCH",
+    "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE",
+    "HTTP_IF_UNMODIFIED_SINCE",
+    "HTTP_IF_RANGE",
+    "HTTP_RANGE",
+)
+
+
+class BatchError(Exception):
+    pass
+
+
+class ValidationError(BatchError):
+    pass
+
+
+class SubRequest:
+    def __init__(self, item_id, path, query_string):
+        self.id = item_id
+        self.path = path
+        self.query_string = query_string
+        self.cost = 0
+        self.result = None
+
+    def finish(self, status, body, headers=None):
+        self.result = {"id": self.id, "status": status, "body": body}
+        if headers:
+            self.result["headers"] = headers
+
+
+def parse_batch(data):
+    """Sub-requests from a ``{"requests": [{"path": ..., "id": ...}]}`` body."""
+    if not isinstance(data, dict) or not isinstance(data.get("requests"), list):
+        raise ValidationError("Body must be an object with a 'requests' list")
+    items = data["requests"]
+    if not items:
+        raise ValidationError("'requests' cannot be empty")
+    max_requests = current_app.config["BATCH_MAX_REQUESTS"]
+    if len(items) > max_requests:
+        raise ValidationError(f"At most {max_requests} requests can be batched")
+
+    sub_requests = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            raise ValidationError(f"Request {index} must be an object with a 'path'")
+        if str(item.get("method", "GET")).upper() != "GET":
+            raise ValidationError(f"Request {index}: only GET requests can be batched")
+        url = urlsplit(item["path"])
+        if url.scheme or url.netloc or not url.path.startswith("/"):
+            raise ValidationError(
+                f"Request {index}: path must start with '/', like '/cars/1'"
+            )
+        sub_requests.append(SubRequest(item.get("id", index), url.path, url.query))
+    return sub_requests
+
+
+def _price(sub_requests):
+    """Match every sub-request to its view and add up their costs.
+
+    Requests that match nothing or a view that cannot be batched finish
+    here with their error and cost nothing.
+    """
+    adapter = current_app.url_map.bind_to_environ(request.environ)
+    costs = current_app.config["BATCH_ROUTE_COSTS"]
+    for sub_request in sub_requests:
+        try:
+            endpoint, _ = adapter.match(sub_request.path, method="GET")
+        except RequestRedirect as e:
+            sub_request.finish(
+                308, {"error": "Moved permanently"}, {"Location": e.new_url}
+            )
+            continue
+        except HTTPException as e:
+            sub_request.finish(e.code, {"error": e.description})
+            continue
+        view = current_app.view_functions[endpoint]
+        limit_class = view_route_class(view, "GET")
+        if not getattr(view, "batchable", True) or limit_class not in costs:
+            sub_request.finish(400, {"error": "This route cannot be batched"})
+            continue
+        sub_request.cost = costs[limit_class]
+    return sum(sub_request.cost for sub_request in sub_requests)
+
+
+def _sub_environ(sub_request):
+    # The caller's headers, cookies and address, with a bodiless GET on top
+    environ = dict(request.environ)
+    environ.pop("werkzeug.request", None)
+    environ.pop("CONTENT_TYPE", None)
+    for name in CONDITIONAL_HEADERS:
+        environ.pop(name, None)
+    environ.update(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": sub_request.path,
+            "QUERY_STRING": sub_request.query_string,
+            "CONTENT_LENGTH": "0",
+            "wsgi.input": io.BytesIO(),
+        }
+    )
+    return environ
+
+
+def _dispatch(sub_request):
+    app = current_app._get_current_object()
+    # Same app context as the batch: g (with the loaded user), the deadline
+    # and the database session carry over. Only the view runs, not the
+    # per-request hooks the batch itself already went through.
+    with app.request_context(_sub_environ(sub_request)):
+        try:
+            response = app.make_response(app.dispatch_request())
+        except HTTPException as e:
+            # e.g. login_required's 401; answer in JSON like the views do
+            response = app.make_response((jsonify({"error": e.description}), e.code))
+        except Exception as e:
+            try:
+                response = app.make_response(app.handle_user_exception(e))
+            except Exception:
+                # No handler for it; fail this item, not the whole batch
+                current_app.logger.exception("Batched %s failed", sub_request.path)
+                response = app.make_response((jsonify({"error": str(e)}), 500))
+    if g.pop("deadline_exceeded", False):
+        sub_request.finish(504, {"error": "Request deadline exceeded"})
+    elif response.is_streamed or not response.is_json:
+        response.close()
+        sub_request.finish(406, {"error": "Only JSON responses can be batched"})
+    else:
+        headers = {
+            name: response.headers[name]
+            for name in FORWARDED_HEADERS
+            if name in response.headers
+        }
+        sub_request.finish(response.status_code, response.get_json(), headers)
+
+    if sub_request.result["status"] >= 500:
+        # Leave no failed transaction behind for the next sub-request
+        db.session.rollback()
+
+
+def run_batch(data):
+    """Run GET sub-requests in this request, in order, with per-item results.
+
+    The caller is authenticated once, by this request; each sub-request's
+    view still checks roles as usual. Costs come from ``BATCH_ROUTE_COSTS``
+    per rate-limit class, and the batch is refused over ``BATCH_MAX_COST``.
+    """
+    sub_requests = parse_batch(data)
+    total_cost = _price(sub_requests)
+    max_cost = current_app.config["BATCH_MAX_COST"]
+    if total_cost > max_cost:
+        raise ValidationError(f"Batch costs {total_cost}; the limit is {max_cost}")
+
+    # Load the user now so every sub-request finds it in g
+    current_user._get_current_object()
+    for sub_request in sub_requests:
+        if sub_request.result is not None:
+            continue
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            sub_request.finish(504, {"error": "Request deadline exceeded"})
+            continue
+        _dispatch(sub_request)
+    return [sub_request.result for sub_request in sub_requests]
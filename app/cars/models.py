@@ -9,6 +9,20 @@ class CarStatus(enum.Enum):
 
 class Car(db.Model):
     __tablename__ = "cars"
+    __table_args__ = (
+        db.Index("ix_cars_merchant_id_id", "merchant_id", "id"),
+        db.Index("ix_cars_lower_make", db.text("lower(make)")),
+        # Sorted listings read these in order instead of sorting
+        db.Index("ix_cars_status_price_per_hour_id", "status", "price_per_hour", "id"),
+        db.Index("ix_cars_status_year_id", "status", "year", "id"),
+        db.Index(
+            "ix_cars_merchant_id_price_per_hour_id",
+            "merchant_id",
+            "price_per_hour",
+            "id",
+        ),
+        db.Index("ix_cars_merchant_id_year_id", "merchant_id", "year", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     make = db.Column(db.String(50), nullable=False)
@@ -17,10 +31,16 @@ class Car(db.Model):
     status = db.Column(db.Enum(CarStatus), nullable=False, default=CarStatus.AVAILABLE)
     price_per_hour = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
 
+    # Bumped by every write; flushes and If-Match updates only apply to the
+    # version they read, so concurrent writers cannot overwrite each other
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
     merchant_id = db.Column(db.Integer, db.ForeignKey("merchants.id"), nullable=False)
     merchant = db.relationship("Merchant", back_populates="cars")
     rentals = db.relationship("Rental", back_populates="car", lazy="dynamic")
 
+    __mapper_args__ = {"version_id_col": version}
+
     def __repr__(self):
         return f"<Car {self.year} {self.make} {self.model}>"
 
@@ -33,4 +53,5 @@ class Car(db.Model):
             "status": self.status.value,
             "price_per_hour": str(self.price_per_hour),
             "merchant_id": self.merchant_id,
+            "version": self.version,
         }
@@ -1,24 +1,52 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 
-from app.utils.decorators import role_required
+from app.utils.decorators import not_batchable, role_required
+from app.utils.rate_limit import route_class
+from app.utils.compression import cache_compressed
+from app.utils.idempotency import idempotent
 from app.auth.models import UserRole
+from app.exports.routes import export_response
+from app.exports.services import ExportError
 from . import services
-from .services import CarNotFoundError, ValidationError
-
+from .services import (
+    CarConflictError,
+    CarNotFoundError,
+    CarVersionMismatchError,
+    ValidationError,
+)
 
 cars = Blueprint("cars", __name__)
 
 
+def _car_response(car, status):
+    # The version is the car's entity tag, for If-Match on later updates
+    response = jsonify(car.to_dict())
+    response.set_etag(str(car.version))
+    return response, status
+
+
+def _if_match_versions():
+    """Versions named by ``If-Match``; ``None`` when absent or ``*``.
+
+    Weak or non-numeric tags never match, as If-Match compares strongly.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    return [int(tag) for tag in if_match.as_set() if tag.isdigit()]
+
+
 @cars.route("/create", methods=["POST"])
 @login_required
 @role_required(UserRole.MERCHANT)
+@idempotent
 def create_car():
     try:
         data = request.get_json()
-        merchant_id = current_user.merchant_profile.id
+        merchant_id = current_user.merchant_id
         new_car = services.create_car(data, merchant_id)
-        return jsonify(new_car.to_dict()), 201
+        return _car_response(new_car, 201)
     except ValidationError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
@@ -26,11 +54,12 @@ def create_car():
 
 
 @cars.route("/my-cars", methods=["GET"])
+@route_class("expensive")
 @login_required
 @role_required(UserRole.MERCHANT)
 def get_merchant_cars():
     try:
-        merchant_id = current_user.merchant_profile.id
+        merchant_id = current_user.merchant_id
         cars = services.get_merchant_cars(merchant_id)
         return jsonify([car.to_dict() for car in cars]), 200
     except CarNotFoundError as e:
@@ -39,19 +68,38 @@ def get_merchant_cars():
         return jsonify({"error": str(e)}), 500
 
 
+@cars.route("/my-cars/export", methods=["GET"])
+@not_batchable
+@route_class("expensive")
+@login_required
+@role_required(UserRole.MERCHANT)
+def export_merchant_cars():
+    try:
+        merchant_id = current_user.merchant_id
+        return export_response("merchant_cars", merchant_id=merchant_id)
+    except (ValidationError, ExportError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @cars.route("/<int:car_id>", methods=["PUT"])
 @login_required
 @role_required(UserRole.MERCHANT)
 def update_merchant_car(car_id):
     try:
         data = request.get_json()
-        merchant_id = current_user.merchant_profile.id
-        updated_car = services.update_car(car_id, data, merchant_id)
-        return jsonify(updated_car.to_dict()), 200
+        merchant_id = current_user.merchant_id
+        updated_car = services.update_car(
+            car_id, data, merchant_id, _if_match_versions()
+        )
+        return _car_response(updated_car, 200)
     except ValidationError as e:
         return jsonify({"error": str(e)}), 400
     except CarNotFoundError as e:
         return jsonify({"error": str(e)}), 404
+    except CarVersionMismatchError as e:
+        return jsonify({"error": str(e)}), 412, {"ETag": f'"{e.current_version}"'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -61,29 +109,56 @@ def update_merchant_car(car_id):
 @role_required(UserRole.MERCHANT)
 def delete_merchant_car(car_id):
     try:
-        merchant_id = current_user.merchant_profile.id
+        merchant_id = current_user.merchant_id
         result = services.delete_car(car_id, merchant_id)
         return jsonify(result)
     except ValidationError as e:
         return jsonify({"error": str(e)}), 400
     except CarNotFoundError as e:
         return jsonify({"error": str(e)}), 404
+    except CarConflictError as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @cars.route("/<int:car_id>", methods=["GET"])
+@cache_compressed
 def get_single_car(car_id):
     try:
         car = services.get_car(car_id)
-        return jsonify(car.to_dict()), 200
+        return _car_response(car, 200)
     except CarNotFoundError as e:
         return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@cars.route("/batch", methods=["GET", "POST"])
+@cache_compressed
+def get_cars_batch():
+    try:
+        if request.method == "POST":
+            data = request.get_json() or {}
+            car_ids = data.get("ids")
+        else:
+            car_ids = request.args.get("ids", "")
+        cars, missing_ids = services.get_cars_by_ids(car_ids)
+        return (
+            jsonify(
+                {"cars": [car.to_dict() for car in cars], "missing_ids": missing_ids}
+            ),
+            200,
+        )
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @cars.route("/", methods=["GET"])
+@route_class("expensive")
+@cache_compressed
 def get_all_cars():
     try:
         cars = services.get_all_cars()
@@ -95,6 +170,8 @@ def get_all_cars():
 
 
 @cars.route("/query-cars", methods=["GET"])
+@route_class("expensive")
+@cache_compressed
 def query_cars():
     try:
         query_params = request.args.to_dict()
@@ -117,11 +194,12 @@ def query_cars():
 
 
 @cars.route("/query-merchant-cars", methods=["GET"])
+@route_class("expensive")
 @login_required
 @role_required(UserRole.MERCHANT)
 def query_merchant_cars():
     try:
-        merchant_id = current_user.merchant_profile.id
+        merchant_id = current_user.merchant_id
         query_params = request.args.to_dict()
         pagination_obj = services.query_merchant_cars(merchant_id, query_params)
         cars_list = [car.to_dict() for car in pagination_obj.items]
@@ -1,7 +1,15 @@
 from decimal import Decimal, InvalidOperation
 from ..extensions import db
 from .models import Car, CarStatus
-from sqlalchemy import func
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.exc import StaleDataError
+from app.availability.services import notify_car_change
+from app.events.services import record_event
+from app.exports.services import ExportSource
+from app.sharding.routing import merchant_shard
+from app.sharding.services import guard_merchant_writes, scatter
+from app.utils.filters import Filter, FilterSpec, lowered, param, sort_options
 
 
 class CarError(Exception):
@@ -16,6 +24,16 @@ class ValidationError(CarError):
     pass
 
 
+class CarConflictError(CarError):
+    pass
+
+
+class CarVersionMismatchError(CarError):
+    def __init__(self, message, current_version):
+        super().__init__(message)
+        self.current_version = current_version
+
+
 def create_car(data, merchant_id):
     if not data:
         raise ValidationError("Request body cannot be empty")
@@ -52,77 +70,142 @@ def create_car(data, merchant_id):
         merchant_id=merchant_id,
     )
 
-    db.session.add(new_car)
-    db.session.commit()
+    with merchant_shard(merchant_id):
+        guard_merchant_writes(merchant_id)
+        db.session.add(new_car)
+        db.session.flush()
+        record_event("car.created", merchant_id, new_car.id, new_car.to_dict())
+        notify_car_change("created", new_car)
+        db.session.commit()
     return new_car
 
 
 def get_merchant_cars(merchant_id):
-    cars = Car.query.filter_by(merchant_id=int(merchant_id)).all()
+    with merchant_shard(merchant_id):
+        cars = Car.query.filter_by(merchant_id=int(merchant_id)).all()
     if not cars:
         raise CarNotFoundError("Merchant has no cars to list")
     return cars
 
 
-def update_car(car_id, data, merchant_id):
-    if not data:
-        raise ValidationError("Request body cannot be empty")
-
-    car = Car.query.filter_by(id=int(car_id), merchant_id=int(merchant_id)).first()
-    if not car:
-        raise CarNotFoundError("Car not found")
-
-    try:
-        if "make" in data:
-            car.make = data.get("make")
-        if "model" in data:
-            car.model = data.get("model")
-        if "year" in data:
+def _car_changes(data):
+    """Validated column values for the fields present in ``data``."""
+    changes = {}
+    if "make" in data:
+        changes["make"] = data.get("make")
+    if "model" in data:
+        changes["model"] = data.get("model")
+    if "year" in data:
+        try:
+            year = int(data.get("year"))
+        except (TypeError, ValueError):
+            raise ValidationError("Year must be a valid integer")
+        if year <= 0:
+            raise ValidationError("Year must be a positive integer")
+        changes["year"] = year
+    if "price_per_hour" in data:
+        try:
+            price_per_hour = Decimal(str(data.get("price_per_hour")))
+        except (TypeError, InvalidOperation):
+            raise ValidationError("Price per hour must be a valid decimal number")
+        if price_per_hour < 0:
+            raise ValidationError("Price per hour cannot be negative")
+        changes["price_per_hour"] = price_per_hour
+    if "status" in data:
+        new_status = data.get("status")
+        if isinstance(new_status, CarStatus):
+            changes["status"] = new_status
+        else:
+            if not isinstance(new_status, str):
+                raise ValidationError("Status must be a string or CarStatus enum")
             try:
-                year = int(data.get("year"))
-            except (TypeError, ValueError):
-                raise ValidationError("Year must be a valid integer")
-            if year <= 0:
-                raise ValidationError("Year must be a positive integer")
-            car.year = year
-        if "price_per_hour" in data:
-            try:
-                price_per_hour = Decimal(str(data.get("price_per_hour")))
-            except (TypeError, InvalidOperation):
-                raise ValidationError("Price per hour must be a valid decimal number")
-            if price_per_hour < 0:
-                raise ValidationError("Price per hour cannot be negative")
-            car.price_per_hour = price_per_hour
-        if "status" in data:
-            new_status = data.get("status")
-            if isinstance(new_status, CarStatus):
-                car.status = new_status
-            else:
-                if not isinstance(new_status, str):
-                    raise ValidationError("Status must be a string or CarStatus enum")
-                try:
-                    car.status = CarStatus(new_status.lower())
-                except ValueError:
-                    raise ValidationError("Invalid status value")
+                changes["status"] = CarStatus(new_status.lower())
+            except ValueError:
+                raise ValidationError("Invalid status value")
+    return changes
 
-        db.session.commit()
-        return car
 
-    except (ValueError, TypeError, InvalidOperation) as e:
-        db.session.rollback()
-        raise ValidationError(f"Invalid data format: {e}")
-    except Exception as e:
-        db.session.rollback()
-        raise Exception(str(e))
+def update_car(car_id, data, merchant_id, expected_versions=None):
+    """Apply ``data`` to a merchant's car with a single conditional UPDATE.
+
+    With ``expected_versions`` (from ``If-Match``) the car only changes while
+    its version is one of them. Without it, only the given fields are set, so
+    a concurrent rental's status change is never written back over.
+    """
+    if not data:
+        raise ValidationError("Request body cannot be empty")
+    changes = _car_changes(data)
+
+    owned = [Car.id == int(car_id), Car.merchant_id == int(merchant_id)]
+    # Joining the row to itself returns its values from before the update
+    before = aliased(Car)
+    matching = [Car.id == before.id, *owned]
+    if expected_versions is not None:
+        matching.append(Car.version.in_(expected_versions))
+
+    with merchant_shard(merchant_id):
+        guard_merchant_writes(merchant_id)
+        try:
+            row = db.session.execute(
+                update(Car)
+                .where(*matching)
+                .values(**changes, version=Car.version + 1)
+                .returning(
+                    Car, before.make, before.model, before.year, before.price_per_hour
+                ),
+                execution_options={
+                    "synchronize_session": False,
+                    "populate_existing": True,
+                },
+            ).first()
+            if row is None:
+                current_version = db.session.execute(
+                    select(Car.version).where(*owned)
+                ).scalar()
+                db.session.rollback()
+                if current_version is None:
+                    raise CarNotFoundError("Car not found")
+                raise CarVersionMismatchError(
+                    "Car was changed since it was read", current_version
+                )
+            car, make, model, year, price_per_hour = row
+            record_event("car.updated", car.merchant_id, car.id, car.to_dict())
+            notify_car_change(
+                "updated",
+                car,
+                previous={
+                    "make": make,
+                    "model": model,
+                    "year": year,
+                    "price_per_hour": str(price_per_hour),
+                },
+            )
+            db.session.commit()
+            return car
+        except CarError:
+            raise
+        except Exception as e:
+            db.session.rollback()
+            raise Exception(str(e))
 
 
 def delete_car(car_id, merchant_id):
-    car = Car.query.filter_by(id=int(car_id), merchant_id=int(merchant_id)).first()
-    if not car:
-        raise CarNotFoundError("Car not found")
+    with merchant_shard(merchant_id):
+        car = Car.query.filter_by(id=int(car_id), merchant_id=int(merchant_id)).first()
+        if not car:
+            raise CarNotFoundError("Car not found")
+        guard_merchant_writes(merchant_id)
     if car.status == CarStatus.RENTED:
         raise ValidationError("Cannot delete a car that is currently rented")
     db.session.delete(car)
+    try:
+        db.session.flush()
+    except StaleDataError:
+        # Rented or edited since it was read; the DELETE matched no row
+        db.session.rollback()
+        raise CarConflictError("Car was changed by another request; try again")
+    record_event("car.deleted", car.merchant_id, car.id, {"id": car.id})
+    notify_car_change("deleted", car)
     db.session.commit()
     return {"message": "Successfully deleted"}
 
@@ -134,112 +217,117 @@ def get_car(car_id):
     return car
 
 
+MAX_BATCH_CARS = 100
+# Raw ids, duplicates included, looked at before the exact limit is applied
+MAX_BATCH_RAW_IDS = MAX_BATCH_CARS * 4
+
+
+def get_cars_by_ids(car_ids):
+    too_many = f"At most {MAX_BATCH_CARS} cars can be fetched at once"
+    if isinstance(car_ids, str):
+        # Split no further than needed to tell that there are too many
+        car_ids = car_ids.split(",", MAX_BATCH_RAW_IDS)
+        if len(car_ids) > MAX_BATCH_RAW_IDS:
+            raise ValidationError(too_many)
+        car_ids = [car_id for car_id in car_ids if car_id.strip()]
+    if not isinstance(car_ids, list) or not car_ids:
+        raise ValidationError("ids must be a non-empty list of car ids")
+    if len(car_ids) > MAX_BATCH_RAW_IDS:
+        raise ValidationError(too_many)
+
+    try:
+        car_ids = list(dict.fromkeys(int(car_id) for car_id in car_ids))
+    except (TypeError, ValueError):
+        raise ValidationError("ids must be integers")
+    if len(car_ids) > MAX_BATCH_CARS:
+        raise ValidationError(too_many)
+
+    cars_by_id = {car.id: car for car in Car.query.filter(Car.id.in_(car_ids))}
+    cars = [cars_by_id[car_id] for car_id in car_ids if car_id in cars_by_id]
+    missing_ids = [car_id for car_id in car_ids if car_id not in cars_by_id]
+    return cars, missing_ids
+
+
 def get_all_cars():
-    cars = Car.query.all()
+    cars = scatter(db.select(Car).order_by(Car.id), Car.__mapper__, [Car.id])
     if not cars:
         raise CarNotFoundError("No car to display")
     return cars
 
 
-def query_cars(query_params):
-    query = Car.query.filter_by(status=CarStatus.AVAILABLE)
-
-    try:
-        page_number = int(query_params.get("page", 1))
-        per_page = int(query_params.get("per_page", 10))
-    except ValueError:
-        raise ValidationError("Invalid page or per_page parameter. Must be an integer")
-    if page_number < 1:
-        raise ValidationError("Page number must be 1 or greater.")
-    if per_page < 1:
-        raise ValidationError("Per_page must be 1 or greater.")
+CAR_FILTERS = [
+    Filter("make", param("make", lowered), lambda v: func.lower(Car.make) == v),
+    Filter("model", param("model", lowered), lambda v: func.lower(Car.model) == v),
+    Filter("year", param("year", int), lambda v: Car.year == v),
+    Filter("max_price", param("max_price", Decimal), lambda v: Car.price_per_hour <= v),
+    Filter("min_price", param("min_price", Decimal), lambda v: Car.price_per_hour >= v),
+]
+
+# Each is served by a (status or merchant_id, column, id) index with no sort step
+CAR_SORTS = {
+    **sort_options(Car.id, Car.price_per_hour, Car.year),
+    "id": (Car.id,),
+}
+
+AVAILABLE_CARS = FilterSpec(
+    "query_cars",
+    Car,
+    CAR_FILTERS
+    + [
+        Filter(
+            "merchant_id",
+            param("merchant_id", int),
+            lambda v: Car.merchant_id == v,
+        )
+    ],
+    ValidationError,
+    scope=[("status", lambda v: Car.status == v)],
+    sorts=CAR_SORTS,
+    coalesce=True,
+)
+
+MERCHANT_CARS = FilterSpec(
+    "query_merchant_cars",
+    Car,
+    [
+        Filter(
+            "status",
+            param("status", lowered),
+            choices={
+                "available": Car.status == CarStatus.AVAILABLE,
+                "rented": Car.status == CarStatus.RENTED,
+            },
+        )
+    ]
+    + CAR_FILTERS,
+    ValidationError,
+    scope=[("merchant_id", lambda v: Car.merchant_id == v)],
+    sorts=CAR_SORTS,
+)
+
+MERCHANT_CARS_EXPORT = ExportSource(
+    "merchant_cars",
+    MERCHANT_CARS,
+    [Car.id, Car.make, Car.model, Car.year, Car.status, Car.price_per_hour],
+)
 
-    try:
-        if "make" in query_params and query_params.get("make"):
-            query = query.filter(
-                func.lower(Car.make) == query_params.get("make").lower()
-            )
-        if "model" in query_params and query_params.get("model"):
-            query = query.filter(
-                func.lower(Car.model) == query_params.get("model").lower()
-            )
-        if "year" in query_params and query_params.get("year"):
-            query = query.filter(Car.year == int(query_params.get("year")))
-        if "max_price" in query_params and query_params.get("max_price"):
-            max_price = Decimal(query_params.get("max_price"))
-            query = query.filter(Car.price_per_hour <= max_price)
-        if "min_price" in query_params and query_params.get("min_price"):
-            min_price = Decimal(query_params.get("min_price"))
-            query = query.filter(Car.price_per_hour >= min_price)
-        if "merchant_id" in query_params and query_params.get("merchant_id"):
-            query = query.filter(
-                Car.merchant_id == int(query_params.get("merchant_id"))
-            )
-    except (ValueError, TypeError, InvalidOperation) as e:
-        raise ValidationError(f"Invalid filter data type {e}")
 
-    paginated_cars = query.paginate(
-        page=page_number, per_page=per_page, error_out=False
-    )
+def query_cars(query_params):
+    paginated_cars = AVAILABLE_CARS.paginate(query_params, status=CarStatus.AVAILABLE)
 
-    if not paginated_cars.items and page_number == 1:
+    if not paginated_cars.items and paginated_cars.page == 1:
         raise CarNotFoundError("No cars found matching your criteria")
 
     return paginated_cars
 
 
 def query_merchant_cars(merchant_id, query_params):
-    query = Car.query.filter_by(merchant_id=merchant_id)
-
-    try:
-        page_number = int(query_params.get("page", 1))
-        per_page = int(query_params.get("per_page", 10))
-    except ValueError:
-        raise ValidationError("Invalid page or per_page parameter. Must be an integer.")
-
-    if page_number < 1:
-        raise ValidationError("Page number must be 1 or greater.")
-    if per_page < 1:
-        raise ValidationError("Per_page must be 1 or greater.")
-
-    try:
-        if "status" in query_params and query_params.get("status"):
-            car_status = query_params.get("status").lower()
-            if car_status == "available":
-                query = query.filter(Car.status == CarStatus.AVAILABLE)
-            elif car_status == "rented":
-                query = query.filter(Car.status == CarStatus.RENTED)
-            else:
-                raise ValidationError(
-                    f"Invalid status value '{query_params.get('status')}'. "
-                    "Must be 'available' or 'rented'."
-                )
-
-        if "make" in query_params and query_params.get("make"):
-            query = query.filter(
-                func.lower(Car.make) == query_params.get("make").lower()
-            )
-        if "model" in query_params and query_params.get("model"):
-            query = query.filter(
-                func.lower(Car.model) == query_params.get("model").lower()
-            )
-        if "year" in query_params and query_params.get("year"):
-            query = query.filter(Car.year == int(query_params.get("year")))
-        if "max_price" in query_params and query_params.get("max_price"):
-            max_price = Decimal(query_params.get("max_price"))
-            query = query.filter(Car.price_per_hour <= max_price)
-        if "min_price" in query_params and query_params.get("min_price"):
-            min_price = Decimal(query_params.get("min_price"))
-            query = query.filter(Car.price_per_hour >= min_price)
-
-    except (ValueError, TypeError, InvalidOperation) as e:
-        raise ValidationError(f"Invalid filter data type: {e}")
-
-    paginated_cars = query.paginate(
-        page=page_number, per_page=per_page, error_out=False
-    )
+    with merchant_shard(merchant_id):
+        paginated_cars = MERCHANT_CARS.paginate(
+            query_params, merchant_id=int(merchant_id)
+        )
 
-    if not paginated_cars.items and page_number == 1:
+    if not paginated_cars.items and paginated_cars.page == 1:
         raise CarNotFoundError("No cars found in your listings")
 
     return paginated_cars
@@ -5,7 +5,165 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, "..", ".env"))
 
 
+def _async_workers():
+    return os.environ.get("GUNICORN_WORKER_CLASS", "sync") in ("gevent", "eventlet")
+
+
+def _default_long_poll_concurrency():
+    # A waiting long poll or open stream holds a sync worker thread, so those
+    # may spend at most half of their threads on it; async workers park cheaply
+    if _async_workers():
+        return 1000
+    workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+    threads = int(os.environ.get("GUNICORN_THREADS", 1))
+    return max(1, workers * threads // 2)
+
+
+def _default_max_subscribers():
+    if _async_workers():
+        return 10000
+    return max(1, int(os.environ.get("GUNICORN_THREADS", 1)) // 2)
+
+
 class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_pre_ping": True,
+    }
+    DB_POOL_WARM_SIZE = int(os.environ.get("DB_POOL_WARM_SIZE", 2))
+    IMPORT_TIME_BUDGET_MS = int(os.environ.get("IMPORT_TIME_BUDGET_MS", 1500))
     SECRET_KEY = os.environ.get("SECRET_KEY")
+    RENTAL_PARTITION_MONTHS_AHEAD = int(
+        os.environ.get("RENTAL_PARTITION_MONTHS_AHEAD", 3)
+    )
+    RENTAL_ARCHIVE_AFTER_MONTHS = int(os.environ.get("RENTAL_ARCHIVE_AFTER_MONTHS", 24))
+    RENTAL_ARCHIVE_DIR = os.environ.get(
+        "RENTAL_ARCHIVE_DIR", os.path.join(basedir, "..", "archive", "rentals")
+    )
+    COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") == "1"
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+    COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 6))
+    COMPRESSION_CACHE_MAX_BYTES = int(
+        os.environ.get("COMPRESSION_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+    )
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+    IDEMPOTENCY_IN_PROGRESS_TIMEOUT = int(
+        os.environ.get("IDEMPOTENCY_IN_PROGRESS_TIMEOUT", 60)
+    )
+    # Proxies in front of the app that append to X-Forwarded-For; 0 trusts none
+    TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+    RATE_LIMIT_STORAGE_URL = os.environ.get(
+        "RATE_LIMIT_STORAGE_URL", "sqlite:////tmp/car-rental-rate-limit.db"
+    )
+    # (tokens per second, burst) per client for each route class
+    RATE_LIMITS = {
+        "default": (20.0, 40),
+        "write": (5.0, 10),
+        "expensive": (float(os.environ.get("RATE_LIMIT_EXPENSIVE_PER_SECOND", 5)), 10),
+        "long_poll": (2.0, 5),
+    }
+    MAX_CONCURRENCY = {
+        "expensive": int(os.environ.get("EXPENSIVE_MAX_CONCURRENCY", 8)),
+        "long_poll": int(
+            os.environ.get(
+                "LONG_POLL_MAX_CONCURRENCY", _default_long_poll_concurrency()
+            )
+        ),
+    }
+    CONCURRENCY_SLOT_TTL = int(os.environ.get("CONCURRENCY_SLOT_TTL", 30))
+    # Seconds a request may spend, per route class, before its SQL is cancelled
+    REQUEST_TIME_BUDGETS = {
+        "default": float(os.environ.get("REQUEST_TIME_BUDGET", 5)),
+        "write": float(os.environ.get("REQUEST_TIME_BUDGET", 5)),
+        "expensive": float(os.environ.get("EXPENSIVE_REQUEST_TIME_BUDGET", 15)),
+        "long_poll": 35.0,
+    }
+    # Shared secret for the /stats/* endpoints; unset hides them
+    STATS_TOKEN = os.environ.get("STATS_TOKEN", "")
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+    JOB_RETRY_BASE_SECONDS = float(os.environ.get("JOB_RETRY_BASE_SECONDS", 10))
+    JOB_RETRY_MAX_SECONDS = float(os.environ.get("JOB_RETRY_MAX_SECONDS", 3600))
+    JOB_LOCK_TIMEOUT = int(os.environ.get("JOB_LOCK_TIMEOUT", 600))
+    # Must stay well below JOB_LOCK_TIMEOUT, or live jobs look abandoned
+    JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", 30))
+    JOB_WORKER_PROCESSES = int(os.environ.get("JOB_WORKER_PROCESSES", 1))
+    JOB_WORKER_THREADS = int(os.environ.get("JOB_WORKER_THREADS", 4))
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+    EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(basedir, "..", "exports"))
+    EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
+    # Background export files are deleted this long after they are written
+    EXPORT_RETENTION_SECONDS = int(os.environ.get("EXPORT_RETENTION_SECONDS", 86400))
+    AUTH_ACCESS_TOKEN_TTL = int(os.environ.get("AUTH_ACCESS_TOKEN_TTL", 900))
+    AUTH_REFRESH_TOKEN_TTL = int(os.environ.get("AUTH_REFRESH_TOKEN_TTL", 14 * 86400))
+    AUTH_REVOCATION_SYNC_SECONDS = float(
+        os.environ.get("AUTH_REVOCATION_SYNC_SECONDS", 5)
+    )
+    UTILIZATION_CACHE_SECONDS = float(os.environ.get("UTILIZATION_CACHE_SECONDS", 300))
+    UTILIZATION_CACHE_MAX_ENTRIES = int(
+        os.environ.get("UTILIZATION_CACHE_MAX_ENTRIES", 256)
+    )
+    REPRICING_WINDOW_HOURS = float(os.environ.get("REPRICING_WINDOW_HOURS", 168))
+    REPRICING_BATCH_SIZE = int(os.environ.get("REPRICING_BATCH_SIZE", 1000))
+    # Append anonymized request traces here for `flask traffic replay`; empty disables
+    TRAFFIC_CAPTURE_PATH = os.environ.get("TRAFFIC_CAPTURE_PATH", "")
+    TRAFFIC_CAPTURE_SAMPLE_RATE = float(
+        os.environ.get("TRAFFIC_CAPTURE_SAMPLE_RATE", 1.0)
+    )
+    PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+    PROFILING_SECRET = os.environ.get("PROFILING_SECRET", "")
+    PROFILING_TOKEN_MAX_AGE = int(os.environ.get("PROFILING_TOKEN_MAX_AGE", 3600))
+    PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+    # "auto" uses pyinstrument when it is installed, otherwise cProfile
+    PROFILER = os.environ.get("PROFILER", "auto")
+    PROFILING_DIR = os.environ.get(
+        "PROFILING_DIR", os.path.join(basedir, "..", "profiles")
+    )
+    PROFILING_MAX_PROFILES = int(os.environ.get("PROFILING_MAX_PROFILES", 200))
+    BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", 20))
+    BATCH_MAX_COST = int(os.environ.get("BATCH_MAX_COST", 30))
+    # What one sub-request of each rate-limit class costs; other classes
+    # (writes, long polls) cannot be batched
+    BATCH_ROUTE_COSTS = {"default": 1, "expensive": 5}
+    COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "1") == "1"
+    # Share in-flight catalog queries across workers too, e.g.
+    # "sqlite:////tmp/car-rental-flights.db"; empty keeps them per worker
+    COALESCE_STORAGE_URL = os.environ.get("COALESCE_STORAGE_URL", "")
+    COALESCE_WAIT_SECONDS = float(os.environ.get("COALESCE_WAIT_SECONDS", 5))
+    # Live availability streams held open by each worker
+    AVAILABILITY_MAX_SUBSCRIBERS = int(
+        os.environ.get("AVAILABILITY_MAX_SUBSCRIBERS", _default_max_subscribers())
+    )
+    # Changes buffered per stream before a slow client is told to resync
+    AVAILABILITY_QUEUE_SIZE = int(os.environ.get("AVAILABILITY_QUEUE_SIZE", 100))
+    AVAILABILITY_HEARTBEAT_SECONDS = float(
+        os.environ.get("AVAILABILITY_HEARTBEAT_SECONDS", 15)
+    )
+    # Streams end after this long; EventSource clients reconnect on their own
+    AVAILABILITY_STREAM_SECONDS = float(
+        os.environ.get("AVAILABILITY_STREAM_SECONDS", 300)
+    )
+    AVAILABILITY_LISTEN_TIMEOUT = float(
+        os.environ.get("AVAILABILITY_LISTEN_TIMEOUT", 5)
+    )
+    PLAN_SNAPSHOT_DIR = os.environ.get(
+        "PLAN_SNAPSHOT_DIR", os.path.join(basedir, "..", "query_plans")
+    )
+    # Tables with at least this many rows must not be scanned in full
+    PLAN_LARGE_TABLE_ROWS = int(os.environ.get("PLAN_LARGE_TABLE_ROWS", 10000))
+    # How far cost and row estimates may grow past the approved plan
+    PLAN_COST_TOLERANCE = float(os.environ.get("PLAN_COST_TOLERANCE", 2.0))
+    PLAN_ROWS_TOLERANCE = float(os.environ.get("PLAN_ROWS_TOLERANCE", 4.0))
+    PLAN_MIN_COST_BUDGET = float(os.environ.get("PLAN_MIN_COST_BUDGET", 100))
+    PLAN_MIN_ROWS_BUDGET = int(os.environ.get("PLAN_MIN_ROWS_BUDGET", 100))
+    # Extra shard databases, e.g. "shard1=postgresql://...,shard2=postgresql://..."
+    SQLALCHEMY_BINDS = dict(
+        entry.strip().split("=", 1)
+        for entry in os.environ.get("DATABASE_SHARDS", "").split(",")
+        if entry.strip()
+    )
+    SHARD_MAP_REFRESH_SECONDS = float(os.environ.get("SHARD_MAP_REFRESH_SECONDS", 30))
+    SHARD_ID_STRIDE = int(os.environ.get("SHARD_ID_STRIDE", 16))
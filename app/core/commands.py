@@ -0,0 +1,31 @@
+import sys
+
+import click
+from flask import current_app
+
+from app.utils.idempotency import purge_expired_keys
+from app.warmup import measure_import_time
+from .routes import core
+
+
+@core.cli.command("purge-idempotency-keys")
+def purge_idempotency_keys_command():
+    """Delete idempotency keys whose replay window has expired."""
+    deleted = purge_expired_keys()
+    click.echo(f"Deleted {deleted} expired idempotency keys")
+
+
+@core.cli.command("import-time")
+@click.option("--budget-ms", type=int, default=None)
+@click.option("--top", type=int, default=15)
+def import_time_command(budget_ms, top):
+    """Report start-up import cost and fail if it exceeds the budget."""
+    if budget_ms is None:
+        budget_ms = current_app.config["IMPORT_TIME_BUDGET_MS"]
+    total, top_level = measure_import_time()
+    for cumulative, name in top_level[:top]:
+        click.echo(f"{cumulative / 1000:9.1f} ms  {name}")
+    click.echo(f"{total / 1000:9.1f} ms  total (budget {budget_ms} ms)")
+    if total / 1000 > budget_ms:
+        click.echo("Import time budget exceeded", err=True)
+        sys.exit(1)
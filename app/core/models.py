@@ -0,0 +1,24 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (db.UniqueConstraint("user_id", "key"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_method = db.Column(db.String(10), nullable=False)
+    request_path = db.Column(db.String(255), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+    response_body = db.Column(db.LargeBinary, nullable=True)
+    response_headers = db.Column(db.JSON, nullable=True)
+    # Set once the request's writes may have committed; never reclaimed after
+    committed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key} - User {self.user_id}>"
@@ -1,8 +1,64 @@
-from flask import Blueprint, jsonify
+import hmac
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request
+
+from app.jobs.services import queue_stats
+from app.utils.filters import FILTER_SPECS
 
 core = Blueprint("core", __name__)
 
+STATS_TOKEN_HEADER = "X-Stats-Token"
+
+
+def stats_token_required(view):
+    """Only holders of ``STATS_TOKEN`` may read stats; hidden when it is unset."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config["STATS_TOKEN"]
+        if not token:
+            return jsonify({"error": "Not found"}), 404
+        if not hmac.compare_digest(
+            request.headers.get(STATS_TOKEN_HEADER, "").encode(), token.encode()
+        ):
+            return (
+                jsonify({"error": f"A valid {STATS_TOKEN_HEADER} header is required"}),
+                403,
+            )
+        return view(*args, **kwargs)
+
+    return wrapper
+
 
 @core.route("/")
 def index():
     return jsonify({"message": "Welcome to the Car Rental API!"}), 200
+
+
+@core.route("/stats/statement-cache")
+@stats_token_required
+def statement_cache_stats():
+    return jsonify({name: spec.stats() for name, spec in FILTER_SPECS.items()}), 200
+
+
+@core.route("/stats/coalescing")
+@stats_token_required
+def coalescing_stats():
+    coalescer = current_app.extensions.get("coalescing")
+    return jsonify(coalescer.stats() if coalescer else {"enabled": False}), 200
+
+
+@core.route("/stats/availability")
+@stats_token_required
+def availability_stats():
+    return jsonify(current_app.extensions["availability"].stats()), 200
+
+
+@core.route("/stats/jobs")
+@stats_token_required
+def job_queue_stats():
+    try:
+        return jsonify(queue_stats()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,45 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class Event(db.Model):
+    __tablename__ = "events"
+    __table_args__ = (
+        db.Index("ix_events_merchant_id_id", "merchant_id", "id"),
+        db.Index("ix_events_merchant_id_position", "merchant_id", "position"),
+        db.Index("ix_events_position", "position"),
+        db.Index(
+            "ix_events_unsequenced_txid_id",
+            "txid",
+            "id",
+            postgresql_where=db.text("position IS NULL"),
+        ),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    merchant_id = db.Column(db.Integer, nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # The writing transaction; events are sequenced in commit order from it
+    txid = db.Column(
+        db.BigInteger,
+        nullable=False,
+        server_default=db.text("(pg_current_xact_id()::text)::bigint"),
+    )
+    # Feed order, assigned once every older transaction has finished
+    position = db.Column(db.BigInteger, nullable=True)
+
+    def __repr__(self):
+        return f"<Event {self.id} {self.event_type} {self.entity_id}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.event_type,
+            "merchant_id": self.merchant_id,
+            "entity_id": self.entity_id,
+            "payload": self.payload,
+            "created_at": self.created_at.isoformat(),
+        }
@@ -0,0 +1,34 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+
+from app.utils.decorators import role_required
+from app.utils.rate_limit import route_class
+from app.auth.models import UserRole
+from . import services
+from .services import ValidationError
+
+events = Blueprint("events", __name__)
+
+
+@events.route("/feed", methods=["GET"])
+@route_class("long_poll")
+@login_required
+@role_required(UserRole.MERCHANT)
+def get_event_feed():
+    try:
+        merchant_id = current_user.merchant_id
+        query_params = request.args.to_dict()
+        event_list, next_cursor = services.read_feed(merchant_id, query_params)
+        return (
+            jsonify(
+                {
+                    "events": [event.to_dict() for event in event_list],
+                    "next_cursor": next_cursor,
+                }
+            ),
+            200,
+        )
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,124 @@
+import time
+
+from sqlalchemy import text
+
+from ..extensions import db
+from .models import Event
+from app.sharding.routing import merchant_shard
+from app.utils.deadlines import remaining_time
+
+# Arbitrary key for the advisory lock that serializes event sequencing
+OUTBOX_LOCK_KEY = 7_300_036
+MAX_BATCH_SIZE = 500
+MAX_WAIT_SECONDS = 30
+POLL_INTERVAL = 0.5
+
+
+class EventError(Exception):
+    pass
+
+
+class ValidationError(EventError):
+    pass
+
+
+# Positions follow the last one handed out on this database, in commit
+# order: by writing transaction, then by id within a transaction
+SEQUENCE_SQL = """
+WITH pending AS (
+    SELECT id, row_number() OVER (ORDER BY txid, id) AS n
+    FROM events
+    WHERE position IS NULL AND {settled}
+), top AS (
+    SELECT coalesce(max(position), 0) AS position FROM events
+)
+UPDATE events SET position = top.position + pending.n
+FROM pending, top
+WHERE events.id = pending.id
+"""
+# Every transaction older than the snapshot's xmin has committed or aborted,
+# so no event below it can still appear
+SETTLED = "txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+
+def record_event(event_type, merchant_id, entity_id, payload):
+    """Add an event to the current transaction; the caller commits it.
+
+    No lock is taken: the row remembers its transaction, and readers give it
+    a feed position only once it and every older transaction have finished.
+    """
+    event = Event(
+        event_type=event_type,
+        merchant_id=merchant_id,
+        entity_id=entity_id,
+        payload=payload,
+    )
+    db.session.add(event)
+    return event
+
+
+def sequence_events(connection, merchant_id=None):
+    """Give settled events their feed positions; returns how many got one.
+
+    Runs in ``connection``'s transaction, which should commit right after.
+    With ``merchant_id`` all of that merchant's events are sequenced at once,
+    for when its writers are known to be blocked, as during a move. Otherwise
+    a sequencer that finds another one running skips its turn.
+    """
+    if merchant_id is None:
+        if not connection.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": OUTBOX_LOCK_KEY}
+        ).scalar():
+            return 0
+        settled, params = SETTLED, {}
+    else:
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": OUTBOX_LOCK_KEY}
+        )
+        settled, params = "merchant_id = :merchant_id", {"merchant_id": merchant_id}
+    return connection.execute(
+        text(SEQUENCE_SQL.format(settled=settled)), params
+    ).rowcount
+
+
+def _fetch_events(merchant_id, since, limit):
+    with merchant_shard(merchant_id):
+        sequence_events(db.session)
+        db.session.commit()
+        return (
+            Event.query.filter(Event.merchant_id == merchant_id, Event.position > since)
+            .order_by(Event.position)
+            .limit(limit)
+            .all()
+        )
+
+
+def read_feed(merchant_id, query_params):
+    try:
+        since = int(query_params.get("since", 0))
+        limit = int(query_params.get("limit", 100))
+        wait = float(query_params.get("wait", 0))
+    except ValueError:
+        raise ValidationError("since, limit and wait must be numbers")
+    if since < 0:
+        raise ValidationError("since must be 0 or greater")
+    if not 1 <= limit <= MAX_BATCH_SIZE:
+        raise ValidationError(f"limit must be between 1 and {MAX_BATCH_SIZE}")
+    if not 0 <= wait <= MAX_WAIT_SECONDS:
+        raise ValidationError(f"wait must be between 0 and {MAX_WAIT_SECONDS} seconds")
+
+    # Never wait past the request deadline; leave time for the final query
+    remaining = remaining_time()
+    if remaining is not None:
+        wait = min(wait, max(0.0, remaining - 1.0))
+    give_up_at = time.monotonic() + wait
+
+    events = _fetch_events(merchant_id, since, limit)
+    while not events and time.monotonic() < give_up_at:
+        # End the transaction so no connection sits idle in one while waiting
+        db.session.rollback()
+        time.sleep(min(POLL_INTERVAL, max(0.0, give_up_at - time.monotonic())))
+        events = _fetch_events(merchant_id, since, limit)
+
+    next_cursor = events[-1].position if events else since
+    return events, next_cursor
@@ -0,0 +1,11 @@
+import click
+
+from .routes import exports
+from .services import purge_expired_exports
+
+
+@exports.cli.command("purge")
+def purge_command():
+    """Delete export files past EXPORT_RETENTION_SECONDS and expire their jobs."""
+    expired = purge_expired_exports()
+    click.echo(f"Expired {expired} exports")
@@ -0,0 +1,95 @@
+from flask import (
+    Blueprint,
+    Response,
+    jsonify,
+    request,
+    send_file,
+    stream_with_context,
+    url_for,
+)
+from flask_login import login_required, current_user
+
+from app.utils.decorators import not_batchable, role_required
+from app.auth.models import UserRole
+from . import services
+from .services import (
+    EXPORT_MIMETYPES,
+    ExportExpiredError,
+    ExportNotFoundError,
+    ExportNotReadyError,
+)
+
+exports = Blueprint("exports", __name__)
+
+
+@exports.route("/<int:job_id>", methods=["GET"])
+@login_required
+@role_required(UserRole.MERCHANT)
+def get_export(job_id):
+    try:
+        export_job = services.get_export(job_id, current_user.id)
+        return jsonify(export_job.to_dict()), 200
+    except ExportNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ExportExpiredError as e:
+        return jsonify({"error": str(e)}), 410
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@exports.route("/<int:job_id>/download", methods=["GET"])
+@not_batchable
+@login_required
+@role_required(UserRole.MERCHANT)
+def download_export(job_id):
+    try:
+        path, export_format, filename = services.get_export_file(
+            job_id, current_user.id
+        )
+        return send_file(
+            path,
+            mimetype=EXPORT_MIMETYPES[export_format],
+            as_attachment=True,
+            download_name=filename,
+        )
+    except ExportNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ExportExpiredError as e:
+        return jsonify({"error": str(e)}), 410
+    except ExportNotReadyError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def export_response(source_name, **scope_values):
+    """Stream an export, or queue it when the request asks for ``background``."""
+    query_params = request.args.to_dict()
+    export_format = services.parse_export_format(query_params)
+
+    if query_params.get("background", "").lower() in ("1", "true", "yes"):
+        export_job = services.queue_export(
+            source_name, export_format, query_params, current_user.id, **scope_values
+        )
+        return (
+            jsonify(
+                {
+                    "job": export_job.to_dict(),
+                    "status_url": url_for("exports.get_export", job_id=export_job.id),
+                    "download_url": url_for(
+                        "exports.download_export", job_id=export_job.id
+                    ),
+                }
+            ),
+            202,
+        )
+
+    chunks = services.export_chunks(
+        source_name, export_format, query_params, **scope_values
+    )
+    filename = services.export_filename(source_name, export_format)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,291 @@
+import csv
+import enum
+import io
+import os
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import DateTime, Enum, Integer, Numeric
+
+from ..extensions import db
+from ..jobs.models import Job, JobStatus
+from ..jobs.services import enqueue
+from ..sharding.routing import merchant_shard
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_SOURCES = {}
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportNotFoundError(ExportError):
+    pass
+
+
+class ExportNotReadyError(ExportError):
+    pass
+
+
+class ExportExpiredError(ExportError):
+    pass
+
+
+class ExportSource:
+    """A filter spec plus the columns written for each matching row."""
+
+    def __init__(self, name, spec, columns):
+        self.name = name
+        self.spec = spec
+        self.columns = columns
+        self.header = [column.key for column in columns]
+        EXPORT_SOURCES[name] = self
+
+    def partitions(self, query_params, **scope_values):
+        merchant_id = scope_values.get("merchant_id")
+        # The stream binds to a shard's engine up front, before any row is read
+        with nullcontext() if merchant_id is None else merchant_shard(merchant_id):
+            return self.spec.stream(
+                query_params,
+                self.columns,
+                current_app.config["EXPORT_CHUNK_SIZE"],
+                **scope_values,
+            )
+
+
+def available_formats():
+    if pyarrow is None:
+        return ["csv"]
+    return ["csv", "parquet"]
+
+
+def parse_export_format(query_params):
+    export_format = query_params.get("format", "csv").lower()
+    if export_format not in EXPORT_MIMETYPES:
+        raise ExportError(
+            f"Invalid format '{export_format}'. Must be one of: "
+            f"{', '.join(EXPORT_MIMETYPES)}"
+        )
+    if export_format not in available_formats():
+        raise ExportError(f"Export format '{export_format}' is not available")
+    return export_format
+
+
+def export_filename(source_name, export_format):
+    return f"{source_name}-{datetime.utcnow():%Y%m%d%H%M%S}.{export_format}"
+
+
+def _cell(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _csv_chunks(source, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(source.header)
+    yield buffer.getvalue().encode()
+
+    for rows in partitions:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow(
+                [
+                    value.isoformat() if isinstance(value, datetime) else _cell(value)
+                    for value in row
+                ]
+            )
+        yield buffer.getvalue().encode()
+
+
+def _arrow_type(column):
+    column_type = column.type
+    if isinstance(column_type, Enum):
+        return pyarrow.string()
+    if isinstance(column_type, Numeric):
+        return pyarrow.decimal128(column_type.precision, column_type.scale)
+    if isinstance(column_type, Integer):
+        return pyarrow.int64()
+    if isinstance(column_type, DateTime):
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+class _DrainableSink:
+    """Write-only file object whose contents are handed out as they are written."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_chunks(source, partitions):
+    schema = pyarrow.schema(
+        [
+            (name, _arrow_type(column))
+            for name, column in zip(source.header, source.columns)
+        ]
+    )
+    sink = _DrainableSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    # One row group per chunk, sent as soon as it is encoded
+    for rows in partitions:
+        arrays = [
+            pyarrow.array([_cell(row[index]) for row in rows], type=field.type)
+            for index, field in enumerate(schema)
+        ]
+        writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(source_name, export_format, query_params, **scope_values):
+    """Encoded export of ``source_name`` as an iterator of byte strings.
+
+    Invalid filters raise here, before the first chunk is produced.
+    """
+    source = EXPORT_SOURCES[source_name]
+    partitions = source.partitions(query_params, **scope_values)
+    if export_format == "parquet":
+        return _parquet_chunks(source, partitions)
+    return _csv_chunks(source, partitions)
+
+
+def queue_export(source_name, export_format, query_params, owner_id, **scope_values):
+    EXPORT_SOURCES[source_name].spec.parse(query_params)
+    export_job = enqueue(
+        "exports.write",
+        {
+            "source": source_name,
+            "format": export_format,
+            "query_params": query_params,
+            "scope": scope_values,
+            "owner_id": owner_id,
+        },
+    )
+    db.session.commit()
+    return export_job
+
+
+def write_export_file(payload):
+    """Write an export to ``EXPORT_DIR`` through a temporary file."""
+    export_dir = current_app.config["EXPORT_DIR"]
+    os.makedirs(export_dir, exist_ok=True)
+    filename = f"{uuid.uuid4().hex}.{payload['format']}"
+    path = os.path.join(export_dir, filename)
+
+    size = 0
+    with open(f"{path}.part", "wb") as export_file:
+        for chunk in export_chunks(
+            payload["source"],
+            payload["format"],
+            payload["query_params"],
+            **payload["scope"],
+        ):
+            export_file.write(chunk)
+            size += len(chunk)
+    os.replace(f"{path}.part", path)
+
+    return {
+        "file": filename,
+        "filename": export_filename(payload["source"], payload["format"]),
+        "bytes": size,
+    }
+
+
+def get_export(job_id, owner_id):
+    export_job = db.session.get(Job, int(job_id))
+    if (
+        export_job is None
+        or export_job.name != "exports.write"
+        or export_job.payload.get("owner_id") != owner_id
+    ):
+        raise ExportNotFoundError("Export not found")
+    if export_job.result is not None and export_job.result.get("expired_at"):
+        raise ExportExpiredError("Export has expired; request it again")
+    return export_job
+
+
+def get_export_file(job_id, owner_id):
+    export_job = get_export(job_id, owner_id)
+    if export_job.result is None:
+        raise ExportNotReadyError(f"Export is {export_job.status.value}")
+
+    path = os.path.join(current_app.config["EXPORT_DIR"], export_job.result["file"])
+    if not os.path.exists(path):
+        raise ExportNotFoundError("Export file no longer exists")
+    return path, export_job.payload["format"], export_job.result["filename"]
+
+
+def purge_expired_exports(now=None):
+    """Delete export files older than ``EXPORT_RETENTION_SECONDS``.
+
+    Their jobs are marked expired rather than deleted, so the download URL
+    answers 410 instead of 404. Leftover ``.part`` files of writes that
+    died are removed after the same age.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config["EXPORT_RETENTION_SECONDS"])
+    export_dir = current_app.config["EXPORT_DIR"]
+    expired = (
+        Job.query.filter(
+            Job.name == "exports.write",
+            Job.status == JobStatus.DONE,
+            Job.finished_at <= cutoff,
+            Job.result["expired_at"].as_string().is_(None),
+        )
+        .order_by(Job.id)
+        .all()
+    )
+    for export_job in expired:
+        try:
+            os.remove(os.path.join(export_dir, export_job.result["file"]))
+        except FileNotFoundError:
+            pass
+        export_job.result = {**export_job.result, "expired_at": now.isoformat()}
+    db.session.commit()
+
+    if os.path.isdir(export_dir):
+        for name in os.listdir(export_dir):
+            path = os.path.join(export_dir, name)
+            if name.endswith(".part") and os.path.getmtime(path) <= cutoff.timestamp():
+                os.remove(path)
+    return len(expired)
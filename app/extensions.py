@@ -3,7 +3,9 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 
-db = SQLAlchemy()
+from app.sharding.routing import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 bcrypt = Bcrypt()
 login_manager = LoginManager()
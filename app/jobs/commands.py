@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from ..extensions import db
+from . import services
+from .worker import run_worker
+
+jobs_cli = AppGroup("jobs", help="Manage the background job queue.")
+
+
+@click.command("worker")
+@click.option("--processes", type=int, default=None)
+@click.option("--threads", type=int, default=None)
+@click.option("--poll-interval", type=float, default=None)
+@with_appcontext
+def worker_command(processes, threads, poll_interval):
+    """Run background job workers."""
+    config = current_app.config
+    run_worker(
+        current_app._get_current_object(),
+        processes or config["JOB_WORKER_PROCESSES"],
+        threads or config["JOB_WORKER_THREADS"],
+        poll_interval or config["JOB_POLL_INTERVAL"],
+    )
+
+
+@jobs_cli.command("enqueue")
+@click.argument("name")
+@click.option("--payload", default="{}", help="JSON payload for the job.")
+@click.option("--priority", type=int, default=0)
+@click.option("--delay", type=float, default=0, help="Seconds to wait before running.")
+def enqueue_command(name, payload, priority, delay):
+    """Queue a job by name."""
+    new_job = services.enqueue(
+        name,
+        json.loads(payload),
+        priority=priority,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.commit()
+    click.echo(f"Queued job {new_job.id}")
+
+
+@jobs_cli.command("stats")
+def stats_command():
+    """Show queue depth."""
+    click.echo(json.dumps(services.queue_stats(), indent=2))
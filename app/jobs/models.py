@@ -0,0 +1,59 @@
+import enum
+from datetime import datetime
+from ..extensions import db
+
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index(
+            "ix_jobs_ready",
+            db.text("priority DESC"),
+            "run_at",
+            "id",
+            postgresql_where=db.text("status = 'QUEUED'"),
+        ),
+        db.Index(
+            "ix_jobs_running_locked_at",
+            "locked_at",
+            postgresql_where=db.text("status = 'RUNNING'"),
+        ),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.name} {self.status.value}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status.value,
+            "priority": self.priority,
+            "attempts": self.attempts,
+            "run_at": self.run_at.isoformat(),
+            "last_error": self.last_error,
+            "result": self.result,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -0,0 +1,215 @@
+import random
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from ..extensions import db
+from .models import Job, JobStatus
+
+JOB_HANDLERS = {}
+
+
+class JobError(Exception):
+    pass
+
+
+class UnknownJobError(JobError):
+    pass
+
+
+class JobNotFoundError(JobError):
+    pass
+
+
+def job(name):
+    """Register ``f(payload)`` as the handler for jobs called ``name``."""
+
+    def decorator(f):
+        JOB_HANDLERS[name] = f
+        return f
+
+    return decorator
+
+
+def enqueue(name, payload=None, priority=0, run_at=None, max_attempts=None):
+    """Add a job to the current transaction; the caller commits it."""
+    if name not in JOB_HANDLERS:
+        raise UnknownJobError(f"No job handler registered for '{name}'")
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        run_at=run_at or datetime.utcnow(),
+        max_attempts=max_attempts or current_app.config["JOB_MAX_ATTEMPTS"],
+    )
+    db.session.add(new_job)
+    return new_job
+
+
+def get_job(job_id):
+    found = db.session.get(Job, int(job_id))
+    if not found:
+        raise JobNotFoundError("Job not found")
+    return found
+
+
+def claim_next_job(worker_id):
+    """Atomically take the highest-priority ready job, or return None.
+
+    ``FOR UPDATE SKIP LOCKED`` lets any number of workers poll at once
+    without blocking on, or double-claiming, the same row.
+    """
+    now = datetime.utcnow()
+    next_id = (
+        db.select(Job.id)
+        .where(Job.status == JobStatus.QUEUED, Job.run_at <= now)
+        .order_by(Job.priority.desc(), Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    claimed = db.session.execute(
+        db.update(Job)
+        .where(Job.id == next_id)
+        .values(
+            status=JobStatus.RUNNING,
+            attempts=Job.attempts + 1,
+            locked_at=now,
+            locked_by=worker_id,
+        )
+        .returning(
+            Job.id,
+            Job.name,
+            Job.payload,
+            Job.attempts,
+            Job.max_attempts,
+            Job.locked_by,
+        )
+    ).first()
+    db.session.commit()
+    return claimed
+
+
+def _still_claimed(claimed):
+    # A job requeued from under a stalled worker may already run elsewhere
+    return db.and_(
+        Job.id == claimed.id,
+        Job.status == JobStatus.RUNNING,
+        Job.locked_by == claimed.locked_by,
+    )
+
+
+def heartbeat(claimed):
+    """Refresh ``locked_at`` so a long job is not taken for a dead one.
+
+    Returns False once the job is no longer this worker's.
+    """
+    result = db.session.execute(
+        db.update(Job)
+        .where(_still_claimed(claimed))
+        .values(locked_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def retry_delay(attempts):
+    base = current_app.config["JOB_RETRY_BASE_SECONDS"]
+    delay = min(base * 2 ** (attempts - 1), current_app.config["JOB_RETRY_MAX_SECONDS"])
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(claimed):
+    handler = JOB_HANDLERS.get(claimed.name)
+    try:
+        if handler is None:
+            raise UnknownJobError(f"No job handler registered for '{claimed.name}'")
+        result = handler(claimed.payload)
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        now = datetime.utcnow()
+        if claimed.attempts < claimed.max_attempts:
+            values = {
+                "status": JobStatus.QUEUED,
+                "run_at": now + timedelta(seconds=retry_delay(claimed.attempts)),
+            }
+        else:
+            values = {"status": JobStatus.FAILED, "finished_at": now}
+        db.session.execute(
+            db.update(Job)
+            .where(_still_claimed(claimed))
+            .values(last_error=error, locked_at=None, locked_by=None, **values)
+        )
+        db.session.commit()
+        return False
+
+    db.session.execute(
+        db.update(Job)
+        .where(_still_claimed(claimed))
+        .values(
+            status=JobStatus.DONE,
+            result=result,
+            finished_at=datetime.utcnow(),
+            locked_at=None,
+            locked_by=None,
+        )
+    )
+    db.session.commit()
+    return True
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker stopped sending heartbeats while running them.
+
+    The lost run counts as an attempt, so a job that keeps killing its worker
+    fails for good at ``max_attempts`` instead of being retried forever.
+    Returns ``(requeued, failed)``.
+    """
+    now = datetime.utcnow()
+    stale = db.and_(
+        Job.status == JobStatus.RUNNING,
+        Job.locked_at < now - timedelta(seconds=current_app.config["JOB_LOCK_TIMEOUT"]),
+    )
+    released = {
+        "locked_at": None,
+        "locked_by": None,
+        "last_error": "The worker stopped sending heartbeats",
+    }
+    failed = db.session.execute(
+        db.update(Job)
+        .where(stale, Job.attempts >= Job.max_attempts)
+        .values(status=JobStatus.FAILED, finished_at=now, **released)
+    ).rowcount
+    requeued = db.session.execute(
+        db.update(Job)
+        .where(stale)
+        .values(status=JobStatus.QUEUED, run_at=now, **released)
+    ).rowcount
+    db.session.commit()
+    return requeued, failed
+
+
+def queue_stats():
+    now = datetime.utcnow()
+    ready, oldest_ready = db.session.execute(
+        db.select(func.count(), func.min(Job.run_at)).where(
+            Job.status == JobStatus.QUEUED, Job.run_at <= now
+        )
+    ).one()
+    scheduled = db.session.execute(
+        db.select(func.count()).where(Job.status == JobStatus.QUEUED, Job.run_at > now)
+    ).scalar()
+    running = db.session.execute(
+        db.select(func.count()).where(Job.status == JobStatus.RUNNING)
+    ).scalar()
+    return {
+        "ready": ready,
+        "scheduled": scheduled,
+        "running": running,
+        "oldest_ready_age_seconds": (
+            round((now - oldest_ready).total_seconds(), 3) if oldest_ready else 0
+        ),
+    }
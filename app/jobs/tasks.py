@@ -0,0 +1,48 @@
+from flask import current_app
+
+from app.auth.tokens import purge_expired_revocations
+from app.exports.services import purge_expired_exports, write_export_file
+from app.rentals import partitions
+from app.repricing.services import run_repricing
+from app.sharding.routing import shard_names, use_shard
+from app.utils.idempotency import purge_expired_keys
+from .services import job
+
+
+@job("idempotency.purge_expired")
+def purge_expired_idempotency_keys(payload):
+    return {"deleted": purge_expired_keys()}
+
+
+@job("auth.purge_revoked_tokens")
+def purge_revoked_tokens(payload):
+    return {"deleted": purge_expired_revocations()}
+
+
+@job("rentals.create_partitions")
+def create_rental_partitions(payload):
+    months_ahead = payload.get(
+        "months_ahead", current_app.config["RENTAL_PARTITION_MONTHS_AHEAD"]
+    )
+    created = {}
+    for shard in shard_names():
+        with use_shard(shard):
+            created[shard] = partitions.ensure_partitions(months_ahead)
+    return {"created": created}
+
+
+@job("repricing.run")
+def reprice_fleet(payload):
+    return run_repricing(
+        dry_run=payload.get("dry_run", False), merchant_id=payload.get("merchant_id")
+    )
+
+
+@job("exports.write")
+def write_export(payload):
+    return write_export_file(payload)
+
+
+@job("exports.purge_expired")
+def purge_exports(payload):
+    return {"expired": purge_expired_exports()}
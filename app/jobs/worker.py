@@ -0,0 +1,143 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from ..extensions import db
+from . import services
+
+logger = logging.getLogger(__name__)
+
+
+def _send_heartbeats(app, claimed, done, interval):
+    with app.app_context():
+        while not done.wait(interval):
+            try:
+                if not services.heartbeat(claimed):
+                    logger.warning(
+                        "Job %s is no longer held by this worker", claimed.id
+                    )
+                    break
+            except Exception:
+                logger.exception("Heartbeat for job %s failed", claimed.id)
+                db.session.rollback()
+        db.session.remove()
+
+
+def _run_with_heartbeats(app, claimed):
+    done = threading.Event()
+    pulse = threading.Thread(
+        target=_send_heartbeats,
+        args=(app, claimed, done, app.config["JOB_HEARTBEAT_SECONDS"]),
+        daemon=True,
+    )
+    pulse.start()
+    try:
+        return services.run_job(claimed)
+    finally:
+        done.set()
+        pulse.join()
+
+
+def _work_loop(app, worker_id, stop, poll_interval):
+    with app.app_context():
+        last_requeue = 0.0
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_requeue > poll_interval * 10:
+                    requeued, failed = services.requeue_stale_jobs()
+                    if requeued or failed:
+                        logger.warning(
+                            "Took back stale jobs: %s requeued, %s failed",
+                            requeued,
+                            failed,
+                        )
+                    last_requeue = time.monotonic()
+                claimed = services.claim_next_job(worker_id)
+            except Exception:
+                logger.exception("Worker %s could not claim a job", worker_id)
+                db.session.rollback()
+                claimed = None
+
+            if claimed is None:
+                stop.wait(poll_interval)
+                continue
+
+            ok = _run_with_heartbeats(app, claimed)
+            logger.info(
+                "Job %s %s (%s) by %s",
+                claimed.id,
+                claimed.name,
+                "done" if ok else "failed",
+                worker_id,
+            )
+            db.session.remove()
+
+
+def run_threads(app, threads, poll_interval, stop=None):
+    stop = stop or threading.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    pool = [
+        threading.Thread(
+            target=_work_loop,
+            args=(app, f"{prefix}:{index}", stop, poll_interval),
+            daemon=True,
+        )
+        for index in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in pool):
+            for thread in pool:
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+    return pool
+
+
+def _process_main(app, threads, poll_interval):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    run_threads(app, threads, poll_interval, stop)
+
+
+def run_worker(app, processes, threads, poll_interval):
+    """Run ``processes`` x ``threads`` job loops until SIGTERM/SIGINT."""
+    if processes <= 1:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        run_threads(app, threads, poll_interval, stop)
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    context = multiprocessing.get_context("fork")
+    children = [
+        context.Process(target=_process_main, args=(app, threads, poll_interval))
+        for _ in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        forward(signal.SIGINT, None)
+        for child in children:
+            child.join()
@@ -0,0 +1,73 @@
+import sys
+
+import click
+from flask.cli import AppGroup
+
+from . import services
+from .scenarios import SCENARIOS
+
+plans_cli = AppGroup("plans", help="Query-plan regression checks.")
+
+
+def _selected(names):
+    if not names:
+        return SCENARIOS
+    known = {scenario.name: scenario for scenario in SCENARIOS}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise click.ClickException(f"Unknown scenarios: {', '.join(unknown)}")
+    return [known[name] for name in names]
+
+
+def _report(results):
+    failed = 0
+    for name, result in results.items():
+        status = "FAIL" if result["problems"] else "ok"
+        failed += bool(result["problems"])
+        click.echo(f"{status:4}  {name} ({result['statements']} statements)")
+        for problem in result["problems"]:
+            click.echo(f"      {problem}")
+        if result["error"]:
+            click.echo(f"      note: the service raised {result['error']}")
+    return failed
+
+
+@plans_cli.command("seed")
+@click.option("--users", type=int, default=20000)
+@click.option("--merchants", type=int, default=200)
+@click.option("--cars", type=int, default=50000)
+@click.option("--rentals", type=int, default=500000)
+def seed_command(users, merchants, cars, rentals):
+    """Fill an empty database with representative data for plan checks."""
+    try:
+        services.seed_database(users, merchants, cars, rentals)
+    except services.PlanError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Seeded {users} users, {merchants} merchants, {cars} cars")
+
+
+@plans_cli.command("check")
+@click.argument("scenarios", nargs=-1)
+def check_command(scenarios):
+    """Explain every service query and compare it with the approved plans."""
+    try:
+        results = services.run_plan_checks(_selected(scenarios))
+    except services.PlanError as e:
+        raise click.ClickException(str(e))
+    failed = _report(results)
+    if failed:
+        click.echo(f"{failed} of {len(results)} scenarios failed", err=True)
+        sys.exit(1)
+
+
+@plans_cli.command("approve")
+@click.argument("scenarios", nargs=-1)
+def approve_command(scenarios):
+    """Store the current plans as the approved snapshots."""
+    try:
+        results = services.run_plan_checks(_selected(scenarios), approve=True)
+    except services.PlanError as e:
+        raise click.ClickException(str(e))
+    if _report(results):
+        click.echo("Snapshots written, but some plans still break the rules", err=True)
+        sys.exit(1)
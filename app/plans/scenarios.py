@@ -0,0 +1,185 @@
+from app.auth import services as auth_services
+from app.cars import services as car_services
+from app.rentals import services as rental_services
+
+
+class Scenario:
+    """One service call with typical parameters.
+
+    ``allow_seq_scan`` names tables the call is expected to read in full,
+    such as the unfiltered car listing.
+    """
+
+    def __init__(self, name, run, allow_seq_scan=()):
+        self.name = name
+        self.run = run
+        self.allow_seq_scan = set(allow_seq_scan)
+
+
+# Typical ids from the seeded data, on the default shard
+FIXTURE_QUERIES = {
+    "merchant_id": (
+        "SELECT merchant_id FROM cars GROUP BY merchant_id "
+        "ORDER BY count(*) DESC, merchant_id LIMIT 1"
+    ),
+    "merchant_car_id": (
+        "SELECT min(id) FROM cars WHERE merchant_id = "
+        "(SELECT merchant_id FROM cars GROUP BY merchant_id "
+        "ORDER BY count(*) DESC, merchant_id LIMIT 1)"
+    ),
+    "available_car_id": "SELECT min(id) FROM cars WHERE status = 'AVAILABLE'",
+    "idle_user_id": (
+        "SELECT min(u.id) FROM users u WHERE u.role = 'USER' AND NOT EXISTS "
+        "(SELECT 1 FROM rentals r WHERE r.user_id = u.id AND r.return_date IS NULL)"
+    ),
+    "renting_user_id": "SELECT min(user_id) FROM rentals WHERE return_date IS NULL",
+    "history_user_id": (
+        "SELECT user_id FROM rentals GROUP BY user_id "
+        "ORDER BY count(*) DESC, user_id LIMIT 1"
+    ),
+    "email": (
+        "SELECT email FROM users WHERE id = (SELECT user_id FROM rentals "
+        "GROUP BY user_id ORDER BY count(*) DESC, user_id LIMIT 1)"
+    ),
+}
+
+NEW_CAR = {"make": "Toyota", "model": "Model 1", "year": 2022, "price_per_hour": "40"}
+
+SCENARIOS = [
+    Scenario("cars.get_car", lambda f: car_services.get_car(f["available_car_id"])),
+    Scenario(
+        "cars.get_cars_by_ids",
+        lambda f: car_services.get_cars_by_ids(
+            [f["available_car_id"] + offset for offset in range(20)]
+        ),
+    ),
+    Scenario(
+        "cars.get_all_cars",
+        lambda f: car_services.get_all_cars(),
+        allow_seq_scan=["cars"],
+    ),
+    Scenario(
+        "cars.get_merchant_cars",
+        lambda f: car_services.get_merchant_cars(f["merchant_id"]),
+    ),
+    # Counting the whole unfiltered catalog reads every car
+    Scenario(
+        "cars.query_cars",
+        lambda f: car_services.query_cars({}),
+        allow_seq_scan=["cars"],
+    ),
+    Scenario(
+        "cars.query_cars_make_price",
+        lambda f: car_services.query_cars(
+            {"make": "tesla", "max_price": "120", "page": "2"}
+        ),
+    ),
+    Scenario(
+        "cars.query_cars_sorted",
+        lambda f: car_services.query_cars({"sort": "-price_per_hour"}),
+        allow_seq_scan=["cars"],
+    ),
+    Scenario(
+        "cars.query_merchant_cars",
+        lambda f: car_services.query_merchant_cars(
+            f["merchant_id"], {"status": "available"}
+        ),
+    ),
+    Scenario(
+        "cars.query_merchant_cars_sorted",
+        lambda f: car_services.query_merchant_cars(f["merchant_id"], {"sort": "year"}),
+    ),
+    Scenario(
+        "cars.create_car",
+        lambda f: car_services.create_car(dict(NEW_CAR), f["merchant_id"]),
+    ),
+    Scenario(
+        "cars.update_car",
+        lambda f: car_services.update_car(
+            f["merchant_car_id"], {"price_per_hour": "45"}, f["merchant_id"]
+        ),
+    ),
+    Scenario(
+        "cars.delete_car",
+        lambda f: car_services.delete_car(f["merchant_car_id"], f["merchant_id"]),
+    ),
+    Scenario(
+        "rentals.rent_a_car",
+        lambda f: rental_services.rent_a_car(f["idle_user_id"], f["available_car_id"]),
+    ),
+    Scenario(
+        "rentals.return_car",
+        lambda f: rental_services.return_car(f["renting_user_id"]),
+    ),
+    Scenario(
+        "rentals.quote_prices",
+        lambda f: rental_services.quote_prices(
+            {
+                "car_ids": [f["available_car_id"] + offset for offset in range(20)],
+                "durations": ["3h", "1d", "1w"],
+            }
+        ),
+    ),
+    Scenario(
+        "rentals.get_rental_history",
+        lambda f: rental_services.get_rental_history(f["history_user_id"]),
+    ),
+    Scenario(
+        "rentals.query_user_rentals",
+        lambda f: rental_services.query_user_rentals(f["history_user_id"], {}),
+    ),
+    Scenario(
+        "rentals.query_user_rentals_filtered",
+        lambda f: rental_services.query_user_rentals(
+            f["history_user_id"],
+            {"make": "bmw", "status": "completed", "rental_date_start": "2025-01-01"},
+        ),
+    ),
+    Scenario(
+        "rentals.query_user_rentals_sorted",
+        lambda f: rental_services.query_user_rentals(
+            f["history_user_id"], {"sort": "-total_fee"}
+        ),
+    ),
+    Scenario(
+        "rentals.query_user_rentals_by_return_date",
+        lambda f: rental_services.query_user_rentals(
+            f["history_user_id"], {"sort": "return_date", "page": "2"}
+        ),
+    ),
+    # The largest fleet has ~15% of all rentals; rentals carry no merchant_id
+    # to reach them by index, so reading them through cars is the cheap plan
+    Scenario(
+        "rentals.get_merchant_rental_history",
+        lambda f: rental_services.get_merchant_rental_history(f["merchant_id"]),
+        allow_seq_scan=["rentals"],
+    ),
+    Scenario(
+        "rentals.query_merchant_rentals",
+        lambda f: rental_services.query_merchant_rentals(f["merchant_id"], {}),
+        allow_seq_scan=["rentals"],
+    ),
+    Scenario(
+        "rentals.query_merchant_rentals_active",
+        lambda f: rental_services.query_merchant_rentals(
+            f["merchant_id"], {"status": "active"}
+        ),
+    ),
+    Scenario(
+        "auth.register_user",
+        lambda f: auth_services.register_user(
+            {
+                "email": "new-user@plans.test",
+                "password": "password",
+                "name": "New",
+                "surname": "User",
+            }
+        ),
+    ),
+    Scenario(
+        "auth.login_user",
+        lambda f: auth_services.login_user_service(
+            {"email": f["email"], "password": "password"}
+        ),
+    ),
+]
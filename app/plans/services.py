@@ -0,0 +1,354 @@
+import json
+import os
+import re
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import event, text
+
+from app.extensions import bcrypt, db
+from app.rentals import partitions
+
+READ_ONLY_STATEMENT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+PARTITION_NAME = re.compile(r"rentals_(y\d{4}m\d{2}|default)")
+SEQ_SCANS = {"Seq Scan", "Parallel Seq Scan"}
+SHAPE_KEYS = {
+    "Node Type": "node",
+    "Relation Name": "relation",
+    "Index Name": "index",
+    "Join Type": "join",
+    "Strategy": "strategy",
+    "Scan Direction": "direction",
+}
+APPEND_NODES = {"Append", "Merge Append"}
+SEED_PASSWORD = "password"
+
+
+class PlanError(Exception):
+    pass
+
+
+class WriteBlocked(PlanError):
+    pass
+
+
+class PlanCapture:
+    """Records the statements a service sends and stops it at its first write.
+
+    The write itself is recorded too; ``EXPLAIN`` without ``ANALYZE`` plans
+    it without running it.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.blocked = False
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if executemany:
+            # Batched statements share one plan; explain the first row's
+            parameters = parameters[0]
+        self.statements.append((conn.engine, statement, parameters))
+        if not READ_ONLY_STATEMENT.match(statement):
+            self.blocked = True
+            raise WriteBlocked("Writes are not executed while capturing plans")
+
+
+def capture_statements(run, fixtures):
+    """Run one scenario and return the SQL it sent, with any error it raised."""
+    capture = PlanCapture()
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", capture.before_cursor_execute)
+    error = None
+    try:
+        run(fixtures)
+    except Exception as e:
+        # Services re-raise blocked writes as plain exceptions; those are expected
+        if not capture.blocked:
+            error = f"{type(e).__name__}: {e}"
+    finally:
+        db.session.rollback()
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", capture.before_cursor_execute)
+    return capture.statements, error
+
+
+def explain(engine, statement, parameters):
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        return cursor.fetchone()[0][0]["Plan"]
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def _normalize_name(name):
+    # Monthly partitions come and go; compare them as one relation
+    return PARTITION_NAME.sub("rentals_<partition>", name)
+
+
+def plan_shape(plan):
+    """Node types, relations, indexes and join strategies, without costs.
+
+    Identical children of an Append collapse into one, so adding a month
+    partition does not change the shape.
+    """
+    shape = {
+        label: _normalize_name(plan[key]) if key.endswith("Name") else plan[key]
+        for key, label in SHAPE_KEYS.items()
+        if key in plan
+    }
+    children = [plan_shape(child) for child in plan.get("Plans", [])]
+    if plan["Node Type"] in APPEND_NODES:
+        unique = []
+        for child in children:
+            if child not in unique:
+                unique.append(child)
+        children = unique
+    if children:
+        shape["children"] = children
+    return shape
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _table_rows(engine):
+    with engine.connect() as connection:
+        return dict(
+            connection.execute(
+                text(
+                    "SELECT relname, reltuples::bigint FROM pg_class "
+                    "WHERE relkind IN ('r', 'p') "
+                    "AND relnamespace = 'public'::regnamespace"
+                )
+            ).all()
+        )
+
+
+def large_seq_scans(plan, table_rows, allowed, min_rows):
+    """Relations the plan reads in full that hold at least ``min_rows`` rows.
+
+    Scanned partitions are reported once, under their table, with their
+    rows added up.
+    """
+    scanned = {}
+    for node in _plan_nodes(plan):
+        if node["Node Type"] not in SEQ_SCANS:
+            continue
+        relation = node["Relation Name"]
+        table = _normalize_name(relation).split("_<")[0]
+        if table not in allowed:
+            scanned.setdefault(table, {})[relation] = table_rows.get(relation, 0)
+    return [
+        f"{table} (~{sum(rows.values())} rows)"
+        for table, rows in scanned.items()
+        if sum(rows.values()) >= min_rows
+    ]
+
+
+def _snapshot_path(name):
+    return os.path.join(current_app.config["PLAN_SNAPSHOT_DIR"], f"{name}.json")
+
+
+def load_snapshot(name):
+    try:
+        with open(_snapshot_path(name)) as snapshot_file:
+            return json.load(snapshot_file)
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot(name, snapshot):
+    os.makedirs(current_app.config["PLAN_SNAPSHOT_DIR"], exist_ok=True)
+    with open(_snapshot_path(name), "w") as snapshot_file:
+        json.dump(snapshot, snapshot_file, indent=2, sort_keys=True)
+        snapshot_file.write("\n")
+
+
+def resolve_fixtures(fixture_queries):
+    fixtures = {}
+    for name, query in fixture_queries.items():
+        value = db.session.execute(text(query)).scalar()
+        if value is None:
+            raise PlanError(
+                f"No data for fixture '{name}'; seed the database with `flask plans seed`"
+            )
+        fixtures[name] = value
+    db.session.rollback()
+    return fixtures
+
+
+def build_snapshot(scenario, fixtures, table_rows):
+    statements, error = capture_statements(scenario.run, fixtures)
+    entries, seq_scans = [], []
+    for engine, statement, parameters in statements:
+        plan = explain(engine, statement, parameters)
+        seq_scans += large_seq_scans(
+            plan,
+            table_rows[engine],
+            scenario.allow_seq_scan,
+            current_app.config["PLAN_LARGE_TABLE_ROWS"],
+        )
+        entries.append(
+            {
+                "sql": statement,
+                "total_cost": plan["Total Cost"],
+                "plan_rows": plan["Plan Rows"],
+                "plan": plan_shape(plan),
+            }
+        )
+    return {"scenario": scenario.name, "statements": entries}, seq_scans, error
+
+
+def compare(snapshot, approved):
+    """Reasons the current plans differ from the approved ones beyond the budgets."""
+    if approved is None:
+        return ["no approved snapshot; run `flask plans approve`"]
+    current, expected = snapshot["statements"], approved["statements"]
+    if [entry["sql"] for entry in current] != [entry["sql"] for entry in expected]:
+        return ["the SQL changed; review it and run `flask plans approve`"]
+
+    config = current_app.config
+    problems = []
+    for index, (entry, approved_entry) in enumerate(zip(current, expected), 1):
+        if entry["plan"] != approved_entry["plan"]:
+            problems.append(f"statement {index}: plan shape changed")
+        cost_budget = approved_entry["total_cost"] * config["PLAN_COST_TOLERANCE"]
+        if entry["total_cost"] > max(cost_budget, config["PLAN_MIN_COST_BUDGET"]):
+            problems.append(
+                f"statement {index}: cost {entry['total_cost']} over budget "
+                f"{round(cost_budget, 2)}"
+            )
+        rows_budget = approved_entry["plan_rows"] * config["PLAN_ROWS_TOLERANCE"]
+        if entry["plan_rows"] > max(rows_budget, config["PLAN_MIN_ROWS_BUDGET"]):
+            problems.append(
+                f"statement {index}: estimated rows {entry['plan_rows']} over "
+                f"budget {round(rows_budget)}"
+            )
+    return problems
+
+
+def run_plan_checks(scenarios, approve=False):
+    """Capture and explain every scenario; compare with or replace the snapshots.
+
+    Returns ``{name: {"problems": [...], "error": ...}}``. Large sequential
+    scans are problems even when approving.
+    """
+    from .scenarios import FIXTURE_QUERIES
+
+    fixtures = resolve_fixtures(FIXTURE_QUERIES)
+    table_rows = {engine: _table_rows(engine) for engine in db.engines.values()}
+    results = {}
+    for scenario in scenarios:
+        snapshot, seq_scans, error = build_snapshot(scenario, fixtures, table_rows)
+        problems = [f"sequential scan of {scan}" for scan in seq_scans]
+        if approve:
+            write_snapshot(scenario.name, snapshot)
+        else:
+            problems += compare(snapshot, load_snapshot(scenario.name))
+        results[scenario.name] = {
+            "statements": len(snapshot["statements"]),
+            "problems": problems,
+            "error": error,
+        }
+    return results
+
+
+SEED_STATEMENTS = [
+    # The first `merchants` users are merchants, the rest rent
+    """
+    INSERT INTO users (email, password_hash, name, surname, role)
+    SELECT 'user' || g || '@plans.test', :password_hash, 'Seed', 'User ' || g,
+           CASE WHEN g <= :merchants THEN 'MERCHANT' ELSE 'USER' END::userrole
+    FROM generate_series(1, :users) g
+    """,
+    """
+    INSERT INTO merchants (company_name, user_id)
+    SELECT 'Company ' || id, id FROM users WHERE role = 'MERCHANT' ORDER BY id
+    """,
+    """
+    INSERT INTO merchant_shards (merchant_id, shard, updated_at)
+    SELECT id, 'default', now() FROM merchants
+    """,
+    # Skewed fleets: a few merchants own most cars, as in production
+    """
+    INSERT INTO cars (make, model, year, status, price_per_hour, merchant_id)
+    SELECT (ARRAY['Toyota','BMW','Audi','Ford','Tesla','Honda','Kia','Mazda',
+                  'Volvo','Fiat'])[1 + g % 10],
+           'Model ' || (g / 10) % 8,
+           2010 + g % 15,
+           CASE WHEN g % 10 = 0 THEN 'RENTED' ELSE 'AVAILABLE' END::carstatus,
+           10 + (g * 7) % 190,
+           m.first_id + floor(m.total * power((g % 997) / 997.0, 3))::int
+    FROM generate_series(1, :cars) g,
+         (SELECT min(id) AS first_id, count(*) AS total FROM merchants) m
+    """,
+    # Closed rentals spread over two years
+    """
+    INSERT INTO rentals (user_id, car_id, rental_date, return_date, total_fee)
+    SELECT u.first_id + (g * 7919) % u.total,
+           c.first_id + (g * 104729) % c.total,
+           now() - interval '730 days' * ((g % 100003) / 100003.0) - interval '2 days',
+           now() - interval '730 days' * ((g % 100003) / 100003.0) - interval '2 days'
+               + interval '1 hour' * (1 + g % 48),
+           (1 + g % 48) * 25
+    FROM generate_series(CAST(1 AS bigint), :rentals) g,
+         (SELECT min(id) AS first_id, count(*) AS total FROM users
+          WHERE role = 'USER') u,
+         (SELECT min(id) AS first_id, count(*) AS total FROM cars) c
+    """,
+    # One open rental for every rented car, each by a different user
+    """
+    INSERT INTO rentals (user_id, car_id, rental_date)
+    SELECT u.first_id + rented.n - 1, rented.id, now() - interval '1 hour' * rented.n
+    FROM (SELECT id, row_number() OVER (ORDER BY id) AS n FROM cars
+          WHERE status = 'RENTED') rented,
+         (SELECT min(id) AS first_id, count(*) AS total FROM users
+          WHERE role = 'USER') u
+    WHERE rented.n <= u.total
+    """,
+]
+
+
+def seed_database(users, merchants, cars, rentals):
+    """Fill an empty database with a deterministic, production-shaped data set."""
+    if merchants >= users:
+        raise PlanError("There must be more users than merchants")
+    if db.session.execute(text("SELECT EXISTS (SELECT 1 FROM cars)")).scalar():
+        raise PlanError("The database already has cars; seed an empty database")
+    params = {
+        "users": users,
+        "merchants": merchants,
+        "cars": cars,
+        "rentals": rentals,
+        "password_hash": bcrypt.generate_password_hash(SEED_PASSWORD).decode("utf-8"),
+    }
+    try:
+        if partitions.is_partitioned():
+            existing = set(partitions.list_partitions())
+            first = partitions.add_months(partitions.month_start(date.today()), -25)
+            for offset in range(27):
+                month = partitions.add_months(first, offset)
+                if month not in existing:
+                    partitions.create_partition(month)
+        for statement in SEED_STATEMENTS:
+            db.session.execute(text(statement), params)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Vacuum too, so plans start out as they settle after autovacuum. The
+    # largest sample reads every seeded row, so statistics, and with them the
+    # plans, come out the same on every freshly seeded database.
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text("SET default_statistics_target = 10000"))
+        connection.execute(text("VACUUM ANALYZE"))
@@ -0,0 +1,18 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .services import PROFILE_HEADER, issue_token
+
+profiling_cli = AppGroup("profiling", help="On-demand request profiling.")
+
+
+@profiling_cli.command("token")
+def token_command():
+    """Print a header that profiles a request and unlocks /profiles."""
+    secret = current_app.config["PROFILING_SECRET"]
+    if not secret:
+        raise click.ClickException("PROFILING_SECRET is not set")
+    max_age = current_app.config["PROFILING_TOKEN_MAX_AGE"]
+    click.echo(f"{PROFILE_HEADER}: {issue_token(secret)}")
+    click.echo(f"Valid for {max_age} seconds", err=True)
@@ -0,0 +1,75 @@
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request, send_file
+
+from app.utils.decorators import not_batchable
+
+from .services import (
+    PROFILE_HEADER,
+    PROFILE_MIMETYPES,
+    ProfileNotFoundError,
+    profile_ring,
+    verify_token,
+)
+
+profiling = Blueprint("profiling", __name__)
+
+
+def profiling_admin_required(view):
+    """Only holders of ``PROFILING_SECRET`` may read profiles; hidden when disabled."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        if not config["PROFILING_ENABLED"] or not config["PROFILING_SECRET"]:
+            return jsonify({"error": "Not found"}), 404
+        if not verify_token(
+            request.headers.get(PROFILE_HEADER),
+            config["PROFILING_SECRET"],
+            config["PROFILING_TOKEN_MAX_AGE"],
+        ):
+            return (
+                jsonify({"error": f"A valid {PROFILE_HEADER} header is required"}),
+                403,
+            )
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@profiling.route("/", methods=["GET"])
+@profiling_admin_required
+def list_profiles():
+    try:
+        return jsonify(profile_ring(current_app.config).list()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@profiling.route("/<profile_id>", methods=["GET"])
+@profiling_admin_required
+def get_profile(profile_id):
+    try:
+        return jsonify(profile_ring(current_app.config).get(profile_id)), 200
+    except ProfileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@profiling.route("/<profile_id>/download", methods=["GET"])
+@not_batchable
+@profiling_admin_required
+def download_profile(profile_id):
+    try:
+        path, profile_format = profile_ring(current_app.config).data_path(profile_id)
+        return send_file(
+            path,
+            mimetype=PROFILE_MIMETYPES[profile_format],
+            as_attachment=True,
+            download_name=f"{profile_id}.{profile_format}",
+        )
+    except ProfileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,383 @@
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from itsdangerous import BadSignature, SignatureExpired, TimestampSigner
+from sqlalchemy import event
+
+from app.extensions import db
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_PATTERN = re.compile(r"^\d{13}-[0-9a-f]{8}$")
+PROFILE_MIMETYPES = {"prof": "application/octet-stream", "html": "text/html"}
+SAMPLING_INTERVAL = 0.001
+TOP_FUNCTIONS = 25
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLASK_JSON = os.path.join("flask", "json")
+
+# SQL timings for the request being profiled on this thread, if any
+_recording = ContextVar("profiling_recording", default=None)
+
+
+class ProfilingError(Exception):
+    pass
+
+
+class ProfileNotFoundError(ProfilingError):
+    pass
+
+
+def _signer(secret):
+    return TimestampSigner(secret, salt="profiling")
+
+
+def issue_token(secret):
+    return _signer(secret).sign("profile").decode()
+
+
+def verify_token(value, secret, max_age):
+    if not value or not secret:
+        return False
+    try:
+        _signer(secret).unsign(value, max_age=max_age)
+    except (BadSignature, SignatureExpired):
+        return False
+    return True
+
+
+def is_serialization(file_path, function):
+    """``to_dict`` methods in this app and Flask's JSON encoding."""
+    if function == "to_dict" and file_path.startswith(APP_ROOT):
+        return True
+    return FLASK_JSON in file_path and function in ("jsonify", "response", "dumps")
+
+
+class Recording:
+    def __init__(self):
+        self.sql_seconds = 0.0
+        self.statements = 0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _recording.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recording = _recording.get()
+    started = conn.info.get("profiling_started")
+    if recording is not None and started:
+        recording.sql_seconds += time.perf_counter() - started.pop()
+        recording.statements += 1
+
+
+class CProfileRun:
+    extension = "prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.stats = pstats.Stats(self.profile)
+
+    def serialization_seconds(self):
+        # Time entering serialization from outside it, so nested to_dict calls count once
+        total = 0.0
+        for function, (_, _, _, _, callers) in self.stats.stats.items():
+            if not is_serialization(function[0], function[2]):
+                continue
+            for caller, (_, _, _, cumulative) in callers.items():
+                if not is_serialization(caller[0], caller[2]):
+                    total += cumulative
+        return total
+
+    def top_functions(self):
+        rows = sorted(
+            self.stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )
+        return [
+            {
+                "function": f"{name} ({os.path.basename(path)}:{line})",
+                "calls": calls,
+                "own_ms": round(own * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+            for (path, line, name), (_, calls, own, cumulative, _) in rows[
+                :TOP_FUNCTIONS
+            ]
+        ]
+
+    def dump(self):
+        # Same bytes as Stats.dump_stats, readable by pstats and snakeviz
+        return marshal.dumps(self.stats.stats)
+
+
+class SamplingRun:
+    extension = "html"
+
+    def __init__(self):
+        self.profiler = SamplingProfiler(interval=SAMPLING_INTERVAL)
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def serialization_seconds(self):
+        total, pending = 0.0, [self.profiler.last_session.root_frame()]
+        while pending:
+            frame = pending.pop()
+            if frame is None:
+                continue
+            if is_serialization(frame.file_path or "", frame.function or ""):
+                total += frame.time
+            else:
+                pending.extend(frame.children)
+        return total
+
+    def top_functions(self):
+        return None
+
+    def dump(self):
+        return self.profiler.output_html().encode()
+
+
+class ProfileRing:
+    """The newest ``max_profiles`` profiles, one data file and one JSON summary each."""
+
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _summary_path(self, profile_id):
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def save(self, summary, data, extension):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        summary = {"id": profile_id, "format": extension, **summary}
+        with open(os.path.join(self.directory, f"{profile_id}.{extension}"), "wb") as f:
+            f.write(data)
+        # Summaries appear last and atomically; listing only trusts them
+        temporary = self._summary_path(profile_id) + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(summary, f)
+        os.replace(temporary, self._summary_path(profile_id))
+        self._prune()
+        return profile_id
+
+    def _ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[:-5]
+            for name in os.listdir(self.directory)
+            if name.endswith(".json") and PROFILE_ID_PATTERN.match(name[:-5])
+        )
+
+    def _prune(self):
+        ids = self._ids()
+        for profile_id in ids[: max(0, len(ids) - self.max_profiles)]:
+            for extension in ["json", *PROFILE_MIMETYPES]:
+                try:
+                    os.remove(os.path.join(self.directory, f"{profile_id}.{extension}"))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, profile_id):
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            raise ProfileNotFoundError("Profile not found")
+        try:
+            with open(self._summary_path(profile_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ProfileNotFoundError("Profile not found")
+
+    def list(self):
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            try:
+                summary = self.get(profile_id)
+            except ProfileNotFoundError:
+                continue  # pruned by another worker meanwhile
+            summary.pop("top_functions", None)
+            summaries.append(summary)
+        return summaries
+
+    def data_path(self, profile_id):
+        summary = self.get(profile_id)
+        path = os.path.join(self.directory, f"{profile_id}.{summary['format']}")
+        if not os.path.exists(path):
+            raise ProfileNotFoundError("Profile not found")
+        return path, summary["format"]
+
+
+def profile_ring(config):
+    return ProfileRing(config["PROFILING_DIR"], config["PROFILING_MAX_PROFILES"])
+
+
+class _ProfiledBody:
+    """A profiled response's body; the profile ends when the server closes it.
+
+    Chunks pass straight through, so streamed responses are not buffered.
+    With ``first_chunk_only`` the profile ends once the first chunk is ready.
+    """
+
+    def __init__(self, app_iter, finish, first_chunk_only=False):
+        self._app_iter = app_iter
+        self._finish = finish
+        self._first_chunk_only = first_chunk_only
+
+    def __iter__(self):
+        for chunk in self._app_iter:
+            if self._first_chunk_only:
+                self._finish()
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._app_iter, "close"):
+                self._app_iter.close()
+        finally:
+            self._finish()
+
+
+class ProfilingMiddleware:
+    """Profiles a request when it carries a valid signed header or is sampled.
+
+    Only one request per process is profiled at a time; others run
+    untouched. The profile covers producing the whole body, except for
+    event streams, which are profiled only until their first chunk is ready.
+    """
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.secret = config["PROFILING_SECRET"]
+        self.token_max_age = config["PROFILING_TOKEN_MAX_AGE"]
+        self.sample_rate = config["PROFILING_SAMPLE_RATE"]
+        self.use_sampling = (
+            config["PROFILER"] in ("auto", "pyinstrument")
+            and SamplingProfiler is not None
+        )
+        self.ring = profile_ring(config)
+        self._busy = threading.Lock()
+
+    def _trigger(self, environ):
+        if environ.get("PATH_INFO", "").startswith("/profiles"):
+            return None
+        header = environ.get("HTTP_" + PROFILE_HEADER.upper().replace("-", "_"))
+        if header is not None:
+            return (
+                "header"
+                if verify_token(header, self.secret, self.token_max_age)
+                else None
+            )
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def __call__(self, environ, start_response):
+        trigger = self._trigger(environ)
+        if trigger is None or not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        # Released once the profile is saved, which may be after this returns
+        return self._profiled(environ, start_response, trigger)
+
+    def _profiled(self, environ, start_response, trigger):
+        response = {}
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            response["status"] = int(status_line.split(" ", 1)[0])
+            response["event_stream"] = any(
+                name.lower() == "content-type" and value.startswith("text/event-stream")
+                for name, value in headers
+            )
+            return start_response(status_line, headers, exc_info)
+
+        recording = Recording()
+        token = _recording.set(recording)
+        run = SamplingRun() if self.use_sampling else CProfileRun()
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        finished = []
+
+        def finish(save=True):
+            if finished:
+                return
+            finished.append(True)
+            try:
+                total = time.perf_counter() - started
+                run.stop()
+                _recording.reset(token)
+                if save:
+                    self._save(
+                        environ,
+                        trigger,
+                        response.get("status"),
+                        run,
+                        recording,
+                        started_at,
+                        total,
+                    )
+            finally:
+                self._busy.release()
+
+        try:
+            app_iter = self.wsgi_app(environ, recording_start_response)
+        except BaseException:
+            finish(save=False)
+            raise
+        # Event streams stay open for minutes; profiling all of it would tie
+        # up the profiler
+        return _ProfiledBody(app_iter, finish, response.get("event_stream", False))
+
+    def _save(self, environ, trigger, status, run, recording, started_at, total):
+        serialization = run.serialization_seconds()
+        summary = {
+            "method": environ.get("REQUEST_METHOD"),
+            "path": environ.get("PATH_INFO"),
+            "query": environ.get("QUERY_STRING", ""),
+            "status": status,
+            "trigger": trigger,
+            "profiler": "pyinstrument" if self.use_sampling else "cProfile",
+            "started_at": started_at.isoformat(),
+            "total_ms": round(total * 1000, 3),
+            "sql_ms": round(recording.sql_seconds * 1000, 3),
+            "sql_statements": recording.statements,
+            "serialization_ms": round(serialization * 1000, 3),
+            "python_ms": round(
+                max(0.0, total - recording.sql_seconds - serialization) * 1000, 3
+            ),
+        }
+        top_functions = run.top_functions()
+        if top_functions is not None:
+            summary["top_functions"] = top_functions
+        self.ring.save(summary, run.dump(), run.extension)
+
+
+def init_profiling(app):
+    """Install the profiling middleware; with ``PROFILING_ENABLED`` off nothing is added."""
+    if not app.config["PROFILING_ENABLED"]:
+        return
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, app.config)
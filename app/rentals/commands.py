@@ -0,0 +1,48 @@
+import os
+
+import click
+from flask import current_app
+
+from app.sharding.routing import DEFAULT_SHARD, use_shard
+from . import partitions
+from .routes import rentals
+
+
+@rentals.cli.command("create-partitions")
+@click.option("--months-ahead", type=int, default=None)
+@click.option("--shard", default=DEFAULT_SHARD)
+def create_partitions_command(months_ahead, shard):
+    """Pre-create monthly rental partitions up to N months ahead."""
+    if months_ahead is None:
+        months_ahead = current_app.config["RENTAL_PARTITION_MONTHS_AHEAD"]
+    with use_shard(shard):
+        created = partitions.ensure_partitions(months_ahead)
+    for name in created:
+        click.echo(f"Created partition {name}")
+    if not created:
+        click.echo("All partitions already exist")
+
+
+@rentals.cli.command("archive-partitions")
+@click.option("--older-than-months", type=int, default=None)
+@click.option("--archive-dir", default=None)
+@click.option("--keep-detached", is_flag=True, default=False)
+@click.option("--shard", default=DEFAULT_SHARD)
+def archive_partitions_command(older_than_months, archive_dir, keep_detached, shard):
+    """Detach old rental partitions and write them to compressed CSV files."""
+    if older_than_months is None:
+        older_than_months = current_app.config["RENTAL_ARCHIVE_AFTER_MONTHS"]
+    if archive_dir is None:
+        archive_dir = current_app.config["RENTAL_ARCHIVE_DIR"]
+    if shard != DEFAULT_SHARD:
+        # Partition names repeat on every shard
+        archive_dir = os.path.join(archive_dir, shard)
+
+    with use_shard(shard):
+        archived, skipped = partitions.archive_partitions(
+            older_than_months, archive_dir, keep_detached=keep_detached
+        )
+    for path in archived:
+        click.echo(f"Archived {path}")
+    for name in skipped:
+        click.echo(f"Skipped {name}: it still has open rentals")
@@ -4,9 +4,22 @@ from ..extensions import db
 
 class Rental(db.Model):
     __tablename__ = "rentals"
+    __table_args__ = (
+        db.Index("ix_rentals_user_id_rental_date_id", "user_id", "rental_date", "id"),
+        db.Index("ix_rentals_user_id_total_fee_id", "user_id", "total_fee", "id"),
+        db.Index("ix_rentals_user_id_return_date_id", "user_id", "return_date", "id"),
+        db.Index("ix_rentals_car_id_rental_date", "car_id", "rental_date"),
+        db.Index("ix_rentals_rental_date_brin", "rental_date", postgresql_using="brin"),
+        db.Index(
+            "ix_rentals_user_id_active",
+            "user_id",
+            postgresql_where=db.text("return_date IS NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (rental_date)"},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
-    rental_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    rental_date = db.Column(db.DateTime, primary_key=True, default=datetime.utcnow)
     return_date = db.Column(db.DateTime, nullable=True)
     total_fee = db.Column(db.Numeric(10, 2), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
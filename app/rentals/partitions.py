@@ -0,0 +1,156 @@
+import gzip
+import os
+import re
+from datetime import date, datetime
+from sqlalchemy import text
+from ..extensions import db
+from ..sharding.routing import current_shard
+
+PARTITION_NAME_PATTERN = re.compile(r"^rentals_y(\d{4})m(\d{2})$")
+
+
+class PartitionError(Exception):
+    pass
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"rentals_y{month.year:04d}m{month.month:02d}"
+
+
+def list_partitions():
+    rows = db.session.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'rentals'"
+        )
+    ).scalars()
+
+    partitions = []
+    for name in rows:
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match:
+            partitions.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(partitions)
+
+
+def is_partitioned():
+    return bool(
+        db.session.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid "
+                "WHERE pg_class.relname = 'rentals'"
+            )
+        ).scalar()
+    )
+
+
+def create_partition(month):
+    """Create the partition for ``month`` and attach it to ``rentals``.
+
+    Rows that already landed in ``rentals_default`` for that month are moved
+    into the new table first, otherwise Postgres refuses the ATTACH.
+    """
+    name = partition_name(month)
+    lower = month.isoformat()
+    upper = add_months(month, 1).isoformat()
+
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE rentals INCLUDING DEFAULTS)"))
+    db.session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM rentals_default "
+            f"WHERE rental_date >= :lower AND rental_date < :upper RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"lower": lower, "upper": upper},
+    )
+    db.session.execute(
+        text(
+            f"ALTER TABLE rentals ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    )
+    return name
+
+
+def ensure_partitions(months_ahead, today=None):
+    if not is_partitioned():
+        raise PartitionError("The rentals table is not partitioned")
+
+    current_month = month_start(today or datetime.utcnow())
+    existing = set(list_partitions())
+
+    created = []
+    try:
+        for offset in range(months_ahead + 1):
+            month = add_months(current_month, offset)
+            if month not in existing:
+                created.append(create_partition(month))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return created
+
+
+def archive_partitions(older_than_months, archive_dir, keep_detached=False, today=None):
+    """Detach month partitions older than the cutoff and dump them as gzipped CSV.
+
+    A partition that still holds an open rental is skipped, so only closed
+    history ever leaves the live table.
+    """
+    if not is_partitioned():
+        raise PartitionError("The rentals table is not partitioned")
+
+    cutoff = add_months(month_start(today or datetime.utcnow()), -older_than_months)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    archived, skipped = [], []
+    for month in list_partitions():
+        if add_months(month, 1) > cutoff:
+            continue
+
+        name = partition_name(month)
+        open_rentals = db.session.execute(
+            text(f"SELECT count(*) FROM {name} WHERE return_date IS NULL")
+        ).scalar()
+        if open_rentals:
+            skipped.append(name)
+            continue
+
+        archive_path = os.path.join(archive_dir, f"{name}.csv.gz")
+        try:
+            db.session.execute(text(f"ALTER TABLE rentals DETACH PARTITION {name}"))
+            connection = db.session.connection(
+                bind_arguments={"shard_id": current_shard()}
+            )
+            cursor = connection.connection.cursor()
+            with gzip.open(archive_path, "wb") as archive_file:
+                cursor.copy_expert(
+                    f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)",
+                    archive_file,
+                )
+            if not keep_detached:
+                db.session.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            raise
+
+        archived.append(archive_path)
+
+    return archived, skipped
@@ -0,0 +1,29 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+CENTS = Decimal("0.01")
+SECONDS_PER_HOUR = Decimal(3600)
+
+
+def duration_to_hours(duration):
+    return Decimal(str(duration.total_seconds())) / SECONDS_PER_HOUR
+
+
+def calculate_fee(price_per_hour, hours):
+    """Fee for renting at ``price_per_hour`` for ``hours``, rounded to cents.
+
+    Both the return flow and the quote endpoint go through here, so any
+    future daily caps or discounts only need to be applied in one place.
+    """
+    return (price_per_hour * hours).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def quote_fees(prices, durations):
+    """Build the fee matrix for every price against every duration in hours.
+
+    ``prices`` maps car id to hourly price and the result maps car id to a
+    list of fees in the same order as ``durations``.
+    """
+    return {
+        car_id: [calculate_fee(price, hours) for hours in durations]
+        for car_id, price in prices.items()
+    }
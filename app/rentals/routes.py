@@ -1,14 +1,19 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 
-from app.utils.decorators import role_required
+from app.utils.decorators import not_batchable, role_required
+from app.utils.rate_limit import route_class
+from app.utils.idempotency import idempotent
 from app.auth.models import UserRole
+from app.exports.routes import export_response
+from app.exports.services import ExportError
 from . import services
 from .services import (
     UserAlreadyRentingError,
     CarNotAvailableError,
     CarNotFoundError,
     NoActiveRentalError,
+    RentalConflictError,
     ValidationError,
 )
 
@@ -18,12 +23,13 @@ rentals = Blueprint("rentals", __name__)
 @rentals.route("/rent/<int:car_id>", methods=["POST"])
 @login_required
 @role_required(UserRole.USER)
+@idempotent
 def rent_a_car(car_id):
     try:
         user_id = current_user.id
         new_rental = services.rent_a_car(user_id, car_id)
         return jsonify(new_rental.to_dict()), 201
-    except (UserAlreadyRentingError, CarNotAvailableError) as e:
+    except (UserAlreadyRentingError, CarNotAvailableError, RentalConflictError) as e:
         return jsonify({"error": str(e)}), 409
     except CarNotFoundError as e:
         return jsonify({"error": str(e)}), 404
@@ -34,6 +40,7 @@ def rent_a_car(car_id):
 @rentals.route("/return", methods=["POST"])
 @login_required
 @role_required(UserRole.USER)
+@idempotent
 def return_car():
     try:
         user_id = current_user.id
@@ -41,11 +48,26 @@ def return_car():
         return jsonify(completed_rental.to_dict()), 200
     except NoActiveRentalError as e:
         return jsonify({"error": str(e)}), 404
+    except RentalConflictError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@rentals.route("/quote", methods=["POST"])
+def quote_prices():
+    try:
+        data = request.get_json()
+        quotes = services.quote_prices(data)
+        return jsonify(quotes), 200
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @rentals.route("/user/history", methods=["GET"])
+@route_class("expensive")
 @login_required
 @role_required(UserRole.USER)
 def get_rental_history():
@@ -60,6 +82,7 @@ def get_rental_history():
 
 
 @rentals.route("/user/query", methods=["GET"])
+@route_class("expensive")
 @login_required
 @role_required(UserRole.USER)
 def query_user_rentals():
@@ -86,11 +109,12 @@ def query_user_rentals():
 
 
 @rentals.route("/merchant/history", methods=["GET"])
+@route_class("expensive")
 @login_required
 @role_required(UserRole.MERCHANT)
 def get_merchant_rental_history():
     try:
-        merchant_id = current_user.merchant_profile.id
+        merchant_id = current_user.merchant_id
         rentals = services.get_merchant_rental_history(merchant_id)
         return jsonify([rental.to_dict() for rental in rentals]), 200
 
@@ -101,11 +125,12 @@ def get_merchant_rental_history():
 
 
 @rentals.route("/merchant/query", methods=["GET"])
+@route_class("expensive")
 @login_required
 @role_required(UserRole.MERCHANT)
 def query_merchant_rentals():
     try:
-        merchant_id = current_user.merchant_profile.id
+        merchant_id = current_user.merchant_id
         query_params = request.args.to_dict()
 
         pagination_obj = services.query_merchant_rentals(merchant_id, query_params)
@@ -126,3 +151,36 @@ def query_merchant_rentals():
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@rentals.route("/merchant/utilization", methods=["GET"])
+@route_class("expensive")
+@login_required
+@role_required(UserRole.MERCHANT)
+def get_fleet_utilization():
+    try:
+        merchant_id = current_user.merchant_id
+        query_params = request.args.to_dict()
+        return jsonify(services.get_fleet_utilization(merchant_id, query_params)), 200
+
+    except CarNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@rentals.route("/merchant/export", methods=["GET"])
+@not_batchable
+@route_class("expensive")
+@login_required
+@role_required(UserRole.MERCHANT)
+def export_merchant_rentals():
+    try:
+        merchant_id = current_user.merchant_id
+        return export_response("merchant_rentals", merchant_id=merchant_id)
+    except (ValidationError, ExportError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
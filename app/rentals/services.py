@@ -1,9 +1,19 @@
 from decimal import Decimal, InvalidOperation
-from datetime import datetime
-from sqlalchemy import func, cast, Date
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import func
+from sqlalchemy.orm.exc import StaleDataError
 from ..extensions import db
 from .models import Rental
+from .pricing import calculate_fee, duration_to_hours, quote_fees
+from .utilization import fleet_utilization
 from app.cars.models import Car, CarStatus
+from app.availability.services import notify_car_change
+from app.events.services import record_event
+from app.exports.services import ExportSource
+from app.sharding.routing import merchant_shard, shard_of, use_shard
+from app.sharding.services import guard_merchant_writes, scatter
+from app.utils.filters import Filter, FilterSpec, lowered, param, sort_options
 
 
 class RentalError(Exception):
@@ -30,7 +40,88 @@ class ValidationError(RentalError):
     pass
 
 
+class RentalConflictError(RentalError):
+    pass
+
+
+def _parse_timezone(tz_name):
+    if not tz_name:
+        return timezone.utc
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f"Invalid timezone: '{tz_name}'")
+
+
+def _parse_rental_bound(value, tz, is_end):
+    value = value.strip()
+    if "T" in value:
+        # A "+hh:mm" offset arrives as a space once the query string is decoded
+        value = value.replace(" ", "+")
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        parsed = datetime.combine(day, datetime.min.time())
+        if is_end:
+            parsed += timedelta(days=1)
+    else:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValidationError(
+                f"Invalid date format: '{value}'. "
+                "Must be YYYY-MM-DD or an ISO 8601 datetime"
+            )
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_rental_date_range(query_params):
+    """Return ``(start, end)`` as naive UTC datetimes for a half-open range.
+
+    Plain dates cover whole days, so ``rental_date_end=2024-01-31`` becomes
+    ``< 2024-02-01 00:00``. Naive values are read in the ``timezone`` param
+    (default UTC). Comparing the raw column keeps the filter index-friendly.
+    """
+    start_value = query_params.get("rental_date_start")
+    end_value = query_params.get("rental_date_end")
+    if not start_value and not end_value:
+        return None, None
+
+    tz = _parse_timezone(query_params.get("timezone"))
+    start_time = _parse_rental_bound(start_value, tz, False) if start_value else None
+    end_time = _parse_rental_bound(end_value, tz, True) if end_value else None
+
+    if start_time is not None and end_time is not None and start_time >= end_time:
+        raise ValidationError("rental_date_start must be before rental_date_end")
+
+    return start_time, end_time
+
+
+# Car rows are versioned, so a rental that read a car just before someone
+# else changed it fails its flush instead of overwriting the change
+CONFLICT_ATTEMPTS = 3
+
+
+def _retry_on_conflict(operation, *args):
+    for _ in range(CONFLICT_ATTEMPTS):
+        try:
+            return operation(*args)
+        except StaleDataError:
+            db.session.rollback()
+    raise RentalConflictError("The car was changed by another request; try again")
+
+
 def rent_a_car(user_id, car_id):
+    return _retry_on_conflict(_rent_a_car, user_id, car_id)
+
+
+def _rent_a_car(user_id, car_id):
     active_rental = Rental.query.filter_by(user_id=user_id, return_date=None).first()
     if active_rental:
         raise UserAlreadyRentingError("User already has an active rental")
@@ -38,33 +129,48 @@ def rent_a_car(user_id, car_id):
     if not car:
         raise CarNotFoundError("Car not found")
 
+    with use_shard(shard_of(car)):
+        guard_merchant_writes(car.merchant_id)
+
     if car.status != CarStatus.AVAILABLE:
         raise CarNotAvailableError("This car is not available for rent")
 
     try:
         car.status = CarStatus.RENTED
-        new_rental = Rental(user_id=user_id, car_id=car_id)
+        new_rental = Rental(user_id=user_id, car=car)
         db.session.add(new_rental)
         db.session.add(car)
+        db.session.flush()
+        record_event(
+            "rental.started", car.merchant_id, new_rental.id, new_rental.to_dict()
+        )
+        notify_car_change("rented", car)
         db.session.commit()
 
         return new_rental
 
+    except StaleDataError:
+        raise
     except Exception as e:
         db.session.rollback()
         raise Exception(str(e))
 
 
 def return_car(user_id):
+    return _retry_on_conflict(_return_car, user_id)
+
+
+def _return_car(user_id):
     active_rental = Rental.query.filter_by(user_id=user_id, return_date=None).first()
     if not active_rental:
         raise NoActiveRentalError("User do not have an active rental to return")
 
     car = active_rental.car
+    with use_shard(shard_of(active_rental)):
+        guard_merchant_writes(car.merchant_id)
     return_time = datetime.utcnow()
-    rental_duration = return_time - active_rental.rental_date
-    total_hours = rental_duration.total_seconds() / 3600.0
-    total_fee = car.price_per_hour * Decimal(total_hours)
+    total_hours = duration_to_hours(return_time - active_rental.rental_date)
+    total_fee = calculate_fee(car.price_per_hour, total_hours)
 
     try:
         active_rental.return_date = return_time
@@ -72,20 +178,107 @@ def return_car(user_id):
         car.status = CarStatus.AVAILABLE
         db.session.add(active_rental)
         db.session.add(car)
+        db.session.flush()
+        record_event(
+            "rental.returned",
+            car.merchant_id,
+            active_rental.id,
+            active_rental.to_dict(),
+        )
+        notify_car_change("returned", car)
         db.session.commit()
 
         return active_rental
 
+    except StaleDataError:
+        raise
     except Exception as e:
         db.session.rollback()
         raise Exception(f"Database error on return: {e}")
 
 
+MAX_QUOTE_CARS = 100
+MAX_QUOTE_DURATIONS = 10
+MAX_QUOTE_HOURS = 366 * 24
+DURATION_UNITS = {"h": 1, "d": 24, "w": 168}
+
+
+def _parse_duration_hours(value):
+    if isinstance(value, bool):
+        raise ValidationError(f"Invalid duration: '{value}'")
+    try:
+        if isinstance(value, str) and value[-1:].lower() in DURATION_UNITS:
+            hours = Decimal(value[:-1]) * DURATION_UNITS[value[-1].lower()]
+        else:
+            hours = Decimal(str(value))
+    except (InvalidOperation, TypeError):
+        raise ValidationError(
+            f"Invalid duration: '{value}'. Use hours or a value like '3h', '1d', '1w'"
+        )
+    if not hours.is_finite() or hours <= 0:
+        raise ValidationError(f"Duration must be positive: '{value}'")
+    if hours > MAX_QUOTE_HOURS:
+        raise ValidationError(
+            f"Duration can be at most {MAX_QUOTE_HOURS} hours (366 days): '{value}'"
+        )
+    return hours
+
+
+def quote_prices(data):
+    if not data:
+        raise ValidationError("Request body cannot be empty")
+
+    car_ids = data.get("car_ids")
+    durations = data.get("durations")
+    if not isinstance(car_ids, list) or not car_ids:
+        raise ValidationError("car_ids must be a non-empty list")
+    if not isinstance(durations, list) or not durations:
+        raise ValidationError("durations must be a non-empty list")
+    if len(car_ids) > MAX_QUOTE_CARS:
+        raise ValidationError(f"At most {MAX_QUOTE_CARS} cars can be quoted at once")
+    if len(durations) > MAX_QUOTE_DURATIONS:
+        raise ValidationError(
+            f"At most {MAX_QUOTE_DURATIONS} durations can be quoted at once"
+        )
+
+    try:
+        car_ids = list(dict.fromkeys(int(car_id) for car_id in car_ids))
+    except (TypeError, ValueError):
+        raise ValidationError("car_ids must be integers")
+    hours = [_parse_duration_hours(duration) for duration in durations]
+
+    rows = db.session.execute(
+        db.select(Car.id, Car.price_per_hour, Car.status).where(Car.id.in_(car_ids))
+    ).all()
+    prices = {row.id: row.price_per_hour for row in rows}
+    statuses = {row.id: row.status for row in rows}
+    try:
+        fees = quote_fees(prices, hours)
+    except InvalidOperation:
+        # quantize() raises when a fee has more digits than the context allows
+        raise ValidationError("Durations are too large to quote")
+
+    labels = [str(duration) for duration in durations]
+    quotes = [
+        {
+            "car_id": car_id,
+            "status": statuses[car_id].value,
+            "price_per_hour": str(prices[car_id]),
+            "quotes": {label: str(fee) for label, fee in zip(labels, fees[car_id])},
+        }
+        for car_id in car_ids
+        if car_id in prices
+    ]
+    missing_car_ids = [car_id for car_id in car_ids if car_id not in prices]
+
+    return {"quotes": quotes, "missing_car_ids": missing_car_ids}
+
+
 def get_rental_history(user_id):
-    rentals = (
-        Rental.query.filter_by(user_id=user_id)
-        .order_by(Rental.rental_date.desc())
-        .all()
+    rentals = scatter(
+        db.select(Rental).where(Rental.user_id == user_id).order_by(*RENTAL_ORDER),
+        Rental.__mapper__,
+        RENTAL_ORDER,
     )
 
     if not rentals:
@@ -94,108 +287,103 @@ def get_rental_history(user_id):
     return rentals
 
 
-def query_user_rentals(user_id, query_params):
-    query = Rental.query.filter_by(user_id=user_id)
+RENTAL_FILTERS = [
+    Filter("car_id", param("car_id", int), lambda v: Rental.car_id == v),
+    Filter("min_fee", param("min_fee", Decimal), lambda v: Rental.total_fee >= v),
+    Filter("max_fee", param("max_fee", Decimal), lambda v: Rental.total_fee <= v),
+    Filter(
+        "status",
+        param("status", lowered),
+        choices={
+            "active": Rental.return_date.is_(None),
+            "completed": Rental.return_date.is_not(None),
+        },
+    ),
+    Filter(
+        "rental_date_start",
+        lambda query_params: parse_rental_date_range(query_params)[0],
+        lambda v: Rental.rental_date >= v,
+    ),
+    Filter(
+        "rental_date_end",
+        lambda query_params: parse_rental_date_range(query_params)[1],
+        lambda v: Rental.rental_date < v,
+    ),
+]
+
+RENTAL_ORDER = (Rental.rental_date.desc(), Rental.id.desc())
+RENTAL_SORTS = sort_options(
+    Rental.id, Rental.rental_date, Rental.return_date, Rental.total_fee
+)
+
+USER_RENTALS = FilterSpec(
+    "query_user_rentals",
+    Rental,
+    RENTAL_FILTERS
+    + [
+        Filter(
+            "make",
+            param("make", lowered),
+            lambda v: func.lower(Car.make) == v,
+            join=Car,
+        ),
+        Filter(
+            "model",
+            param("model", lowered),
+            lambda v: func.lower(Car.model) == v,
+            join=Car,
+        ),
+        Filter("year", param("year", int), lambda v: Car.year == v, join=Car),
+        Filter(
+            "max_price_per_hour",
+            param("max_price_per_hour", Decimal),
+            lambda v: Car.price_per_hour <= v,
+            join=Car,
+        ),
+        Filter(
+            "min_price_per_hour",
+            param("min_price_per_hour", Decimal),
+            lambda v: Car.price_per_hour >= v,
+            join=Car,
+        ),
+    ],
+    ValidationError,
+    scope=[("user_id", lambda v: Rental.user_id == v)],
+    order_by=RENTAL_ORDER,
+    sorts=RENTAL_SORTS,
+)
+
+MERCHANT_RENTALS = FilterSpec(
+    "query_merchant_rentals",
+    Rental,
+    RENTAL_FILTERS
+    + [Filter("user_id", param("user_id", int), lambda v: Rental.user_id == v)],
+    ValidationError,
+    scope=[("merchant_id", lambda v: Car.merchant_id == v)],
+    joins=[Car],
+    order_by=RENTAL_ORDER,
+    sorts=RENTAL_SORTS,
+)
 
-    try:
-        page_number = int(query_params.get("page", 1))
-        per_page = int(query_params.get("per_page", 10))
-    except ValueError:
-        raise ValidationError("Invalid page or per_page parameter. Must be an integer")
-    if page_number < 1:
-        raise ValidationError("Page number must be 1 or greater")
-    if per_page < 1:
-        raise ValidationError("Per_page must be 1 or greater")
 
-    car_filters = {"make", "model", "year", "min_price_per_hour", "max_price_per_hour"}
-    if any(k in query_params and query_params.get(k) for k in car_filters):
-        query = query.join(Car)
-
-    try:
-        if "car_id" in query_params and query_params.get("car_id"):
-            query = query.filter(Rental.car_id == int(query_params.get("car_id")))
-
-        if "min_fee" in query_params and query_params.get("min_fee"):
-            query = query.filter(
-                Rental.total_fee >= Decimal(query_params.get("min_fee"))
-            )
-        if "max_fee" in query_params and query_params.get("max_fee"):
-            query = query.filter(
-                Rental.total_fee <= Decimal(query_params.get("max_fee"))
-            )
-
-        if "status" in query_params and query_params.get("status"):
-            status = query_params.get("status").lower()
-            if status == "active":
-                query = query.filter(Rental.return_date == None)
-            elif status == "completed":
-                query = query.filter(Rental.return_date != None)
-            else:
-                raise ValidationError("Invalid status. Must be 'active' or 'completed'")
-
-        def parse_date(date_str):
-            try:
-                return datetime.strptime(date_str, "%Y-%m-%d").date()
-            except ValueError:
-                raise ValidationError(
-                    f"Invalid date format: '{date_str}'. Must be YYYY-MM-DD"
-                )
-
-        if "rental_date_start" in query_params and query_params.get(
-            "rental_date_start"
-        ):
-            start_date = parse_date(query_params.get("rental_date_start"))
-            query = query.filter(cast(Rental.rental_date, Date) >= start_date)
-
-        if "rental_date_end" in query_params and query_params.get("rental_date_end"):
-            end_date = parse_date(query_params.get("rental_date_end"))
-            query = query.filter(cast(Rental.rental_date, Date) <= end_date)
-
-        if "make" in query_params and query_params.get("make"):
-            query = query.filter(
-                func.lower(Car.make) == query_params.get("make").lower()
-            )
-        if "model" in query_params and query_params.get("model"):
-            query = query.filter(
-                func.lower(Car.model) == query_params.get("model").lower()
-            )
-        if "year" in query_params and query_params.get("year"):
-            query = query.filter(Car.year == int(query_params.get("year")))
-
-        if "max_price_per_hour" in query_params and query_params.get(
-            "max_price_per_hour"
-        ):
-            max_price = Decimal(query_params.get("max_price_per_hour"))
-            query = query.filter(Car.price_per_hour <= max_price)
-
-        if "min_price_per_hour" in query_params and query_params.get(
-            "min_price_per_hour"
-        ):
-            min_price = Decimal(query_params.get("min_price_per_hour"))
-            query = query.filter(Car.price_per_hour >= min_price)
-
-    except (ValueError, TypeError, InvalidOperation) as e:
-        db.session.rollback()
-        raise ValidationError(f"Invalid filter data type: {e}")
-
-    paginated_rentals = query.order_by(Rental.rental_date.desc()).paginate(
-        page=page_number, per_page=per_page, error_out=False
-    )
+def query_user_rentals(user_id, query_params):
+    paginated_rentals = USER_RENTALS.paginate(query_params, user_id=user_id)
 
-    if not paginated_rentals.items and page_number == 1:
+    if not paginated_rentals.items and paginated_rentals.page == 1:
         raise CarNotFoundError("No rentals found matching your criteria")
 
     return paginated_rentals
 
 
 def get_merchant_rental_history(merchant_id):
-    rentals = (
-        db.session.query(Rental)
-        .join(Car)
-        .filter(Car.merchant_id == merchant_id)
-        .order_by(Rental.rental_date.desc())
-        .all()
-    )
+    with merchant_shard(merchant_id):
+        rentals = (
+            db.session.query(Rental)
+            .join(Car)
+            .filter(Car.merchant_id == merchant_id)
+            .order_by(*RENTAL_ORDER)
+            .all()
+        )
 
     if not rentals:
         raise CarNotFoundError("No rental history found for your cars")
@@ -204,70 +392,66 @@ def get_merchant_rental_history(merchant_id):
 
 
 def query_merchant_rentals(merchant_id, query_params):
-    query = db.session.query(Rental).join(Car).filter(Car.merchant_id == merchant_id)
-
-    try:
-        page_number = int(query_params.get("page", 1))
-        per_page = int(query_params.get("per_page", 10))
-    except ValueError:
-        raise ValidationError("Invalid page or per_page parameter. Must be an integer")
-    if page_number < 1:
-        raise ValidationError("Page number must be 1 or greater")
-    if per_page < 1:
-        raise ValidationError("Per_page must be 1 or greater")
-
-    try:
-        if "car_id" in query_params and query_params.get("car_id"):
-            query = query.filter(Rental.car_id == int(query_params.get("car_id")))
-
-        if "user_id" in query_params and query_params.get("user_id"):
-            query = query.filter(Rental.user_id == int(query_params.get("user_id")))
-
-        if "min_fee" in query_params and query_params.get("min_fee"):
-            query = query.filter(
-                Rental.total_fee >= Decimal(query_params.get("min_fee"))
-            )
-        if "max_fee" in query_params and query_params.get("max_fee"):
-            query = query.filter(
-                Rental.total_fee <= Decimal(query_params.get("max_fee"))
-            )
-
-        if "status" in query_params and query_params.get("status"):
-            status = query_params.get("status").lower()
-            if status == "active":
-                query = query.filter(Rental.return_date == None)
-            elif status == "completed":
-                query = query.filter(Rental.return_date != None)
-            else:
-                raise ValidationError("Invalid status. Must be 'active' or 'completed'")
-
-        def parse_date(date_str):
-            try:
-                return datetime.strptime(date_str, "%Y-%m-%d").date()
-            except ValueError:
-                raise ValidationError(
-                    f"Invalid date format: '{date_str}'. Must be YYYY-MM-DD"
-                )
-
-        if "rental_date_start" in query_params and query_params.get(
-            "rental_date_start"
-        ):
-            start_date = parse_date(query_params.get("rental_date_start"))
-            query = query.filter(cast(Rental.rental_date, Date) >= start_date)
-
-        if "rental_date_end" in query_params and query_params.get("rental_date_end"):
-            end_date = parse_date(query_params.get("rental_date_end"))
-            query = query.filter(cast(Rental.rental_date, Date) <= end_date)
-
-    except (ValueError, TypeError, InvalidOperation) as e:
-        db.session.rollback()
-        raise ValidationError(f"Invalid filter data type: {e}")
+    with merchant_shard(merchant_id):
+        paginated_rentals = MERCHANT_RENTALS.paginate(
+            query_params, merchant_id=merchant_id
+        )
 
-    paginated_rentals = query.order_by(Rental.rental_date.desc()).paginate(
-        page=page_number, per_page=per_page, error_out=False
-    )
-
-    if not paginated_rentals.items and page_number == 1:
+    if not paginated_rentals.items and paginated_rentals.page == 1:
         raise CarNotFoundError("No rentals found for your cars")
 
     return paginated_rentals
+
+
+DEFAULT_UTILIZATION_DAYS = 30
+MAX_UTILIZATION_DAYS = 1096
+
+
+def get_fleet_utilization(merchant_id, query_params):
+    """Occupancy of the merchant's cars over ``start``..``end`` (default: 30 days).
+
+    Bounds are read like the rental date filters, in the ``timezone`` param,
+    which also sets the days and hours of the heatmap.
+    """
+    tz = _parse_timezone(query_params.get("timezone"))
+    now = datetime.utcnow()
+    end_value = query_params.get("end")
+    if end_value:
+        end = _parse_rental_bound(end_value, tz, True)
+    else:
+        # Round up to the hour so repeated requests share a cache entry
+        end = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    start_value = query_params.get("start")
+    if start_value:
+        start = _parse_rental_bound(start_value, tz, False)
+    else:
+        start = end - timedelta(days=DEFAULT_UTILIZATION_DAYS)
+
+    if start >= end:
+        raise ValidationError("start must be before end")
+    if start >= now:
+        raise ValidationError("start must be in the past")
+    if end - start > timedelta(days=MAX_UTILIZATION_DAYS):
+        raise ValidationError(
+            f"The window can be at most {MAX_UTILIZATION_DAYS} days long"
+        )
+
+    with merchant_shard(merchant_id):
+        report = fleet_utilization(merchant_id, start, end, tz)
+    if report is None:
+        raise CarNotFoundError("No cars found in your listings")
+    return report
+
+
+MERCHANT_RENTALS_EXPORT = ExportSource(
+    "merchant_rentals",
+    MERCHANT_RENTALS,
+    [
+        Rental.id,
+        Rental.user_id,
+        Rental.car_id,
+        Rental.rental_date,
+        Rental.return_date,
+        Rental.total_fee,
+    ],
+)
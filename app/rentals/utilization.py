@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from flask import current_app
+
+from ..extensions import db
+from app.cars.models import Car
+from app.utils.arrays import copy_columns, copy_row_dtype
+
+HOURS_PER_WEEK = 168
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# Binary COPY timestamps are microseconds since this instant
+PG_EPOCH = datetime(2000, 1, 1)
+MICROSECONDS_PER_HOUR = 3_600_000_000
+
+# Open rentals end at 'infinity' so no column is NULL
+INTERVAL_ROW = copy_row_dtype(("car_id", ">i4"), ("start", ">i8"), ("end", ">i8"))
+
+INTERVALS_QUERY = (
+    "SELECT r.car_id, r.rental_date, COALESCE(r.return_date, 'infinity') "
+    "FROM rentals r JOIN cars c ON c.id = r.car_id "
+    "WHERE c.merchant_id = %(merchant_id)s AND r.rental_date < %(end)s "
+    "AND (r.return_date IS NULL OR r.return_date > %(start)s)"
+)
+
+
+class UtilizationCache:
+    """Thread-safe LRU of utilization reports that expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, report):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _cache():
+    config = current_app.config
+    return current_app.extensions.setdefault(
+        "utilization_cache",
+        UtilizationCache(
+            config["UTILIZATION_CACHE_MAX_ENTRIES"], config["UTILIZATION_CACHE_SECONDS"]
+        ),
+    )
+
+
+def _microseconds(value):
+    return (value - PG_EPOCH) // timedelta(microseconds=1)
+
+
+def load_fleet(merchant_id):
+    rows = db.session.execute(
+        db.select(Car.id, Car.make, Car.model)
+        .where(Car.merchant_id == merchant_id)
+        .order_by(Car.id)
+    ).all()
+    return np.array([row.id for row in rows], dtype=np.int64), rows
+
+
+def load_intervals(merchant_id, start, end):
+    """``(car_ids, starts, ends)`` of rentals overlapping ``[start, end)``.
+
+    Times are microseconds since ``PG_EPOCH``; open rentals end at the int64
+    maximum.
+    """
+    columns = copy_columns(
+        INTERVALS_QUERY,
+        {"merchant_id": merchant_id, "start": start, "end": end},
+        INTERVAL_ROW,
+    )
+    return columns["car_id"], columns["start"], columns["end"]
+
+
+def _hours_by_hour(starts, ends, hours):
+    """Total length of ``[starts, ends)`` falling in each of ``hours`` unit buckets.
+
+    Bounds are float hours in ``[0, hours]``. Partial first and last hours are
+    added directly; the whole hours in between go through a difference array.
+    """
+    first = np.floor(starts).astype(np.intp)
+    last = np.floor(ends).astype(np.intp)
+    same = first == last
+    spans = ~same
+    total = np.bincount(
+        first,
+        weights=np.where(same, ends - starts, first + 1 - starts),
+        minlength=hours + 1,
+    )
+    total += np.bincount(
+        last[spans], weights=ends[spans] - last[spans], minlength=hours + 1
+    )
+    steps = np.bincount(first[spans] + 1, minlength=hours + 1) - np.bincount(
+        last[spans], minlength=hours + 1
+    )
+    return (total + np.cumsum(steps))[:hours]
+
+
+def _hour_of_week(first_hour, hours, tz):
+    """Local Monday-based hour of the week for each UTC hour after ``first_hour``."""
+    utc_start = datetime(2000, 1, 1, tzinfo=timezone.utc) + timedelta(hours=first_hour)
+    slots = np.empty(hours, dtype=np.intp)
+    for hour in range(hours):
+        local = (utc_start + timedelta(hours=hour)).astimezone(tz)
+        slots[hour] = local.weekday() * 24 + local.hour
+    return slots
+
+
+def _percent(part, whole):
+    return np.round(
+        np.divide(part * 100, whole, out=np.zeros_like(part), where=whole > 0), 2
+    )
+
+
+def compute_utilization(car_ids, rental_car_ids, starts, ends, start, end, tz):
+    """Per-car occupancy and an hour-of-week heatmap over ``[start, end)``.
+
+    ``car_ids`` is sorted; the rental arrays are in ``load_intervals`` units.
+    """
+    window_start, window_end = _microseconds(start), _microseconds(end)
+    first_hour = window_start // MICROSECONDS_PER_HOUR
+    origin = first_hour * MICROSECONDS_PER_HOUR
+    hours = -(-(window_end - origin) // MICROSECONDS_PER_HOUR)
+
+    # Clip to the window in integer microseconds, then work in float hours
+    starts = (np.maximum(starts, window_start) - origin) / MICROSECONDS_PER_HOUR
+    ends = (np.minimum(ends, window_end) - origin) / MICROSECONDS_PER_HOUR
+    overlapping = starts < ends
+    starts, ends = starts[overlapping], ends[overlapping]
+    car_index = np.searchsorted(car_ids, rental_car_ids[overlapping])
+
+    window_hours = (window_end - window_start) / MICROSECONDS_PER_HOUR
+    rented_by_car = np.bincount(
+        car_index, weights=ends - starts, minlength=len(car_ids)
+    )
+    rentals_by_car = np.bincount(car_index, minlength=len(car_ids))
+
+    bucket = np.arange(hours)
+    window_bounds = (
+        np.array([window_start, window_end]) - origin
+    ) / MICROSECONDS_PER_HOUR
+    open_share = np.clip(
+        np.minimum(bucket + 1, window_bounds[1]) - np.maximum(bucket, window_bounds[0]),
+        0,
+        1,
+    )
+    slots = _hour_of_week(first_hour, hours, tz)
+    rented_by_slot = np.bincount(
+        slots, weights=_hours_by_hour(starts, ends, hours), minlength=HOURS_PER_WEEK
+    )
+    capacity_by_slot = np.bincount(
+        slots, weights=open_share, minlength=HOURS_PER_WEEK
+    ) * len(car_ids)
+
+    return {
+        "window_hours": window_hours,
+        "rented_by_car": rented_by_car,
+        "rentals_by_car": rentals_by_car,
+        "occupancy_by_car": np.round(rented_by_car * 100 / window_hours, 2),
+        "heatmap": _percent(rented_by_slot, capacity_by_slot).reshape(7, 24),
+    }
+
+
+def fleet_utilization(merchant_id, start, end, tz):
+    """Utilization report for a merchant's fleet, cached per merchant and window.
+
+    Rentals still open count as rented up to now, and the window is cut at now.
+    """
+    key = (merchant_id, start, end, str(tz))
+    cache = _cache()
+    report = cache.get(key)
+    if report is not None:
+        return report
+
+    end = min(end, datetime.utcnow())
+    car_ids, cars = load_fleet(merchant_id)
+    if not cars:
+        return None
+    rental_car_ids, starts, ends = load_intervals(merchant_id, start, end)
+    result = compute_utilization(car_ids, rental_car_ids, starts, ends, start, end, tz)
+
+    rented = result["rented_by_car"]
+    order = np.lexsort((car_ids, result["occupancy_by_car"]))
+    fleet_hours = result["window_hours"] * len(cars)
+    report = {
+        "window": {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "timezone": str(tz),
+            "hours": round(result["window_hours"], 2),
+        },
+        "fleet": {
+            "cars": len(cars),
+            "idle_cars": int((rented == 0).sum()),
+            "rented_hours": round(float(rented.sum()), 2),
+            "occupancy_pct": round(float(rented.sum()) * 100 / fleet_hours, 2),
+        },
+        "cars": [
+            {
+                "car_id": cars[index].id,
+                "make": cars[index].make,
+                "model": cars[index].model,
+                "rentals": int(result["rentals_by_car"][index]),
+                "rented_hours": round(float(rented[index]), 2),
+                "occupancy_pct": float(result["occupancy_by_car"][index]),
+            }
+            for index in order.tolist()
+        ],
+        "heatmap": {
+            "days": WEEKDAYS,
+            "occupancy_pct": result["heatmap"].tolist(),
+        },
+    }
+    cache.put(key, report)
+    return report
@@ -0,0 +1,17 @@
+import json
+
+import click
+from flask.cli import AppGroup
+
+from . import services
+
+repricing_cli = AppGroup("repricing", help="Demand-based repricing.")
+
+
+@repricing_cli.command("run")
+@click.option("--dry-run", is_flag=True, default=False)
+@click.option("--merchant-id", type=int, default=None)
+def run_command(dry_run, merchant_id):
+    """Reprice opted-in merchants' cars from current demand."""
+    report = services.run_repricing(dry_run=dry_run, merchant_id=merchant_id)
+    click.echo(json.dumps(report, indent=2))
@@ -0,0 +1,73 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class RepricingRule(db.Model):
+    """A merchant's opt-in to demand pricing for all cars or one make/model."""
+
+    __tablename__ = "repricing_rules"
+    __table_args__ = (db.Index("ix_repricing_rules_merchant_id", "merchant_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    merchant_id = db.Column(db.Integer, db.ForeignKey("merchants.id"), nullable=False)
+    # Lower-cased; None matches every make or model
+    make = db.Column(db.String(50), nullable=True)
+    model = db.Column(db.String(50), nullable=True)
+    min_price = db.Column(db.Numeric(10, 2), nullable=False)
+    max_price = db.Column(db.Numeric(10, 2), nullable=False)
+    target_rented_share = db.Column(db.Float, nullable=False, default=0.6)
+    target_daily_rentals = db.Column(db.Float, nullable=False, default=0.5)
+    max_step = db.Column(db.Float, nullable=False, default=0.1)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<RepricingRule {self.merchant_id} {self.make}/{self.model}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "make": self.make,
+            "model": self.model,
+            "min_price": str(self.min_price),
+            "max_price": str(self.max_price),
+            "target_rented_share": self.target_rented_share,
+            "target_daily_rentals": self.target_daily_rentals,
+            "max_step": self.max_step,
+            "enabled": self.enabled,
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+class PriceChange(db.Model):
+    """One price written by a repricing run; lives on the car's shard."""
+
+    __tablename__ = "price_changes"
+    __table_args__ = (
+        db.Index(
+            "ix_price_changes_merchant_id_changed_at", "merchant_id", "changed_at"
+        ),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    run_id = db.Column(db.String(32), nullable=False)
+    car_id = db.Column(db.Integer, nullable=False)
+    merchant_id = db.Column(db.Integer, nullable=False)
+    old_price = db.Column(db.Numeric(10, 2), nullable=False)
+    new_price = db.Column(db.Numeric(10, 2), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PriceChange {self.car_id} {self.old_price} -> {self.new_price}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "run_id": self.run_id,
+            "car_id": self.car_id,
+            "old_price": str(self.old_price),
+            "new_price": str(self.new_price),
+            "changed_at": self.changed_at.isoformat(),
+        }
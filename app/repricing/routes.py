@@ -0,0 +1,75 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+
+from app.utils.decorators import role_required
+from app.utils.rate_limit import route_class
+from app.auth.models import UserRole
+from . import services
+from .services import RuleNotFoundError, ValidationError
+
+repricing = Blueprint("repricing", __name__)
+
+
+@repricing.route("/rules", methods=["GET"])
+@login_required
+@role_required(UserRole.MERCHANT)
+def get_rules():
+    try:
+        rules = services.get_rules(current_user.merchant_id)
+        return jsonify([rule.to_dict() for rule in rules]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@repricing.route("/rules", methods=["PUT"])
+@login_required
+@role_required(UserRole.MERCHANT)
+def save_rule():
+    try:
+        data = request.get_json()
+        rule = services.save_rule(current_user.merchant_id, data)
+        return jsonify({"message": "Repricing rule saved", "rule": rule.to_dict()}), 200
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@repricing.route("/rules/<int:rule_id>", methods=["DELETE"])
+@login_required
+@role_required(UserRole.MERCHANT)
+def delete_rule(rule_id):
+    try:
+        return jsonify(services.delete_rule(current_user.merchant_id, rule_id)), 200
+    except RuleNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@repricing.route("/changes", methods=["GET"])
+@login_required
+@role_required(UserRole.MERCHANT)
+def get_price_changes():
+    try:
+        query_params = request.args.to_dict()
+        changes = services.get_price_changes(current_user.merchant_id, query_params)
+        return jsonify([change.to_dict() for change in changes]), 200
+    except ValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@repricing.route("/preview", methods=["POST"])
+@route_class("expensive")
+@login_required
+@role_required(UserRole.MERCHANT)
+def preview_repricing():
+    try:
+        report = services.run_repricing(
+            dry_run=True, merchant_id=current_user.merchant_id
+        )
+        return jsonify(report), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,369 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import text
+
+from ..extensions import db
+from ..sharding.routing import merchant_shard, shard_names, use_shard
+from ..sharding.services import guard_bulk_writes
+from ..utils.arrays import copy_columns, copy_row_dtype
+from .models import PriceChange, RepricingRule
+
+logger = logging.getLogger(__name__)
+
+MAX_CHANGES_PAGE = 500
+DRY_RUN_SAMPLE_SIZE = 20
+
+
+class RepricingError(Exception):
+    pass
+
+
+class ValidationError(RepricingError):
+    pass
+
+
+class RuleNotFoundError(RepricingError):
+    pass
+
+
+def _parse_price(data, field):
+    try:
+        price = Decimal(str(data.get(field)))
+    except (TypeError, InvalidOperation):
+        raise ValidationError(f"{field} must be a valid decimal number")
+    if not price.is_finite() or price < 0:
+        raise ValidationError(f"{field} cannot be negative")
+    return price.quantize(Decimal("0.01"))
+
+
+def _parse_fraction(data, field, default, upper=None):
+    value = data.get(field, default)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{field} must be a number")
+    if not value > 0 or (upper is not None and value > upper):
+        bound = f" and at most {upper}" if upper is not None else ""
+        raise ValidationError(f"{field} must be greater than 0{bound}")
+    return value
+
+
+def _scope(value):
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+def get_rules(merchant_id):
+    return (
+        RepricingRule.query.filter_by(merchant_id=merchant_id)
+        .order_by(RepricingRule.id)
+        .all()
+    )
+
+
+def save_rule(merchant_id, data):
+    """Create the rule for ``make``/``model`` or replace the existing one."""
+    if not data:
+        raise ValidationError("Request body cannot be empty")
+    missing_fields = [
+        field for field in ["min_price", "max_price"] if data.get(field) is None
+    ]
+    if missing_fields:
+        raise ValidationError(f"Missing required fields: {', '.join(missing_fields)}")
+
+    min_price = _parse_price(data, "min_price")
+    max_price = _parse_price(data, "max_price")
+    if min_price > max_price:
+        raise ValidationError("min_price cannot be greater than max_price")
+    make, model = _scope(data.get("make")), _scope(data.get("model"))
+    enabled = data.get("enabled", True)
+    if not isinstance(enabled, bool):
+        raise ValidationError("enabled must be a boolean")
+
+    rule = RepricingRule.query.filter_by(
+        merchant_id=merchant_id, make=make, model=model
+    ).first()
+    if rule is None:
+        rule = RepricingRule(merchant_id=merchant_id, make=make, model=model)
+        db.session.add(rule)
+    rule.min_price = min_price
+    rule.max_price = max_price
+    rule.target_rented_share = _parse_fraction(data, "target_rented_share", 0.6, 1)
+    rule.target_daily_rentals = _parse_fraction(data, "target_daily_rentals", 0.5)
+    rule.max_step = _parse_fraction(data, "max_step", 0.1, 1)
+    rule.enabled = enabled
+    db.session.commit()
+    return rule
+
+
+def delete_rule(merchant_id, rule_id):
+    rule = RepricingRule.query.filter_by(
+        id=int(rule_id), merchant_id=merchant_id
+    ).first()
+    if not rule:
+        raise RuleNotFoundError("Repricing rule not found")
+    db.session.delete(rule)
+    db.session.commit()
+    return {"message": "Successfully deleted"}
+
+
+def get_price_changes(merchant_id, query_params):
+    try:
+        limit = int(query_params.get("limit", 100))
+    except ValueError:
+        raise ValidationError("limit must be an integer")
+    if not 1 <= limit <= MAX_CHANGES_PAGE:
+        raise ValidationError(f"limit must be between 1 and {MAX_CHANGES_PAGE}")
+    with merchant_shard(merchant_id):
+        return (
+            PriceChange.query.filter_by(merchant_id=merchant_id)
+            .order_by(PriceChange.changed_at.desc(), PriceChange.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+
+# One row per merchant/make/model with cars, and the group's demand signals
+GROUPS_SQL = """
+CREATE TEMPORARY TABLE repricing_groups ON COMMIT DROP AS
+SELECT row_number() OVER (ORDER BY c.merchant_id, c.make, c.model) - 1 AS group_id,
+       c.merchant_id, c.make, c.model,
+       count(*) AS cars,
+       count(*) FILTER (WHERE c.status = 'RENTED') AS rented,
+       coalesce(sum(recent.rentals), 0) AS recent_rentals
+FROM cars c
+LEFT JOIN (
+    SELECT car_id, count(*) AS rentals FROM rentals
+    WHERE rental_date >= :since GROUP BY car_id
+) recent ON recent.car_id = c.id
+WHERE c.merchant_id = ANY(CAST(:merchant_ids AS integer[]))
+GROUP BY c.merchant_id, c.make, c.model
+"""
+
+CAR_ROW = copy_row_dtype(("car_id", ">i4"), ("group_id", ">i8"), ("cents", ">i8"))
+
+CARS_QUERY = (
+    "SELECT c.id, g.group_id, (c.price_per_hour * 100)::bigint "
+    "FROM cars c JOIN repricing_groups g "
+    "ON g.merchant_id = c.merchant_id AND g.make = c.make AND g.model = c.model"
+)
+
+# Only cars whose price is still the one that was read are changed; each
+# change is logged and published to the event feed in the same statement
+APPLY_SQL = """
+WITH changes AS (
+    SELECT * FROM unnest(
+        CAST(:car_ids AS integer[]),
+        CAST(:old_cents AS bigint[]),
+        CAST(:new_cents AS bigint[])
+    ) AS change(car_id, old_cents, new_cents)
+), updated AS (
+    UPDATE cars SET price_per_hour = change.new_cents / 100.0,
+                    version = cars.version + 1
+    FROM changes change
+    WHERE cars.id = change.car_id
+      AND cars.price_per_hour = change.old_cents / 100.0
+      AND cars.merchant_id <> ALL(CAST(:moved_merchant_ids AS integer[]))
+    RETURNING cars.id, cars.merchant_id, cars.make, cars.model, cars.year,
+              cars.status, cars.price_per_hour, cars.version, change.old_cents
+), logged AS (
+    INSERT INTO price_changes (run_id, car_id, merchant_id, old_price, new_price, changed_at)
+    SELECT :run_id, id, merchant_id, old_cents / 100.0, price_per_hour, :now
+    FROM updated
+)
+INSERT INTO events (event_type, merchant_id, entity_id, payload, created_at)
+SELECT 'car.updated', merchant_id, id,
+       json_build_object(
+           'id', id, 'make', make, 'model', model, 'year', year,
+           'status', lower(status::text), 'price_per_hour', price_per_hour::text,
+           'merchant_id', merchant_id, 'version', version
+       ),
+       :now
+FROM updated
+"""
+
+
+def _rule_arrays(groups, rules_by_merchant):
+    """Per-group rule parameters; the most specific enabled rule wins.
+
+    Groups with no matching rule get NaN bounds and are left alone.
+    """
+    params = np.full((len(groups), 5), np.nan)
+    for index, group in enumerate(groups):
+        make, model = group.make.lower(), group.model.lower()
+        rules = rules_by_merchant.get(group.merchant_id, {})
+        rule = (
+            rules.get((make, model))
+            or rules.get((make, None))
+            or rules.get((None, model))
+            or rules.get((None, None))
+        )
+        if rule is not None:
+            params[index] = (
+                float(rule.min_price) * 100,
+                float(rule.max_price) * 100,
+                rule.target_rented_share,
+                rule.target_daily_rentals,
+                rule.max_step,
+            )
+    return params.T
+
+
+def compute_prices(groups, rules_by_merchant, group_ids, cents, window_days):
+    """New prices in cents for every car, from its group's demand and rule.
+
+    Demand pressure is the average of how far the rented share and the
+    per-car daily rental rate are above (+) or below (-) their targets,
+    capped to [-1, 1]. Prices move by up to ``max_step`` times that and are
+    then clamped to the rule's bounds.
+    """
+    cars = np.array([group.cars for group in groups], dtype=np.float64)
+    rented = np.array([group.rented for group in groups], dtype=np.float64)
+    recent = np.array([group.recent_rentals for group in groups], dtype=np.float64)
+    min_cents, max_cents, target_share, target_rate, max_step = _rule_arrays(
+        groups, rules_by_merchant
+    )
+
+    share_pressure = rented / cars / target_share - 1
+    rate_pressure = recent / cars / window_days / target_rate - 1
+    pressure = np.clip((share_pressure + rate_pressure) / 2, -1, 1)
+    multiplier = 1 + max_step * pressure
+
+    new_cents = np.rint(cents * multiplier[group_ids])
+    new_cents = np.clip(new_cents, min_cents[group_ids], max_cents[group_ids])
+    covered = ~np.isnan(new_cents)
+    return np.where(covered, new_cents, cents).astype(np.int64)
+
+
+def _load_rules(merchant_id=None):
+    query = RepricingRule.query.filter_by(enabled=True)
+    if merchant_id is not None:
+        query = query.filter_by(merchant_id=merchant_id)
+    rules_by_merchant = {}
+    for rule in query:
+        rules_by_merchant.setdefault(rule.merchant_id, {})[
+            (rule.make, rule.model)
+        ] = rule
+    return rules_by_merchant
+
+
+def _apply(run_id, merchant_ids, car_ids, old_cents, new_cents, now):
+    moved = guard_bulk_writes(merchant_ids)
+    # Events need no lock, so only the batch's own rows are held, in id order
+    # so that overlapping runs cannot deadlock on them
+    db.session.execute(
+        text(
+            "SELECT id FROM cars WHERE id = ANY(CAST(:car_ids AS integer[])) "
+            "ORDER BY id FOR NO KEY UPDATE"
+        ),
+        {"car_ids": car_ids},
+    )
+    result = db.session.execute(
+        text(APPLY_SQL),
+        {
+            "run_id": run_id,
+            "car_ids": car_ids,
+            "old_cents": old_cents,
+            "new_cents": new_cents,
+            "moved_merchant_ids": moved,
+            "now": now,
+        },
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def reprice_shard(rules_by_merchant, run_id, dry_run=False):
+    """One vectorized pass over the opted-in fleet on the current shard."""
+    config = current_app.config
+    window_hours = config["REPRICING_WINDOW_HOURS"]
+    now = datetime.utcnow()
+
+    db.session.execute(
+        text(GROUPS_SQL),
+        {
+            "since": now - timedelta(hours=window_hours),
+            "merchant_ids": list(rules_by_merchant),
+        },
+    )
+    groups = db.session.execute(
+        text("SELECT * FROM repricing_groups ORDER BY group_id")
+    ).all()
+    columns = copy_columns(CARS_QUERY, {}, CAR_ROW)
+    db.session.commit()
+
+    car_ids, cents = columns["car_id"], columns["cents"]
+    summary = {"groups": len(groups), "cars": len(car_ids)}
+    if not groups:
+        return {**summary, "changed": 0, "raised": 0, "lowered": 0, "written": 0}
+
+    new_cents = compute_prices(
+        groups, rules_by_merchant, columns["group_id"], cents, window_hours / 24
+    )
+    changed = np.flatnonzero(new_cents != cents)
+    summary.update(
+        changed=len(changed),
+        raised=int((new_cents[changed] > cents[changed]).sum()),
+        lowered=int((new_cents[changed] < cents[changed]).sum()),
+    )
+    if dry_run:
+        summary["sample"] = [
+            {
+                "car_id": int(car_ids[index]),
+                "old_price": f"{cents[index] / 100:.2f}",
+                "new_price": f"{new_cents[index] / 100:.2f}",
+            }
+            for index in changed[:DRY_RUN_SAMPLE_SIZE]
+        ]
+        return summary
+
+    group_merchants = np.array([group.merchant_id for group in groups])
+    written = 0
+    batch_size = config["REPRICING_BATCH_SIZE"]
+    for offset in range(0, len(changed), batch_size):
+        batch = changed[offset : offset + batch_size]
+        written += _apply(
+            run_id,
+            np.unique(group_merchants[columns["group_id"][batch]]).tolist(),
+            car_ids[batch].tolist(),
+            cents[batch].tolist(),
+            new_cents[batch].tolist(),
+            now,
+        )
+    summary["written"] = written
+    return summary
+
+
+def run_repricing(dry_run=False, merchant_id=None):
+    """Reprice every opted-in merchant's cars, shard by shard.
+
+    Cars whose price changed since it was read are skipped, so a merchant's
+    own edit always wins over the engine.
+    """
+    run_id = uuid.uuid4().hex
+    rules_by_merchant = _load_rules(merchant_id)
+    shards = {}
+    if rules_by_merchant:
+        for shard in shard_names():
+            with use_shard(shard):
+                shards[shard] = reprice_shard(rules_by_merchant, run_id, dry_run)
+    report = {
+        "run_id": run_id,
+        "dry_run": dry_run,
+        "merchants": len(rules_by_merchant),
+        "shards": shards,
+    }
+    logger.info(
+        "Repricing run %s%s: %s",
+        run_id,
+        " (dry run)" if dry_run else "",
+        {
+            shard: {key: value for key, value in summary.items() if key != "sample"}
+            for shard, summary in shards.items()
+        },
+    )
+    return report
@@ -0,0 +1,32 @@
+import json
+
+import click
+from flask.cli import AppGroup
+
+from . import services
+
+shards_cli = AppGroup("shards", help="Manage merchant database shards.")
+
+
+@shards_cli.command("prepare")
+@click.argument("name")
+def prepare_command(name):
+    """Make a migrated database ready to hold merchants."""
+    services.prepare_shard(name)
+    click.echo(f"Shard '{name}' is ready")
+
+
+@shards_cli.command("move-merchant")
+@click.argument("merchant_id", type=int)
+@click.argument("target")
+def move_merchant_command(merchant_id, target):
+    """Move a merchant's cars, rentals and events to another shard."""
+    source, copied = services.move_merchant(merchant_id, target)
+    click.echo(f"Moved merchant {merchant_id} from '{source}' to '{target}'")
+    click.echo(json.dumps(copied, indent=2))
+
+
+@shards_cli.command("stats")
+def stats_command():
+    """Show merchants and rows per shard."""
+    click.echo(json.dumps(services.shard_stats(), indent=2))
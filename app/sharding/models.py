@@ -0,0 +1,30 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class MerchantShard(db.Model):
+    __tablename__ = "merchant_shards"
+
+    merchant_id = db.Column(
+        db.Integer, db.ForeignKey("merchants.id"), primary_key=True, autoincrement=False
+    )
+    shard = db.Column(db.String(50), nullable=False)
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<MerchantShard {self.merchant_id} -> {self.shard}>"
+
+
+class MovedMerchant(db.Model):
+    """Left on a shard a merchant has moved away from, to fence off stale writers."""
+
+    __tablename__ = "moved_merchants"
+
+    merchant_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.String(50), nullable=False)
+    moved_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<MovedMerchant {self.merchant_id} -> {self.shard}>"
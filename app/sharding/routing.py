@@ -0,0 +1,208 @@
+"""Route merchant-owned rows to the database shard that holds the merchant.
+
+Imported by ``app.extensions``, so this module must not import the app's models.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.horizontal_shard import ShardedSession, execute_and_instances
+from sqlalchemy import event
+
+DEFAULT_SHARD = "default"
+
+# Tables whose rows live on the owning merchant's shard; everything else is global
+SHARDED_TABLES = {"cars", "rentals", "events", "price_changes", "moved_merchants"}
+
+_active_shard = ContextVar("active_shard", default=None)
+
+
+def shard_names():
+    return [DEFAULT_SHARD, *current_app.config["SQLALCHEMY_BINDS"]]
+
+
+def sharding_enabled():
+    return bool(current_app.config["SQLALCHEMY_BINDS"])
+
+
+def shard_engines(db):
+    engines = db.engines
+    return {
+        name: engines[None if name == DEFAULT_SHARD else name] for name in shard_names()
+    }
+
+
+class ShardMap:
+    """``merchant_id -> shard`` from ``merchant_shards``, re-read every ``interval``.
+
+    Merchants without a row live on the default shard. An id missing from
+    the map is looked up on its own and, if it has no row, remembered as
+    absent until the next full read.
+    """
+
+    def __init__(self):
+        self._shards = {}
+        self._missing = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self, engine):
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text("SELECT merchant_id, shard FROM merchant_shards")
+            ).all()
+        self._shards = dict(rows)
+        self._missing = set()
+        self._loaded_at = time.monotonic()
+
+    def _lookup(self, merchant_id, engine):
+        with engine.connect() as connection:
+            return connection.execute(
+                text("SELECT shard FROM merchant_shards WHERE merchant_id = :id"),
+                {"id": merchant_id},
+            ).scalar()
+
+    def shard_for(self, merchant_id, engine, interval):
+        merchant_id = int(merchant_id)
+        with self._lock:
+            if (
+                self._loaded_at is None
+                or time.monotonic() - self._loaded_at >= interval
+            ):
+                self._load(engine)
+            shard = self._shards.get(merchant_id)
+            if shard is not None or merchant_id in self._missing:
+                return shard or DEFAULT_SHARD
+            loaded_at = self._loaded_at
+
+        # A merchant registered since the last read; one row, outside the lock
+        shard = self._lookup(merchant_id, engine)
+        with self._lock:
+            if self._loaded_at == loaded_at:
+                if shard is None:
+                    self._missing.add(merchant_id)
+                else:
+                    self._shards[merchant_id] = shard
+        return shard or DEFAULT_SHARD
+
+    def invalidate(self):
+        self._loaded_at = None
+
+
+def shard_for_merchant(merchant_id):
+    if not sharding_enabled():
+        return DEFAULT_SHARD
+    from app.extensions import db
+
+    shard_map = current_app.extensions.setdefault("shard_map", ShardMap())
+    return shard_map.shard_for(
+        merchant_id, db.engines[None], current_app.config["SHARD_MAP_REFRESH_SECONDS"]
+    )
+
+
+def invalidate_shard_map():
+    shard_map = current_app.extensions.get("shard_map")
+    if shard_map is not None:
+        shard_map.invalidate()
+
+
+def current_shard():
+    return _active_shard.get() or DEFAULT_SHARD
+
+
+@contextmanager
+def use_shard(shard_id):
+    """Send queries on sharded tables to ``shard_id`` inside the block."""
+    token = _active_shard.set(shard_id)
+    try:
+        yield shard_id
+    finally:
+        _active_shard.reset(token)
+
+
+def merchant_shard(merchant_id):
+    return use_shard(shard_for_merchant(merchant_id))
+
+
+def shard_of(instance):
+    """The shard a loaded object came from."""
+    return inspect(instance).identity_token or current_shard()
+
+
+def is_sharded(mapper):
+    return mapper is not None and mapper.local_table.name in SHARDED_TABLES
+
+
+def target_shards(mapper):
+    """Shards a statement on ``mapper`` has to run on in the current context."""
+    if not is_sharded(mapper):
+        return [DEFAULT_SHARD]
+    active = _active_shard.get()
+    if active is not None:
+        return [active]
+    return shard_names()
+
+
+def _choose_shard(mapper, instance, clause=None, **kw):
+    if not is_sharded(mapper):
+        return DEFAULT_SHARD
+    active = _active_shard.get()
+    if active is not None:
+        return active
+    merchant_id = getattr(instance, "merchant_id", None)
+    if merchant_id is not None:
+        return shard_for_merchant(merchant_id)
+    car = getattr(instance, "car", None)
+    if car is not None:
+        return shard_of(car)
+    return DEFAULT_SHARD
+
+
+def _choose_identity_shards(mapper, primary_key, **kw):
+    return target_shards(mapper)
+
+
+def _choose_execute_shards(orm_context):
+    mapper = orm_context.bind_mapper
+    if mapper is None:
+        # Plain text or statements over subqueries follow the block's shard
+        return [current_shard()]
+    return target_shards(mapper)
+
+
+def _execute_on_shards(orm_context):
+    # Pin single-shard statements so results are not wrapped in a merged
+    # result, which would drop rowcount and other cursor attributes
+    if (
+        "shard_id" not in orm_context.bind_arguments
+        and "_sa_shard_id" not in orm_context.execution_options
+    ):
+        shard_ids = _choose_execute_shards(orm_context)
+        if len(shard_ids) == 1:
+            orm_context.update_execution_options(_sa_shard_id=shard_ids[0])
+    return execute_and_instances(orm_context)
+
+
+class RoutingSession(ShardedSession, Session):
+    """``db.session`` that picks a shard per row, statement or primary key.
+
+    Without ``SQLALCHEMY_BINDS`` there is only the default shard, so every
+    statement goes to the main database as before.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(
+            shard_chooser=_choose_shard,
+            identity_chooser=_choose_identity_shards,
+            execute_chooser=_choose_execute_shards,
+            shards=shard_engines(db),
+            db=db,
+            **kwargs,
+        )
+        event.remove(self, "do_orm_execute", execute_and_instances)
+        event.listen(self, "do_orm_execute", _execute_on_shards, retval=True)
@@ -0,0 +1,350 @@
+import heapq
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, jsonify
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import operators
+
+from ..extensions import db
+from .models import MerchantShard, MovedMerchant
+from .routing import (
+    DEFAULT_SHARD,
+    current_shard,
+    invalidate_shard_map,
+    shard_engines,
+    shard_for_merchant,
+    shard_names,
+    sharding_enabled,
+    target_shards,
+)
+
+# Arbitrary namespace for the per-merchant advisory locks that fence off moves
+MOVE_LOCK_NAMESPACE = 7_300_040
+COPY_BATCH_SIZE = 1000
+
+
+class ShardError(Exception):
+    pass
+
+
+class MerchantMovedError(ShardError):
+    pass
+
+
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def sort_key(order_by):
+    """Python key matching an ORDER BY of plain columns, for merging shard results."""
+    fields = []
+    for clause in order_by:
+        descending = getattr(clause, "modifier", None) is operators.desc_op
+        column = clause.element if hasattr(clause, "modifier") else clause
+        fields.append((column.key, descending))
+
+    def key(item):
+        values = []
+        for name, descending in fields:
+            # Postgres puts NULL after every value, so first when descending
+            value = getattr(item, name)
+            value = (value is None, value)
+            values.append(_Descending(value) if descending else value)
+        return tuple(values)
+
+    return key
+
+
+def scatter(statement, mapper, order_by, params=None):
+    """Run ``statement`` on every shard that may hold ``mapper`` rows.
+
+    Each shard's rows must already be in ``order_by`` order; they are merged
+    into one sorted list.
+    """
+    partials = [
+        db.session.execute(statement, params or {}, bind_arguments={"shard_id": shard})
+        .scalars()
+        .all()
+        for shard in target_shards(mapper)
+    ]
+    if len(partials) == 1:
+        return partials[0]
+    return list(heapq.merge(*partials, key=sort_key(order_by)))
+
+
+def scatter_count(statement, mapper, params=None):
+    return sum(
+        db.session.execute(
+            statement, params or {}, bind_arguments={"shard_id": shard}
+        ).scalar()
+        for shard in target_shards(mapper)
+    )
+
+
+def assign_shard(merchant):
+    """Place a new merchant; the caller commits. Spreads merchants by id."""
+    names = shard_names()
+    shard = names[merchant.id % len(names)]
+    db.session.add(MerchantShard(merchant_id=merchant.id, shard=shard))
+    return shard
+
+
+def guard_merchant_writes(merchant_id):
+    """Wait for a move of this merchant to finish and refuse writes to a shard it left.
+
+    Call inside the write transaction while on the merchant's shard.
+    """
+    if not sharding_enabled() or db.engine.dialect.name != "postgresql":
+        return
+    bind = {"shard_id": current_shard()}
+    db.session.execute(
+        text("SELECT pg_advisory_xact_lock_shared(:namespace, :merchant_id)"),
+        {"namespace": MOVE_LOCK_NAMESPACE, "merchant_id": merchant_id},
+        bind_arguments=bind,
+    )
+    moved_to = db.session.execute(
+        db.select(MovedMerchant.shard).where(MovedMerchant.merchant_id == merchant_id),
+        bind_arguments=bind,
+    ).scalar()
+    if moved_to is not None:
+        invalidate_shard_map()
+        if has_request_context():
+            g.merchant_moved = True
+        raise MerchantMovedError(f"Merchant {merchant_id} has moved to '{moved_to}'")
+
+
+def guard_bulk_writes(merchant_ids):
+    """``guard_merchant_writes`` for many merchants at once.
+
+    Returns the ids of merchants that have left this shard instead of
+    raising, so a bulk writer can skip their rows.
+    """
+    if not sharding_enabled() or db.engine.dialect.name != "postgresql":
+        return []
+    bind = {"shard_id": current_shard()}
+    db.session.execute(
+        text(
+            "SELECT pg_advisory_xact_lock_shared(:namespace, merchant_id) "
+            "FROM unnest(CAST(:merchant_ids AS integer[])) AS merchant_id "
+            "ORDER BY merchant_id"
+        ),
+        {"namespace": MOVE_LOCK_NAMESPACE, "merchant_ids": list(merchant_ids)},
+        bind_arguments=bind,
+    )
+    moved = (
+        db.session.execute(
+            db.select(MovedMerchant.merchant_id).where(
+                MovedMerchant.merchant_id.in_(list(merchant_ids))
+            ),
+            bind_arguments=bind,
+        )
+        .scalars()
+        .all()
+    )
+    if moved:
+        invalidate_shard_map()
+    return moved
+
+
+def _raise_sequence(connection, table, index, stride, floor=0):
+    """Make ``table``'s id sequence hand out ``index`` mod ``stride`` ids above ``floor``."""
+    sequence = connection.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}
+    ).scalar()
+    last_value, is_called = connection.execute(
+        text(f"SELECT last_value, is_called FROM {sequence}")
+    ).one()
+    floor = max(floor, last_value if is_called else last_value - 1)
+    next_value = floor + 1 + (index - floor - 1) % stride
+    connection.execute(text(f"ALTER SEQUENCE {sequence} INCREMENT BY {stride}"))
+    connection.execute(
+        text("SELECT setval(:sequence, :value, false)"),
+        {"sequence": sequence, "value": next_value},
+    )
+
+
+def prepare_shard(name):
+    """Get a migrated database ready to hold merchants.
+
+    Interleaves the id sequences of sharded tables so ids stay unique across
+    shards and survive moves. Shards other than the default also drop the
+    foreign keys that point at global tables, which live only on the default.
+    """
+    from app.cars.models import Car
+    from app.events.models import Event
+    from app.rentals.models import Rental
+    from app.repricing.models import PriceChange
+
+    names = shard_names()
+    if name not in names:
+        raise ShardError(f"Unknown shard '{name}'")
+    index, stride = names.index(name), current_app.config["SHARD_ID_STRIDE"]
+    if len(names) > stride:
+        raise ShardError(f"SHARD_ID_STRIDE ({stride}) must be at least the shard count")
+
+    engines = shard_engines(db)
+    tables = [Car.__table__, Rental.__table__, Event.__table__, PriceChange.__table__]
+    floors = {table.name: 0 for table in tables}
+    for engine in engines.values():
+        with engine.connect() as connection:
+            for table in tables:
+                highest = connection.execute(select(func.max(table.c.id))).scalar()
+                floors[table.name] = max(floors[table.name], highest or 0)
+
+    with engines[name].begin() as connection:
+        if name != DEFAULT_SHARD:
+            foreign_keys = connection.execute(
+                text(
+                    "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+                    "WHERE contype = 'f' AND conparentid = 0 "
+                    "AND conrelid::regclass::text IN ('cars', 'rentals') "
+                    "AND confrelid::regclass::text IN ('users', 'merchants')"
+                )
+            ).all()
+            for table, constraint in foreign_keys:
+                connection.execute(
+                    text(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}")
+                )
+        for table in tables:
+            _raise_sequence(connection, table.name, index, stride, floors[table.name])
+
+
+def _copy_rows(source, target, table, criterion):
+    copied = 0
+    result = source.execute(
+        select(table).where(criterion).execution_options(yield_per=COPY_BATCH_SIZE)
+    )
+    for rows in result.partitions():
+        target.execute(
+            insert(table).on_conflict_do_nothing(),
+            [row._asdict() for row in rows],
+        )
+        copied += len(rows)
+    return copied
+
+
+def move_merchant(merchant_id, target):
+    """Copy a merchant's cars, rentals and events to ``target``, then repoint it.
+
+    Writers for the merchant wait on an advisory lock for the duration and,
+    once the move commits, find a ``moved_merchants`` row on the old shard
+    and fail with a retryable error instead of writing there.
+    """
+    from app.cars.models import Car
+    from app.events.models import Event
+    from app.events.services import sequence_events
+    from app.rentals.models import Rental
+    from app.repricing.models import PriceChange
+
+    names = shard_names()
+    if target not in names:
+        raise ShardError(f"Unknown shard '{target}'")
+    invalidate_shard_map()
+    source = shard_for_merchant(merchant_id)
+    if source == target:
+        raise ShardError(f"Merchant {merchant_id} is already on '{target}'")
+
+    engines = shard_engines(db)
+    merchant_cars = select(Car.id).where(Car.merchant_id == merchant_id)
+    criteria = [
+        (Car.__table__, Car.merchant_id == merchant_id),
+        (Rental.__table__, Rental.car_id.in_(merchant_cars)),
+        (Event.__table__, Event.merchant_id == merchant_id),
+        (PriceChange.__table__, PriceChange.merchant_id == merchant_id),
+    ]
+
+    with engines[source].connect() as src, engines[target].connect() as dst:
+        src.begin()
+        src.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :merchant_id)"),
+            {"namespace": MOVE_LOCK_NAMESPACE, "merchant_id": merchant_id},
+        )
+
+        dst.begin()
+        dst.execute(
+            MovedMerchant.__table__.delete().where(
+                MovedMerchant.merchant_id == merchant_id
+            )
+        )
+        copied = {
+            table.name: _copy_rows(src, dst, table, criterion)
+            for table, criterion in criteria
+        }
+        # Copied events keep their feed positions, and positions on the target
+        # only grow past them. Events the source had not sequenced yet carry
+        # its transaction ids, so place them now; the merchant's writers wait
+        sequence_events(dst, merchant_id)
+        dst.commit()
+
+        with engines[DEFAULT_SHARD].begin() as connection:
+            connection.execute(
+                insert(MerchantShard.__table__)
+                .values(
+                    merchant_id=merchant_id, shard=target, updated_at=datetime.utcnow()
+                )
+                .on_conflict_do_update(
+                    index_elements=["merchant_id"],
+                    set_={"shard": target, "updated_at": datetime.utcnow()},
+                )
+            )
+
+        for table, criterion in reversed(criteria):
+            src.execute(table.delete().where(criterion))
+        src.execute(
+            insert(MovedMerchant.__table__)
+            .values(merchant_id=merchant_id, shard=target, moved_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=["merchant_id"],
+                set_={"shard": target, "moved_at": datetime.utcnow()},
+            )
+        )
+        src.commit()
+
+    invalidate_shard_map()
+    return source, copied
+
+
+def shard_stats():
+    from app.cars.models import Car
+    from app.rentals.models import Rental
+
+    merchants = dict(
+        db.session.execute(
+            db.select(MerchantShard.shard, func.count()).group_by(MerchantShard.shard)
+        ).all()
+    )
+    stats = {}
+    for name, engine in shard_engines(db).items():
+        with engine.connect() as connection:
+            stats[name] = {
+                "merchants": merchants.get(name, 0),
+                "cars": connection.execute(
+                    select(func.count()).select_from(Car.__table__)
+                ).scalar(),
+                "rentals": connection.execute(
+                    select(func.count()).select_from(Rental.__table__)
+                ).scalar(),
+            }
+    return stats
+
+
+def init_sharding(app):
+    @app.after_request
+    def report_merchant_moved(response):
+        # Route handlers turn every exception into a 500; tell the client to retry
+        if g.get("merchant_moved"):
+            db.session.rollback()
+            response = jsonify({"error": "Merchant data is being moved, please retry"})
+            response.status_code = 503
+            response.headers["Retry-After"] = "1"
+        return response
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import random
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, inspect
+
+# Body fields and query params that identify people; their values are never written
+SENSITIVE_FIELDS = {
+    "email",
+    "password",
+    "name",
+    "surname",
+    "company_name",
+    "refresh_token",
+}
+SENSITIVE_PARAMS = {"user_id"}
+REDACTED = "<redacted>"
+
+
+class TraceWriter:
+    """Appends one JSON line per request to ``path``.
+
+    Each record is written with a single ``write`` on a file opened for
+    appending, so several worker processes can share one trace file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+
+def pseudonym(value, secret):
+    """Stable, non-reversible stand-in for a user id or client address."""
+    digest = hashlib.blake2b(
+        str(value).encode(), key=(secret or "").encode()[:64], digest_size=6
+    )
+    return digest.hexdigest()
+
+
+def redact_body(body):
+    if isinstance(body, dict):
+        return {
+            key: REDACTED if key in SENSITIVE_FIELDS else redact_body(value)
+            for key, value in body.items()
+        }
+    if isinstance(body, list):
+        return [redact_body(item) for item in body]
+    return body
+
+
+def _remember_role(user, context):
+    # The route may commit and expire the user; keep its role from load time
+    if has_request_context():
+        g.setdefault("capture_roles", {})[user.id] = user.role.value
+
+
+def _caller():
+    # Only look at a user the request already loaded; capture must not add queries
+    user = g.get("_login_user")
+    if user is None or not user.is_authenticated:
+        return "anonymous", None
+    state = inspect(user, raiseerr=False)
+    if state is None:
+        return user.role.value, user.id
+    user_id = state.identity[0]
+    return g.get("capture_roles", {}).get(user_id, "user"), user_id
+
+
+def _record(response, secret):
+    role, user_id = _caller()
+    query = {
+        key: values
+        for key, values in request.args.lists()
+        if key not in SENSITIVE_PARAMS
+    }
+    body = request.get_json(silent=True) if request.is_json else None
+    return {
+        "at": round(g.capture_started_at, 6),
+        "method": request.method,
+        "endpoint": request.url_rule.rule if request.url_rule else None,
+        "path": request.path,
+        "query": query,
+        "body": redact_body(body),
+        "idempotent": "Idempotency-Key" in request.headers,
+        "role": role,
+        "actor": pseudonym(user_id, secret) if user_id is not None else None,
+        "client": pseudonym(request.remote_addr, secret),
+        "status": response.status_code,
+        "duration_ms": round((time.perf_counter() - g.capture_timer) * 1000, 3),
+    }
+
+
+def init_traffic_capture(app):
+    path = app.config["TRAFFIC_CAPTURE_PATH"]
+    if not path:
+        return
+    from app.auth.models import User
+
+    event.listen(User, "load", _remember_role)
+    writer = TraceWriter(path)
+    app.extensions["traffic_capture"] = writer
+
+    @app.before_request
+    def start_capture():
+        if random.random() < current_app.config["TRAFFIC_CAPTURE_SAMPLE_RATE"]:
+            g.capture_started_at = time.time()
+            g.capture_timer = time.perf_counter()
+
+    @app.after_request
+    def capture_request(response):
+        if "capture_timer" in g:
+            writer.write(_record(response, current_app.config["SECRET_KEY"]))
+        return response
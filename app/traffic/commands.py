@@ -0,0 +1,68 @@
+import json
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .contention import ContentionError, run_contention
+from .replay import ReplayError, load_trace, replay
+
+traffic_cli = AppGroup("traffic", help="Replay captured traffic as a load test.")
+
+
+@traffic_cli.command("replay")
+@click.argument("trace", type=click.Path(exists=True, dir_okay=False))
+@click.option("--concurrency", type=int, default=8)
+@click.option("--speedup", type=float, default=1.0, help="0 sends as fast as possible.")
+@click.option(
+    "--limit", type=int, default=None, help="Replay only the first N requests."
+)
+@click.option("--output", type=click.Path(dir_okay=False), default=None)
+def replay_command(trace, concurrency, speedup, limit, output):
+    """Drive this app with a captured trace and report how it held up."""
+    try:
+        report = replay(
+            current_app._get_current_object(),
+            load_trace(trace, limit),
+            concurrency=concurrency,
+            speedup=speedup,
+        )
+    except ReplayError as e:
+        raise click.ClickException(str(e))
+    rendered = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as report_file:
+            report_file.write(rendered + "\n")
+    click.echo(rendered)
+
+
+@traffic_cli.command("contention")
+@click.option("--duration", type=float, default=15.0, help="Seconds to run.")
+@click.option("--editors", type=int, default=4, help="Threads editing prices.")
+@click.option("--renters", type=int, default=8, help="Threads renting and returning.")
+@click.option("--cars", "hot_cars", type=int, default=10, help="Cars they share.")
+@click.option("--merchant-id", type=int, default=None)
+@click.option("--output", type=click.Path(dir_okay=False), default=None)
+def contention_command(duration, editors, renters, hot_cars, merchant_id, output):
+    """Race price edits against rentals and check that no write was lost."""
+    try:
+        report = run_contention(
+            current_app._get_current_object(),
+            duration=duration,
+            editors=editors,
+            renters=renters,
+            hot_cars=hot_cars,
+            merchant_id=merchant_id,
+        )
+    except ContentionError as e:
+        raise click.ClickException(str(e))
+    rendered = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as report_file:
+            report_file.write(rendered + "\n")
+    click.echo(rendered)
+    anomalies = sum(report["anomalies"].values())
+    if anomalies:
+        click.echo(f"{anomalies} anomalies found", err=True)
+        sys.exit(1)
@@ -0,0 +1,229 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from app.auth.models import Merchant, User, UserRole
+from app.auth.tokens import issue_tokens
+from app.cars.models import Car, CarStatus
+from app.extensions import db
+from app.rentals.models import Rental
+from app.sharding.routing import merchant_shard
+from .replay import _percentiles
+
+# How many times an editor re-reads a car after a 412 before giving up
+EDIT_ATTEMPTS = 20
+
+
+class ContentionError(Exception):
+    pass
+
+
+def _bearer(user):
+    return {"Authorization": f"Bearer {issue_tokens(user)['access_token']}"}
+
+
+def _setup(merchant_id, hot_cars, renters):
+    merchants = Merchant.query.order_by(Merchant.id)
+    if merchant_id is not None:
+        merchants = merchants.filter_by(id=merchant_id)
+    merchant = merchants.first()
+    if merchant is None:
+        raise ContentionError("The database has no such merchant")
+    with merchant_shard(merchant.id):
+        cars = (
+            Car.query.filter_by(merchant_id=merchant.id, status=CarStatus.AVAILABLE)
+            .order_by(Car.id)
+            .limit(hot_cars)
+            .all()
+        )
+    if len(cars) < hot_cars:
+        raise ContentionError(
+            f"Merchant {merchant.id} has only {len(cars)} available cars"
+        )
+
+    candidates = (
+        User.query.filter_by(role=UserRole.USER)
+        .order_by(User.id)
+        .limit(renters * 4)
+        .all()
+    )
+    busy = {
+        user_id
+        for (user_id,) in db.session.query(Rental.user_id).filter(
+            Rental.user_id.in_([user.id for user in candidates]),
+            Rental.return_date.is_(None),
+        )
+    }
+    users = [user for user in candidates if user.id not in busy][:renters]
+    if len(users) < renters:
+        raise ContentionError(f"Found only {len(users)} users without a rental")
+    return (
+        merchant,
+        {car.id: car.version for car in cars},
+        _bearer(merchant.user),
+        [_bearer(user) for user in users],
+    )
+
+
+def _overlaps(rentals):
+    by_car = defaultdict(list)
+    for rental in rentals:
+        by_car[rental.car_id].append(rental)
+    overlaps = 0
+    for car_rentals in by_car.values():
+        car_rentals.sort(key=lambda rental: rental.rental_date)
+        for earlier, later in zip(car_rentals, car_rentals[1:]):
+            if earlier.return_date is None or later.rental_date < earlier.return_date:
+                overlaps += 1
+    return overlaps
+
+
+def run_contention(
+    app, duration=15.0, editors=4, renters=8, hot_cars=10, merchant_id=None
+):
+    """Race merchant price edits against rentals on a few cars, then audit them.
+
+    Editors GET a car and PUT a new price with its ETag in ``If-Match``,
+    re-reading it after a 412. Renters rent a car and return it. Afterwards
+    every car's version must have moved once per committed write, the last
+    committed price must be the one stored, no car may have overlapping
+    rentals and only cars with an open rental may be RENTED. Returns the
+    throughput, statuses, latencies and anomaly counts.
+    """
+    with app.app_context():
+        merchant, start_versions, editor_headers, renter_headers = _setup(
+            merchant_id, hot_cars, renters
+        )
+        merchant_id = merchant.id
+        db.session.rollback()
+    car_ids = sorted(start_versions)
+    started_at = datetime.utcnow()
+
+    statuses = Counter()
+    latencies = defaultdict(list)
+    writes = Counter()
+    edits = defaultdict(list)
+    lock = threading.Lock()
+
+    def send(client, name, method, path, **kwargs):
+        sent = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        with lock:
+            statuses[f"{name} {response.status_code}"] += 1
+            latencies[name].append((time.perf_counter() - sent) * 1000)
+        return response
+
+    def editor(seed):
+        client = app.test_client()
+        chooser = random.Random(seed)
+        while time.perf_counter() < stop:
+            car_id = chooser.choice(car_ids)
+            for _ in range(EDIT_ATTEMPTS):
+                etag = send(
+                    client, "get", "GET", f"/cars/{car_id}", headers=editor_headers
+                ).headers.get("ETag")
+                if etag is None:
+                    break
+                price = f"{chooser.randint(1000, 9999) / 100:.2f}"
+                response = send(
+                    client,
+                    "put",
+                    "PUT",
+                    f"/cars/{car_id}",
+                    json={"price_per_hour": price},
+                    headers={**editor_headers, "If-Match": etag},
+                )
+                if response.status_code == 200:
+                    with lock:
+                        writes[car_id] += 1
+                        edits[car_id].append((response.json["version"], price))
+                    break
+                if response.status_code != 412:
+                    break
+
+    def renter(headers, seed):
+        client = app.test_client()
+        chooser = random.Random(seed)
+        while time.perf_counter() < stop:
+            car_id = chooser.choice(car_ids)
+            response = send(
+                client, "rent", "POST", f"/rentals/rent/{car_id}", headers=headers
+            )
+            if response.status_code != 201:
+                continue
+            with lock:
+                writes[car_id] += 1
+            response = send(
+                client, "return", "POST", "/rentals/return", headers=headers
+            )
+            if response.status_code == 200:
+                with lock:
+                    writes[response.json["car_id"]] += 1
+
+    threads = [
+        threading.Thread(target=editor, args=(index,)) for index in range(editors)
+    ] + [
+        threading.Thread(target=renter, args=(headers, index))
+        for index, headers in enumerate(renter_headers)
+    ]
+    began = time.perf_counter()
+    stop = began + duration
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    with app.app_context(), merchant_shard(merchant_id):
+        cars = {car.id: car for car in Car.query.filter(Car.id.in_(car_ids))}
+        rentals = Rental.query.filter(
+            Rental.car_id.in_(car_ids),
+            db.or_(Rental.rental_date >= started_at, Rental.return_date.is_(None)),
+        ).all()
+        open_rentals = Counter(
+            rental.car_id for rental in rentals if rental.return_date is None
+        )
+        anomalies = {
+            "version_drift": sum(
+                abs(cars[car_id].version - start_versions[car_id] - writes[car_id])
+                for car_id in car_ids
+            ),
+            "lost_edits": sum(
+                str(cars[car_id].price_per_hour) != max(edits[car_id])[1]
+                for car_id in car_ids
+                if edits[car_id]
+            ),
+            "overlapping_rentals": _overlaps(rentals),
+            "status_mismatches": sum(
+                (cars[car_id].status == CarStatus.RENTED) != (open_rentals[car_id] == 1)
+                or open_rentals[car_id] > 1
+                for car_id in car_ids
+            ),
+            "server_errors": sum(
+                count
+                for name, count in statuses.items()
+                if int(name.rsplit(" ", 1)[1]) >= 500
+            ),
+        }
+        db.session.rollback()
+
+    requests = sum(statuses.values())
+    committed = sum(writes.values())
+    return {
+        "merchant_id": merchant_id,
+        "cars": len(car_ids),
+        "editors": editors,
+        "renters": renters,
+        "duration_s": round(elapsed, 3),
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 2),
+        "committed_writes": committed,
+        "committed_writes_per_s": round(committed / elapsed, 2),
+        "statuses": dict(sorted(statuses.items())),
+        "latency_ms": {
+            name: _percentiles(values) for name, values in sorted(latencies.items())
+        },
+        "anomalies": anomalies,
+    }
@@ -0,0 +1,294 @@
+import json
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import numpy as np
+from sqlalchemy import text
+
+from app.auth.models import User, UserRole
+from app.auth.tokens import issue_tokens
+from app.extensions import db
+from app.sharding.routing import shard_engines
+from .capture import REDACTED
+
+LOCK_SAMPLE_INTERVAL = 0.05
+
+LOCK_WAITERS_SQL = text(
+    "SELECT wait_event, count(*) FROM pg_stat_activity "
+    "WHERE wait_event_type = 'Lock' AND datname = current_database() "
+    "GROUP BY wait_event"
+)
+DEADLOCKS_SQL = text(
+    "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+)
+
+
+class ReplayError(Exception):
+    pass
+
+
+def load_trace(path, limit=None):
+    """Captured records ordered by arrival, with ``at`` relative to the first."""
+    with open(path) as trace_file:
+        records = [json.loads(line) for line in trace_file if line.strip()]
+    records.sort(key=lambda record: record["at"])
+    if limit is not None:
+        records = records[:limit]
+    if records:
+        first = records[0]["at"]
+        for record in records:
+            record["at"] -= first
+    return records
+
+
+def _synthetic_value(field):
+    if field == "email":
+        return f"replay-{uuid.uuid4().hex}@example.com"
+    if field == "password":
+        return "replay-password"
+    return "Replay"
+
+
+def restore_body(body):
+    """Fill redacted fields with fresh synthetic values so writes still validate."""
+    if isinstance(body, dict):
+        return {
+            key: _synthetic_value(key) if value == REDACTED else restore_body(value)
+            for key, value in body.items()
+        }
+    if isinstance(body, list):
+        return [restore_body(item) for item in body]
+    return body
+
+
+class ActorMap:
+    """Maps captured pseudonyms onto seeded users of the same role.
+
+    Distinct actors get distinct users while there are enough of them, so
+    per-user rules (one active rental, per-user rate limits) behave as in
+    the captured traffic. Access tokens are re-issued at half their lifetime.
+    """
+
+    def __init__(self, app, records):
+        self.app = app
+        self._tokens = {}
+        self._lock = threading.Lock()
+        actors = {}
+        for record in records:
+            if record["actor"] is not None:
+                actors.setdefault(record["actor"], record["role"])
+        by_role = defaultdict(list)
+        for actor, role in actors.items():
+            by_role[role].append(actor)
+
+        self.users = {}
+        with app.app_context():
+            for role, role_actors in by_role.items():
+                users = User.query.filter_by(role=UserRole(role)).order_by(User.id)
+                users = users.limit(len(role_actors)).all()
+                if not users:
+                    raise ReplayError(
+                        f"The database has no '{role}' users to replay as"
+                    )
+                for index, actor in enumerate(role_actors):
+                    self.users[actor] = users[index % len(users)].id
+        self.distinct_users = len(set(self.users.values()))
+
+        clients = sorted({record["client"] for record in records})
+        self.addresses = {
+            client: f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+            for index, client in enumerate(clients)
+        }
+
+    def authorization(self, actor):
+        user_id = self.users.get(actor)
+        if user_id is None:
+            return None
+        ttl = self.app.config["AUTH_ACCESS_TOKEN_TTL"]
+        with self._lock:
+            issued = self._tokens.get(user_id)
+            if issued is None or time.monotonic() - issued[0] > ttl / 2:
+                with self.app.app_context():
+                    token = issue_tokens(db.session.get(User, user_id))["access_token"]
+                issued = (time.monotonic(), f"Bearer {token}")
+                self._tokens[user_id] = issued
+        return issued[1]
+
+
+class LockSampler(threading.Thread):
+    """Polls ``pg_stat_activity`` on every shard for sessions waiting on a lock."""
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        self.app = app
+        self.samples = 0
+        self.waiting = Counter()
+        self.max_waiting = 0
+        self.deadlocks = 0
+        self._stop_event = threading.Event()
+
+    def _deadlocks(self, engines):
+        total = 0
+        for engine in engines:
+            with engine.connect() as connection:
+                total += connection.execute(DEADLOCKS_SQL).scalar() or 0
+        return total
+
+    def run(self):
+        with self.app.app_context():
+            engines = [
+                engine
+                for engine in shard_engines(db).values()
+                if engine.dialect.name == "postgresql"
+            ]
+            if not engines:
+                return
+            deadlocks_before = self._deadlocks(engines)
+            connections = [engine.connect() for engine in engines]
+            try:
+                while not self._stop_event.wait(LOCK_SAMPLE_INTERVAL):
+                    waiting = 0
+                    for connection in connections:
+                        for wait_event, count in connection.execute(LOCK_WAITERS_SQL):
+                            self.waiting[wait_event] += count
+                            waiting += count
+                        connection.rollback()
+                    self.samples += 1
+                    self.max_waiting = max(self.max_waiting, waiting)
+            finally:
+                for connection in connections:
+                    connection.close()
+            self.deadlocks = self._deadlocks(engines) - deadlocks_before
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self):
+        waited = sum(self.waiting.values())
+        return {
+            "samples": self.samples,
+            "avg_waiting": round(waited / self.samples, 3) if self.samples else 0,
+            "max_waiting": self.max_waiting,
+            # Each sample stands for LOCK_SAMPLE_INTERVAL seconds of waiting per session
+            "wait_seconds": round(waited * LOCK_SAMPLE_INTERVAL, 3),
+            "by_event": dict(self.waiting.most_common()),
+            "deadlocks": self.deadlocks,
+        }
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "p50": round(float(p50), 2),
+        "p90": round(float(p90), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(max(values)), 2),
+    }
+
+
+def _summary(results):
+    latencies = [result["latency_ms"] for result in results]
+    statuses = Counter(result["status"] for result in results)
+    count = len(results)
+    client_errors = sum(n for status, n in statuses.items() if 400 <= status < 500)
+    server_errors = sum(n for status, n in statuses.items() if status >= 500)
+    return {
+        "requests": count,
+        "latency_ms": _percentiles(latencies),
+        "client_error_rate": round(client_errors / count, 4) if count else 0,
+        "server_error_rate": round(server_errors / count, 4) if count else 0,
+    }
+
+
+def replay(app, records, concurrency=8, speedup=1.0):
+    """Send ``records`` to ``app`` from ``concurrency`` threads.
+
+    Request ``i`` is sent no earlier than ``at / speedup`` seconds after the
+    start; ``speedup=0`` sends as fast as the threads allow. Returns a report
+    of throughput, latency percentiles, error rates and lock waits.
+    """
+    if not records:
+        raise ReplayError("The trace is empty")
+    actors = ActorMap(app, records)
+    results = [None] * len(records)
+    position = iter(range(len(records)))
+    position_lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with position_lock:
+                index = next(position, None)
+            if index is None:
+                return
+            record = records[index]
+            due = started + record["at"] / speedup if speedup else started
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent = time.perf_counter()
+            headers = {}
+            authorization = actors.authorization(record["actor"])
+            if authorization:
+                headers["Authorization"] = authorization
+            if record.get("idempotent"):
+                headers["Idempotency-Key"] = uuid.uuid4().hex
+            try:
+                response = client.open(
+                    record["path"],
+                    method=record["method"],
+                    query_string=record["query"],
+                    json=restore_body(record["body"]),
+                    headers=headers,
+                    environ_base={"REMOTE_ADDR": actors.addresses[record["client"]]},
+                )
+                response.get_data()
+                status = response.status_code
+                response.close()
+            except Exception:
+                status = 599
+            results[index] = {
+                "endpoint": f"{record['method']} {record['endpoint'] or record['path']}",
+                "status": status,
+                "latency_ms": (time.perf_counter() - sent) * 1000,
+                "lag_ms": (sent - due) * 1000 if speedup else 0.0,
+            }
+
+    sampler = LockSampler(app)
+    sampler.start()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[result["endpoint"]].append(result)
+    return {
+        "concurrency": concurrency,
+        "speedup": speedup,
+        "replayed_users": actors.distinct_users,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2),
+        **_summary(results),
+        "statuses": dict(
+            sorted(Counter(str(result["status"]) for result in results).items())
+        ),
+        "schedule_lag_ms": _percentiles([result["lag_ms"] for result in results]),
+        "lock_waits": sampler.report(),
+        "endpoints": {
+            endpoint: _summary(endpoint_results)
+            for endpoint, endpoint_results in sorted(
+                by_endpoint.items(), key=lambda item: -len(item[1])
+            )
+        },
+    }
@@ -0,0 +1,45 @@
+"""Read query results straight into numpy arrays through binary ``COPY``."""
+
+import io
+
+import numpy as np
+
+from app.extensions import db
+from app.sharding.routing import current_shard
+
+COPY_HEADER_BYTES = 19
+COPY_TRAILER_BYTES = 2
+
+
+def copy_row_dtype(*columns):
+    """dtype of one binary COPY row of ``(name, dtype)`` columns, none NULL.
+
+    Each row is a field count followed by a length and a value per column,
+    all big-endian, so rows of fixed-width columns all have the same size.
+    """
+    fields = [("fields", ">i2")]
+    for name, column_dtype in columns:
+        fields += [(f"{name}_length", ">i4"), (name, column_dtype)]
+    return np.dtype(fields)
+
+
+def copy_columns(query, params, row_dtype):
+    """Run ``query`` on the current shard and return its columns as native arrays.
+
+    ``query`` is a plain SELECT with psycopg2 ``%(name)s`` placeholders. No
+    Python object is built per row.
+    """
+    connection = db.session.connection(bind_arguments={"shard_id": current_shard()})
+    cursor = connection.connection.cursor()
+    sql = cursor.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", params)
+    buffer = io.BytesIO()
+    cursor.copy_expert(sql.decode(), buffer)
+    rows = np.frombuffer(
+        buffer.getbuffer()[COPY_HEADER_BYTES:-COPY_TRAILER_BYTES], dtype=row_dtype
+    )
+    # Swap to native byte order once instead of in every later operation
+    return {
+        name: rows[name].astype(row_dtype[name].newbyteorder("="))
+        for name in row_dtype.names
+        if name != "fields" and not name.endswith("_length")
+    }
@@ -0,0 +1,258 @@
+import datetime
+import enum
+import json
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .deadlines import remaining_time
+from .sqlite import LocalSQLite
+
+POLL_INTERVAL = 0.005
+
+
+def normalized(values):
+    """A hashable, order-independent form of parsed filter values.
+
+    ``Decimal("120")`` and ``Decimal("120.0")`` give the same key.
+    """
+    items = []
+    for name, value in sorted(values.items()):
+        if isinstance(value, Decimal):
+            value = value.normalize()
+        elif isinstance(value, enum.Enum):
+            value = value.value
+        items.append((name, value))
+    return tuple(items)
+
+
+def _to_json(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _from_json(python_type, value):
+    if value is None:
+        return None
+    if python_type in (datetime.date, datetime.datetime):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_instances(mapper, instances):
+    """Column values of loaded ``instances`` as JSON-safe lists."""
+    attrs = mapper.column_attrs
+    return [
+        [_to_json(getattr(instance, attr.key)) for attr in attrs]
+        for instance in instances
+    ]
+
+
+def decode_instances(mapper, rows):
+    """Read-only instances rebuilt from ``encode_instances`` output, without SQL."""
+    attrs = mapper.column_attrs
+    types = [attr.columns[0].type.python_type for attr in attrs]
+    instances = []
+    for row in rows:
+        instance = mapper.class_manager.new_instance()
+        for attr, python_type, value in zip(attrs, types, row):
+            set_committed_value(instance, attr.key, _from_json(python_type, value))
+        instances.append(instance)
+    return instances
+
+
+class SQLiteFlightStore:
+    """In-flight calls in a local SQLite file shared by every worker on the host.
+
+    A row is claimed by one owner until its lease runs out. Its result stays
+    until the next caller claims the key again, so waiters only ever get the
+    flight they joined. Rows a lease past their expiry are deleted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = LocalSQLite(
+            path,
+            [
+                "CREATE TABLE IF NOT EXISTS flights (key TEXT PRIMARY KEY, "
+                "owner TEXT NOT NULL, expires REAL NOT NULL, result TEXT)",
+                "CREATE INDEX IF NOT EXISTS flights_expires ON flights (expires)",
+            ],
+        ).connection
+
+    def claim(self, key, owner, lease, now):
+        """Return the flight's owner; ``owner`` itself when the caller leads it."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Waiters give up within a lease of the expiry, so nobody reads these
+            connection.execute("DELETE FROM flights WHERE expires < ?", (now - lease,))
+            row = connection.execute(
+                "SELECT owner, expires, result FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now or row[2] is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO flights (key, owner, expires, result) "
+                    "VALUES (?, ?, ?, NULL)",
+                    (key, owner, now + lease),
+                )
+                current = owner
+            else:
+                current = row[0]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return current
+
+    def publish(self, key, owner, result):
+        self._connection().execute(
+            "UPDATE flights SET result = ? WHERE key = ? AND owner = ?",
+            (result, key, owner),
+        )
+
+    def abandon(self, key, owner):
+        self._connection().execute(
+            "DELETE FROM flights WHERE key = ? AND owner = ?", (key, owner)
+        )
+
+    def poll(self, key, owner, now):
+        """``(True, result)`` once published, ``(False, None)`` while running.
+
+        ``None`` means the flight failed, expired or was replaced.
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT expires, result FROM flights WHERE key = ? AND owner = ?",
+                (key, owner),
+            )
+            .fetchone()
+        )
+        if row is None or (row[1] is None and row[0] <= now):
+            return None
+        return (row[1] is not None, row[1])
+
+
+STORES = {"sqlite": SQLiteFlightStore}
+
+
+def create_store(storage_url):
+    """Build a flight store from ``sqlite:///path/to/file.db``; empty means none."""
+    if not storage_url:
+        return None
+    scheme, _, location = storage_url.partition("://")
+    if scheme not in STORES:
+        raise ValueError(f"Unknown coalescing storage: '{storage_url}'")
+    return STORES[scheme](location[1:] if location.startswith("/") else location)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.ok = False
+
+
+class Coalescer:
+    """Single-flight execution of identical concurrent calls.
+
+    The first caller for a key runs it; callers arriving while it runs wait
+    and share its result instead of repeating the work. With a ``store``,
+    workers on the same host also share one run per key. A waiter whose
+    leader fails, or does not finish within ``wait_seconds`` or the request
+    deadline, runs the call itself.
+    """
+
+    def __init__(self, wait_seconds, store=None):
+        self.wait_seconds = wait_seconds
+        self.store = store
+        self.leaders = 0
+        self.followers = 0
+        self.remote_followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _timeout(self):
+        remaining = remaining_time()
+        if remaining is None:
+            return self.wait_seconds
+        return max(0, min(self.wait_seconds, remaining))
+
+    def run(self, key, fetch, encode, decode):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(self._timeout()) and flight.ok:
+                self.followers += 1
+                return flight.result
+            return fetch()
+
+        try:
+            flight.result = self._lead(key, fetch, encode, decode)
+            flight.ok = True
+            return flight.result
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _lead(self, key, fetch, encode, decode):
+        if self.store is None:
+            self.leaders += 1
+            return fetch()
+
+        store_key = json.dumps(key, default=str)
+        owner = uuid.uuid4().hex
+        give_up = time.monotonic() + self._timeout()
+        while True:
+            current = self.store.claim(store_key, owner, self.wait_seconds, time.time())
+            if current == owner:
+                self.leaders += 1
+                try:
+                    result = fetch()
+                except Exception:
+                    self.store.abandon(store_key, owner)
+                    raise
+                self.store.publish(store_key, owner, json.dumps(encode(result)))
+                return result
+
+            # Another worker leads: wait for its result, or claim again if it fails
+            status = (False, None)
+            while status is not None and not status[0]:
+                if time.monotonic() >= give_up:
+                    return fetch()
+                time.sleep(POLL_INTERVAL)
+                status = self.store.poll(store_key, current, time.time())
+            if status is not None:
+                self.remote_followers += 1
+                return decode(json.loads(status[1]))
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "remote_followers": self.remote_followers,
+            "in_flight": len(self._flights),
+        }
+
+
+def init_coalescing(app):
+    if not app.config["COALESCE_ENABLED"]:
+        return
+    app.extensions["coalescing"] = Coalescer(
+        app.config["COALESCE_WAIT_SECONDS"],
+        create_store(app.config["COALESCE_STORAGE_URL"]),
+    )
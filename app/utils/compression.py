@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/csv", "text/html"}
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=min(level, 11))
+
+
+def _zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_codecs():
+    codecs = {"gzip": _gzip}
+    if brotli is not None:
+        codecs["br"] = _brotli
+    if zstandard is not None:
+        codecs["zstd"] = _zstd
+    return codecs
+
+
+def choose_encoding(accept_encoding, codecs):
+    """Pick the best codec the client accepts, honouring ``q`` weights.
+
+    On a tie the server's preference order (zstd, br, gzip) wins.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in ("zstd", "br", "gzip"):
+        if coding not in codecs:
+            continue
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressedPayloadCache:
+    """Thread-safe LRU of compressed bodies keyed by codec and body digest."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = payload
+            self.current_bytes += len(payload)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+
+def cache_compressed(f):
+    """Mark a view's responses as safe to serve from the compressed cache."""
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.cache_compressed = True
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def init_compression(app):
+    codecs = available_codecs()
+    cache = CompressedPayloadCache(app.config["COMPRESSION_CACHE_MAX_BYTES"])
+    app.extensions["compression_cache"] = cache
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config["COMPRESSION_ENABLED"]:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""), codecs)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config["COMPRESSION_MIN_SIZE"]:
+            return response
+
+        use_cache = g.get("cache_compressed", False)
+        compressed = None
+        if use_cache:
+            cache_key = (encoding, hashlib.blake2b(data, digest_size=16).digest())
+            compressed = cache.get(cache_key)
+        if compressed is None:
+            compressed = codecs[encoding](data, app.config["COMPRESSION_LEVEL"])
+            if use_cache:
+                cache.put(cache_key, compressed)
+
+        if len(compressed) >= len(data):
+            return response
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        return response
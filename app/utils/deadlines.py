@@ -0,0 +1,125 @@
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+from app.extensions import db
+from .rate_limit import request_route_class
+
+DEADLINE_HEADER = "X-Request-Deadline"
+QUERY_CANCELED = "57014"
+# A transaction's statement_timeout is lowered again once the time left has
+# shrunk by this much since it was last set
+TIMEOUT_REFRESH_MS = 100
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining_time():
+    """Seconds left before the current request's deadline, or None if unbounded."""
+    if not has_request_context():
+        return None
+    deadline = g.get("request_deadline")
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def _parse_deadline_header(value):
+    # Absolute Unix time in seconds, e.g. "1767225600.25"
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _deadline_response():
+    response = jsonify({"error": "Request deadline exceeded"})
+    response.status_code = 504
+    return response
+
+
+def _remaining_ms():
+    remaining = remaining_time()
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        g.deadline_exceeded = True
+        raise DeadlineExceeded("Request deadline exceeded")
+    return max(1, int(remaining * 1000))
+
+
+def _set_statement_timeout(connection):
+    connection.info.pop("statement_timeout_ms", None)
+    remaining_ms = _remaining_ms()
+    if remaining_ms is None:
+        return
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {remaining_ms}")
+    connection.info["statement_timeout_ms"] = remaining_ms
+
+
+def _shrink_statement_timeout(
+    connection, cursor, statement, parameters, context, executemany
+):
+    # Later statements in the transaction only get what is left of the budget
+    applied_ms = connection.info.get("statement_timeout_ms")
+    if applied_ms is None:
+        return
+    remaining_ms = _remaining_ms()
+    if remaining_ms is None or applied_ms - remaining_ms < TIMEOUT_REFRESH_MS:
+        return
+    cursor.execute(f"SET LOCAL statement_timeout = {remaining_ms}")
+    connection.info["statement_timeout_ms"] = remaining_ms
+
+
+def _flag_canceled_statement(context):
+    original = context.original_exception
+    if has_request_context() and getattr(original, "pgcode", None) == QUERY_CANCELED:
+        g.deadline_exceeded = True
+
+
+def init_deadlines(app):
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == "postgresql":
+            event.listen(engine, "begin", _set_statement_timeout)
+            event.listen(engine, "before_cursor_execute", _shrink_statement_timeout)
+        event.listen(engine, "handle_error", _flag_canceled_statement)
+
+    @app.before_request
+    def start_request_deadline():
+        limit_class = request_route_class()
+        if limit_class is None:
+            return None
+        now = time.time()
+        deadline = now + current_app.config["REQUEST_TIME_BUDGETS"][limit_class]
+
+        client_deadline = request.headers.get(DEADLINE_HEADER)
+        if client_deadline:
+            parsed = _parse_deadline_header(client_deadline)
+            if parsed is None:
+                return (
+                    jsonify({"error": f"{DEADLINE_HEADER} must be a Unix timestamp"}),
+                    400,
+                )
+            deadline = min(deadline, parsed)
+
+        if deadline <= now:
+            return _deadline_response()
+        g.request_deadline = deadline
+        return None
+
+    @app.after_request
+    def report_deadline_exceeded(response):
+        # Route handlers turn every exception into a 500; restore the real cause
+        if g.get("deadline_exceeded"):
+            db.session.rollback()
+            return _deadline_response()
+        return response
+
+    @app.errorhandler(DeadlineExceeded)
+    def handle_deadline_exceeded(e):
+        return _deadline_response()
@@ -23,3 +23,9 @@ def role_required(role):
         return decorated_function
 
     return decorator
+
+
+def not_batchable(f):
+    """Keep a view out of ``POST /batch``, e.g. one that sends a file."""
+    f.batchable = False
+    return f
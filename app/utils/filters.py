@@ -0,0 +1,324 @@
+import math
+import threading
+from decimal import InvalidOperation
+
+from flask import current_app
+from sqlalchemy import bindparam, func, select
+
+from app.extensions import db
+from app.sharding.routing import target_shards
+from app.sharding.services import scatter, scatter_count
+from .coalescing import decode_instances, encode_instances, normalized
+
+FILTER_SPECS = {}
+
+
+class Page:
+    """The subset of Flask-SQLAlchemy's Pagination the routes rely on."""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        if self.total == 0:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+
+class Filter:
+    """One optional query-string filter.
+
+    ``parse`` takes the whole ``query_params`` dict and returns ``None`` when
+    the filter is not in use. ``criterion`` gets a bind parameter for the
+    parsed value. With ``choices`` the parsed value instead picks a fixed
+    criterion, which then becomes part of the statement cache key.
+    """
+
+    def __init__(self, name, parse, criterion=None, choices=None, join=None):
+        self.name = name
+        self.parse = parse
+        self.criterion = criterion
+        self.choices = choices
+        self.join = join
+
+
+def param(name, convert=str):
+    def parse(query_params):
+        value = query_params.get(name)
+        if not value:
+            return None
+        return convert(value)
+
+    return parse
+
+
+def lowered(value):
+    return value.lower()
+
+
+def sort_options(tie_breaker, *columns):
+    """``sort`` choices: each column ascending, or descending with a "-" prefix.
+
+    The unique ``tie_breaker`` follows the column's direction, so every page
+    has a total order that a ``(column, tie_breaker)`` index serves either way.
+    """
+    options = {}
+    for column in columns:
+        options[column.key] = (column, tie_breaker)
+        options[f"-{column.key}"] = (column.desc(), tie_breaker.desc())
+    return options
+
+
+def parse_pagination(query_params, error_class):
+    try:
+        page_number = int(query_params.get("page", 1))
+        per_page = int(query_params.get("per_page", 10))
+    except ValueError:
+        raise error_class("Invalid page or per_page parameter. Must be an integer")
+    if page_number < 1:
+        raise error_class("Page number must be 1 or greater")
+    if per_page < 1:
+        raise error_class("Per_page must be 1 or greater")
+    return page_number, per_page
+
+
+class FilterSpec:
+    """Declarative filters for one endpoint, compiled once per filter combination.
+
+    Each distinct set of active filters produces one parameterized page and
+    count statement. Later requests with the same set reuse those objects,
+    so SQLAlchemy's compiled cache is hit without rebuilding the query.
+
+    ``order_by`` is the default order; ``sorts`` maps ``sort`` values to
+    others. With ``coalesce`` identical concurrent pages are read once and
+    shared; their items are then detached, read-only instances.
+    """
+
+    def __init__(
+        self,
+        name,
+        model,
+        filters,
+        error_class,
+        scope=(),
+        joins=(),
+        order_by=(),
+        sorts=None,
+        coalesce=False,
+    ):
+        self.name = name
+        self.model = model
+        self.filters = filters
+        self.error_class = error_class
+        self.scope = scope
+        self.joins = joins
+        self.order_by = order_by
+        self.sorts = sorts or {}
+        self.coalesce = coalesce
+        self._by_name = {f.name: f for f in filters}
+        self.hits = 0
+        self.misses = 0
+        self._statements = {}
+        self._lock = threading.Lock()
+        FILTER_SPECS[name] = self
+
+    def parse(self, query_params):
+        """Validate ``query_params`` into ``{filter name: value}`` for active filters."""
+        active = {}
+        try:
+            for spec_filter in self.filters:
+                value = spec_filter.parse(query_params)
+                if value is None:
+                    continue
+                if spec_filter.choices is not None and value not in spec_filter.choices:
+                    raise self.error_class(
+                        f"Invalid {spec_filter.name} value '{value}'. Must be one of: "
+                        f"{', '.join(spec_filter.choices)}"
+                    )
+                active[spec_filter.name] = value
+        except (ValueError, TypeError, InvalidOperation) as e:
+            raise self.error_class(f"Invalid filter data type: {e}")
+        return active
+
+    def parse_sort(self, query_params):
+        sort = query_params.get("sort")
+        if not sort:
+            return None
+        if sort not in self.sorts:
+            raise self.error_class(
+                f"Invalid sort value '{sort}'. Must be one of: {', '.join(self.sorts)}"
+            )
+        return sort
+
+    def cache_key(self, active):
+        return tuple(
+            (f.name, active[f.name] if f.choices is not None else None)
+            for f in self.filters
+            if f.name in active
+        )
+
+    def _filtered(self, key, *entities):
+        criteria = [criterion(bindparam(name)) for name, criterion in self.scope]
+        joins = list(self.joins)
+        for name, choice in key:
+            spec_filter = self._by_name[name]
+            if spec_filter.join is not None and spec_filter.join not in joins:
+                joins.append(spec_filter.join)
+            if spec_filter.choices is not None:
+                criteria.append(spec_filter.choices[choice])
+            else:
+                criteria.append(spec_filter.criterion(bindparam(name)))
+
+        filtered = select(*entities).select_from(self.model)
+        for target in joins:
+            filtered = filtered.join(target)
+        return filtered.where(*criteria)
+
+    def _build(self, key, sort):
+        filtered = self._filtered(key, self.model)
+        page_statement = (
+            filtered.order_by(*self._order_by(sort))
+            .limit(bindparam("_limit"))
+            .offset(bindparam("_offset"))
+        )
+        count_statement = select(func.count()).select_from(filtered.subquery())
+        return page_statement, count_statement
+
+    def statements(self, key, sort=None):
+        statements = self._statements.get((key, sort))
+        if statements is not None:
+            self.hits += 1
+            return statements
+        with self._lock:
+            statements = self._statements.get((key, sort))
+            if statements is None:
+                self.misses += 1
+                statements = self._build(key, sort)
+                self._statements[(key, sort)] = statements
+            else:
+                self.hits += 1
+        return statements
+
+    def _order_by(self, sort=None):
+        # A total order keeps pages stable and lets shard results be merged
+        if sort is not None:
+            return self.sorts[sort]
+        return self.order_by or self.model.__mapper__.primary_key
+
+    def _bind_values(self, active, scope_values):
+        values = {
+            name: value
+            for name, value in active.items()
+            if self._by_name[name].choices is None
+        }
+        values.update(scope_values)
+        return values
+
+    def paginate(self, query_params, **scope_values):
+        page_number, per_page = parse_pagination(query_params, self.error_class)
+        active = self.parse(query_params)
+        sort = self.parse_sort(query_params)
+        coalescer = current_app.extensions.get("coalescing") if self.coalesce else None
+        if coalescer is None:
+            return self._page(active, sort, page_number, per_page, scope_values)
+
+        # Keyed on the parsed values, so "make=Tesla" and "make=tesla" share
+        key = (
+            self.name,
+            sort,
+            page_number,
+            per_page,
+            normalized(active),
+            normalized(scope_values),
+        )
+        return coalescer.run(
+            key,
+            lambda: self._shared_page(
+                active, sort, page_number, per_page, scope_values
+            ),
+            self._encode_page,
+            self._decode_page,
+        )
+
+    def _shared_page(self, active, sort, page_number, per_page, scope_values):
+        page = self._page(active, sort, page_number, per_page, scope_values)
+        # Other requests read these too, so they must not be tied to our session
+        for item in page.items:
+            db.session.expunge(item)
+        return page
+
+    def _encode_page(self, page):
+        return {
+            "items": encode_instances(self.model.__mapper__, page.items),
+            "page": page.page,
+            "per_page": page.per_page,
+            "total": page.total,
+        }
+
+    def _decode_page(self, data):
+        items = decode_instances(self.model.__mapper__, data["items"])
+        return Page(items, data["page"], data["per_page"], data["total"])
+
+    def _page(self, active, sort, page_number, per_page, scope_values):
+        page_statement, count_statement = self.statements(self.cache_key(active), sort)
+
+        values = self._bind_values(active, scope_values)
+        offset = (page_number - 1) * per_page
+        mapper = self.model.__mapper__
+        if len(target_shards(mapper)) > 1:
+            # Every shard's first offset + per_page rows, merged, hold the page
+            items = scatter(
+                page_statement,
+                mapper,
+                self._order_by(sort),
+                {**values, "_limit": offset + per_page, "_offset": 0},
+            )[offset : offset + per_page]
+            total = scatter_count(count_statement, mapper, values)
+            return Page(items, page_number, per_page, total)
+
+        items = (
+            db.session.execute(
+                page_statement, {**values, "_limit": per_page, "_offset": offset}
+            )
+            .scalars()
+            .all()
+        )
+        total = db.session.execute(count_statement, values).scalar()
+        return Page(items, page_number, per_page, total)
+
+    def stream(self, query_params, columns, chunk_size, **scope_values):
+        """Every matching row of ``columns``, in lists of up to ``chunk_size``.
+
+        Filters are validated before this returns. Rows are then fetched from a
+        server-side cursor, so memory use does not grow with the result size.
+        """
+        active = self.parse(query_params)
+        sort = self.parse_sort(query_params)
+        statement = self._filtered(self.cache_key(active), *columns).order_by(
+            *self._order_by(sort)
+        )
+        engine = db.session.get_bind(mapper=self.model.__mapper__)
+        return self._stream_rows(
+            engine, statement, self._bind_values(active, scope_values), chunk_size
+        )
+
+    def _stream_rows(self, engine, statement, values, chunk_size):
+        # The cursor outlives the request's session, so it gets its own connection
+        with engine.connect() as connection:
+            result = connection.execute(
+                statement.execution_options(yield_per=chunk_size), values
+            )
+            yield from result.partitions()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "cached_statements": len(self._statements),
+        }
@@ -0,0 +1,246 @@
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g, has_request_context, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.models import IdempotencyKey
+from app.extensions import db
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# Headers a retry needs to see again, e.g. the new car's version
+REPLAYED_HEADERS = ("ETag", "Location")
+
+
+class IdempotencyClaimLost(Exception):
+    """The request's key was reclaimed by a retry, so its writes must not commit."""
+
+
+def _stale_before(now):
+    return now - timedelta(
+        seconds=current_app.config["IDEMPOTENCY_IN_PROGRESS_TIMEOUT"]
+    )
+
+
+def _claim_key(key, now):
+    """Insert an in-progress row for ``key``; return its id if this request owns it.
+
+    The unique (user_id, key) constraint is what serializes concurrent
+    duplicates, so no lock is held while the wrapped view runs. A stale
+    in-progress row is only taken over while nothing it did can have
+    committed.
+    """
+    db.session.execute(
+        db.delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == current_user.id,
+            IdempotencyKey.key == key,
+            db.or_(
+                IdempotencyKey.expires_at <= now,
+                db.and_(
+                    IdempotencyKey.status_code.is_(None),
+                    IdempotencyKey.committed_at.is_(None),
+                    IdempotencyKey.created_at <= _stale_before(now),
+                ),
+            ),
+        )
+    )
+    claimed = db.session.execute(
+        insert(IdempotencyKey)
+        .values(
+            user_id=current_user.id,
+            key=key,
+            request_method=request.method,
+            request_path=request.path,
+            created_at=now,
+            expires_at=now
+            + timedelta(seconds=current_app.config["IDEMPOTENCY_KEY_TTL"]),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "key"])
+        .returning(IdempotencyKey.id)
+    ).scalar()
+    db.session.commit()
+    return claimed
+
+
+def _track_connection(session, transaction, connection):
+    session.info.setdefault("idempotency_engines", set()).add(connection.engine)
+
+
+def _forget_connections(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("idempotency_engines", None)
+
+
+def _mark_committed(session):
+    """Record, with the wrapped request's own commit, that its writes landed.
+
+    When every write went to the database that holds the key, the mark is
+    part of the same transaction, so a rolled-back request leaves the key
+    reclaimable. Writes on other shards cannot commit atomically with it, so
+    the key is marked beforehand in its own transaction and stays in progress
+    until a response is stored or it expires.
+    """
+    if not has_request_context():
+        return
+    claim_id = g.get("idempotency_claim")
+    if claim_id is None:
+        return
+    session.flush()
+    mark = (
+        db.update(IdempotencyKey)
+        .where(IdempotencyKey.id == claim_id)
+        .values(
+            committed_at=db.func.coalesce(
+                IdempotencyKey.committed_at, datetime.utcnow()
+            )
+        )
+    )
+    key_engine = db.engines[None]
+    if session.info.get("idempotency_engines", set()) - {key_engine}:
+        with key_engine.begin() as connection:
+            marked = connection.execute(mark).rowcount
+    else:
+        marked = session.execute(mark).rowcount
+    if not marked:
+        raise IdempotencyClaimLost(
+            "The Idempotency-Key was taken over by a retry; not committing"
+        )
+
+
+def _replay(record, stale_before):
+    if record is not None and (record.request_method, record.request_path) != (
+        request.method,
+        request.path,
+    ):
+        return (
+            jsonify({"error": "Idempotency-Key was already used for another request"}),
+            422,
+        )
+    if (
+        record is not None
+        and record.status_code is None
+        and record.committed_at is not None
+        and record.created_at <= stale_before
+    ):
+        # The first request's writes may have landed but its response was not
+        # stored, so running it again could repeat them
+        return (
+            jsonify(
+                {
+                    "error": "A request with this Idempotency-Key was already "
+                    "applied but its response is unavailable"
+                }
+            ),
+            409,
+        )
+    if record is None or record.status_code is None:
+        response = jsonify(
+            {"error": "A request with this Idempotency-Key is in progress"}
+        )
+        response.status_code = 409
+        response.headers["Retry-After"] = "1"
+        return response
+
+    response = make_response(record.response_body, record.status_code)
+    response.mimetype = record.mimetype
+    response.headers.update(record.response_headers or {})
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(f):
+    """Store the first response per ``Idempotency-Key`` and replay it on retries.
+
+    Must be applied below ``login_required`` since keys are scoped per user.
+    Server errors are not stored, so the client can retry them for real,
+    unless the request's writes had already committed.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return (
+                jsonify(
+                    {
+                        "error": f"Idempotency-Key cannot exceed {MAX_KEY_LENGTH} characters"
+                    }
+                ),
+                400,
+            )
+
+        now = datetime.utcnow()
+        claim_id = _claim_key(key, now)
+        if claim_id is None:
+            record = IdempotencyKey.query.filter_by(
+                user_id=current_user.id, key=key
+            ).first()
+            return _replay(record, _stale_before(now))
+
+        g.idempotency_claim = claim_id
+        try:
+            response = make_response(f(*args, **kwargs))
+        finally:
+            g.idempotency_claim = None
+        # Whatever the view left uncommitted, e.g. after a lost claim, must not
+        # ride along with the stored response
+        db.session.rollback()
+        claim = db.and_(
+            IdempotencyKey.id == claim_id, IdempotencyKey.status_code.is_(None)
+        )
+        try:
+            if response.status_code >= 500:
+                db.session.execute(
+                    db.delete(IdempotencyKey).where(
+                        claim, IdempotencyKey.committed_at.is_(None)
+                    )
+                )
+            else:
+                db.session.execute(
+                    db.update(IdempotencyKey)
+                    .where(claim)
+                    .values(
+                        status_code=response.status_code,
+                        mimetype=response.mimetype,
+                        response_body=response.get_data(),
+                        response_headers={
+                            name: response.headers[name]
+                            for name in REPLAYED_HEADERS
+                            if name in response.headers
+                        },
+                    )
+                )
+            db.session.commit()
+        except Exception:
+            # The key stays in progress and is never reclaimed if the writes
+            # committed, so a retry gets 409 instead of repeating them
+            db.session.rollback()
+            current_app.logger.exception("Could not store the idempotent response")
+        return response
+
+    return decorated_function
+
+
+def purge_expired_keys(now=None):
+    result = db.session.execute(
+        db.delete(IdempotencyKey).where(
+            IdempotencyKey.expires_at <= (now or datetime.utcnow())
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def init_idempotency(app):
+    for name, listener in (
+        ("after_begin", _track_connection),
+        ("after_transaction_end", _forget_connections),
+        ("before_commit", _mark_committed),
+    ):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
@@ -0,0 +1,297 @@
+import math
+import threading
+import time
+import uuid
+
+from flask import current_app, g, jsonify, request, session
+
+from app.auth.tokens import access_claims
+from .sqlite import LocalSQLite
+
+# Seconds between sweeps of buckets that have refilled
+PRUNE_INTERVAL = 60
+
+
+def _refill(state, rate, burst, now):
+    tokens, updated = state if state else (burst, now)
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryBackend:
+    """Per-process state; only correct with a single worker."""
+
+    def __init__(self, idle_seconds=0):
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._slots = {}
+        self._pruned_at = 0.0
+
+    def consume(self, keys, rate, burst, now):
+        """Take a token from every bucket in ``keys``, or from none of them.
+
+        Returns whether the request is allowed and the fewest tokens left.
+        """
+        with self._lock:
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                # A bucket idle this long is full, the same as a missing one
+                self._buckets = {
+                    key: state
+                    for key, state in self._buckets.items()
+                    if state[1] >= now - self.idle_seconds
+                }
+                self._pruned_at = now
+            levels = [_refill(self._buckets.get(key), rate, burst, now) for key in keys]
+            allowed = all(tokens >= 1 for tokens in levels)
+            if allowed:
+                levels = [tokens - 1 for tokens in levels]
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens, now)
+            return allowed, min(levels)
+
+    def acquire_slot(self, name, limit, ttl, now):
+        with self._lock:
+            slots = {
+                token: expires
+                for token, expires in self._slots.get(name, {}).items()
+                if expires > now
+            }
+            self._slots[name] = slots
+            if len(slots) >= limit:
+                return None
+            token = uuid.uuid4().hex
+            slots[token] = now + ttl
+            return token
+
+    def renew_slot(self, name, token, expires):
+        with self._lock:
+            slots = self._slots.get(name, {})
+            if token in slots:
+                slots[token] = expires
+
+    def release_slot(self, name, token):
+        with self._lock:
+            self._slots.get(name, {}).pop(token, None)
+
+
+class SQLiteBackend:
+    """State in a local SQLite file shared by every worker on the host."""
+
+    def __init__(self, path, idle_seconds=0):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._pruned_at = 0.0
+        self._connection = LocalSQLite(
+            path,
+            [
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+                "CREATE TABLE IF NOT EXISTS slots "
+                "(name TEXT NOT NULL, token TEXT PRIMARY KEY, expires REAL NOT NULL)",
+            ],
+        ).connection
+
+    def consume(self, keys, rate, burst, now):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                connection.execute(
+                    "DELETE FROM buckets WHERE updated < ?", (now - self.idle_seconds,)
+                )
+                self._pruned_at = now
+            levels = []
+            for key in keys:
+                row = connection.execute(
+                    "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                levels.append(_refill(row, rate, burst, now))
+            allowed = all(tokens >= 1 for tokens in levels)
+            if allowed:
+                levels = [tokens - 1 for tokens in levels]
+            connection.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens, now) for key, tokens in zip(keys, levels)],
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, min(levels)
+
+    def acquire_slot(self, name, limit, ttl, now):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM slots WHERE name = ? AND expires <= ?", (name, now)
+            )
+            (in_use,) = connection.execute(
+                "SELECT count(*) FROM slots WHERE name = ?", (name,)
+            ).fetchone()
+            token = None
+            if in_use < limit:
+                token = uuid.uuid4().hex
+                connection.execute(
+                    "INSERT INTO slots (name, token, expires) VALUES (?, ?, ?)",
+                    (name, token, now + ttl),
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return token
+
+    def renew_slot(self, name, token, expires):
+        self._connection().execute(
+            "UPDATE slots SET expires = ? WHERE token = ?", (expires, token)
+        )
+
+    def release_slot(self, name, token):
+        self._connection().execute("DELETE FROM slots WHERE token = ?", (token,))
+
+
+BACKENDS = {
+    "memory": lambda location, idle_seconds: MemoryBackend(idle_seconds),
+    "sqlite": SQLiteBackend,
+}
+
+
+def create_backend(storage_url, idle_seconds=0):
+    """Build a backend from ``memory://`` or ``sqlite:///path/to/file.db``.
+
+    Buckets untouched for ``idle_seconds`` are full again and get dropped.
+    Other stores can be plugged in by adding a factory to ``BACKENDS``.
+    """
+    scheme, _, location = storage_url.partition("://")
+    if scheme not in BACKENDS:
+        raise ValueError(f"Unknown rate limit storage: '{storage_url}'")
+    return BACKENDS[scheme](
+        location[1:] if location.startswith("/") else location, idle_seconds
+    )
+
+
+def route_class(name):
+    """Assign a view to a rate-limit class such as ``expensive`` or ``write``."""
+
+    def decorator(f):
+        f.rate_limit_class = name
+        return f
+
+    return decorator
+
+
+def view_route_class(view, method):
+    limit_class = getattr(view, "rate_limit_class", None)
+    if limit_class is None:
+        limit_class = "default" if method == "GET" else "write"
+    return limit_class
+
+
+def request_route_class():
+    view = current_app.view_functions.get(request.endpoint)
+    if view is None:
+        return None
+    return view_route_class(view, request.method)
+
+
+def _too_many(message, status_code, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = status_code
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _slot_ttl(limit_class):
+    # A slot must outlive the longest request of its class
+    return max(
+        current_app.config["CONCURRENCY_SLOT_TTL"],
+        current_app.config["REQUEST_TIME_BUDGETS"].get(limit_class, 0),
+    )
+
+
+def _renewing(chunks, backend, name, token, ttl):
+    """Yield ``chunks`` and keep the slot alive for as long as they keep coming.
+
+    A stream that sends nothing for half the slot's ttl may lose it.
+    """
+    renewed = time.time()
+    try:
+        for chunk in chunks:
+            now = time.time()
+            if now - renewed >= ttl / 2:
+                backend.renew_slot(name, token, now + ttl)
+                renewed = now
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def init_rate_limiting(app):
+    if not app.config["RATE_LIMIT_ENABLED"]:
+        return
+    backend = create_backend(
+        app.config["RATE_LIMIT_STORAGE_URL"],
+        # Long enough for any class's bucket to refill from empty
+        max(burst / rate for rate, burst in app.config["RATE_LIMITS"].values()),
+    )
+    app.extensions["rate_limit"] = backend
+
+    @app.before_request
+    def enforce_rate_limits():
+        limit_class = request_route_class()
+        if limit_class is None:
+            return None
+        rate, burst = current_app.config["RATE_LIMITS"][limit_class]
+        now = time.time()
+
+        # Read the id straight from the session so throttling never loads the user
+        identities = [f"ip:{request.remote_addr}"]
+        user_id = session.get("_user_id")
+        if user_id is None:
+            claims = access_claims()
+            user_id = claims["uid"] if claims else None
+        if user_id is not None:
+            identities.append(f"user:{user_id}")
+
+        # Nothing is debited unless every bucket allows it, so a throttled
+        # user does not drain the budget of everyone behind the same address
+        allowed, tokens = backend.consume(
+            [f"{identity}:{limit_class}" for identity in identities], rate, burst, now
+        )
+        if not allowed:
+            return _too_many("Rate limit exceeded", 429, (1 - tokens) / rate)
+
+        max_concurrency = current_app.config["MAX_CONCURRENCY"].get(limit_class)
+        if max_concurrency:
+            token = backend.acquire_slot(
+                limit_class, max_concurrency, _slot_ttl(limit_class), now
+            )
+            if token is None:
+                return _too_many("Server is busy, please retry", 503, 1)
+            g.rate_limit_slot = (request.environ, limit_class, token)
+        return None
+
+    @app.after_request
+    def hold_slot_while_streaming(response):
+        # A streamed body is sent after the request ends, and it occupies the
+        # worker until then, so the slot is renewed while it streams and
+        # released when the server closes it
+        slot = g.get("rate_limit_slot")
+        if response.is_streamed and slot is not None and slot[0] is request.environ:
+            del g.rate_limit_slot
+            _, limit_class, token = slot
+            response.response = _renewing(
+                response.response, backend, limit_class, token, _slot_ttl(limit_class)
+            )
+            response.call_on_close(lambda: backend.release_slot(limit_class, token))
+        return response
+
+    @app.teardown_request
+    def release_concurrency_slot(exc):
+        # Requests nested in this one (see /batch) share g but not the slot
+        slot = g.get("rate_limit_slot")
+        if slot is not None and slot[0] is request.environ:
+            del g.rate_limit_slot
+            backend.release_slot(*slot[1:])
@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import threading
+
+
+class LocalSQLite:
+    """A SQLite file in WAL mode shared by every worker on the host.
+
+    ``schema`` statements run once when it is opened. Each thread of each
+    process gets its own connection, in autocommit mode.
+    """
+
+    def __init__(self, path, schema=()):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in schema:
+            connection.execute(statement)
+
+    def connection(self):
+        # sqlite3 connections must not cross threads or a fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=1.0, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
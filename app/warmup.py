@@ -0,0 +1,116 @@
+import logging
+import re
+import subprocess
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from .extensions import db
+from .sharding.routing import shard_names, use_shard
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SNIPPET = "from app.app import create_app; create_app()"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def prepare_for_fork(app):
+    """Do the once-per-deploy work in the gunicorn master before workers fork."""
+    with app.app_context():
+        configure_mappers()
+        # Forked children must not share sockets opened by the master
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def _executing(statement, values):
+    return lambda: db.session.execute(statement, values).all()
+
+
+def _hot_statements():
+    from app.auth.models import User
+    from app.rentals.models import Rental
+    from app.utils.filters import FILTER_SPECS
+
+    # The busiest request paths, with parameters that match nothing
+    statements = [
+        lambda: db.session.get(User, -1),
+        lambda: Rental.query.filter_by(user_id=-1, return_date=None).first(),
+    ]
+    # Listings reuse their spec's cached statements, so warm those very objects
+    # for the unfiltered page in every sort order
+    for spec in FILTER_SPECS.values():
+        scope_values = {name: None for name, _ in spec.scope}
+        for sort in (None, *spec.sorts):
+            page_statement, count_statement = spec.statements((), sort)
+            statements.append(
+                _executing(page_statement, {**scope_values, "_limit": 1, "_offset": 0})
+            )
+        statements.append(_executing(count_statement, scope_values))
+    return statements
+
+
+def warm_worker(app):
+    """Reset the inherited pool, open connections up front and prime caches.
+
+    Every shard's engine has its own pool and compiled-statement cache, so
+    each one is filled.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+        connections = []
+        try:
+            for engine in db.engines.values():
+                for _ in range(app.config["DB_POOL_WARM_SIZE"]):
+                    connection = engine.connect()
+                    connection.execute(text("SELECT 1"))
+                    connections.append(connection)
+        except Exception as e:
+            logger.warning("Could not pre-fill the connection pool: %s", e)
+        finally:
+            for connection in connections:
+                connection.close()
+
+        statements = _hot_statements()
+        for shard in shard_names():
+            with use_shard(shard):
+                for statement in statements:
+                    try:
+                        statement()
+                    except Exception as e:
+                        logger.warning("Warm-up statement failed: %s", e)
+                        db.session.rollback()
+        db.session.rollback()
+        db.session.remove()
+
+
+def measure_import_time():
+    """Run ``python -X importtime`` on app start-up in a fresh interpreter.
+
+    Returns the total in microseconds and ``(cumulative_us, name)`` for every
+    top-level import, largest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SNIPPET],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total, top_level = 0, []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = (
+            int(match.group(2)),
+            len(match.group(3)),
+            match.group(4),
+        )
+        if depth == 1:
+            total += cumulative
+            top_level.append((cumulative, name))
+    return total, sorted(top_level, reverse=True)
@@ -0,0 +1,27 @@
+import os
+
+bind = f"0.0.0.0:{os.environ.get('APP_PORT', 5005)}"
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+# "gevent" holds thousands of idle /availability/stream connections per worker
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+if worker_class == "gevent":
+    # Gunicorn only patches inside each worker, after a preloaded app has
+    # already imported blocking sockets and threads, so patch before loading
+    # it. psycopg2 then waits for the database without blocking the hub.
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    from app.warmup import warm_worker
+
+    warm_worker(worker.wsgi)
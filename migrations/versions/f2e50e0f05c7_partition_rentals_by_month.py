@@ -0,0 +1,106 @@
+"""partition rentals by month
+
+Revision ID: f2e50e0f05c7
+Revises: 3b2386a67744
+Create Date: 2026-10-19 12:05:41.218305
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2e50e0f05c7'
+down_revision = '3b2386a67744'
+branch_labels = None
+depends_on = None
+
+
+MONTHS_AHEAD = 3
+
+
+def _add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _create_indexes():
+    op.create_index('ix_rentals_car_id_rental_date', 'rentals', ['car_id', 'rental_date'], unique=False)
+    op.create_index('ix_rentals_rental_date_brin', 'rentals', ['rental_date'], unique=False, postgresql_using='brin')
+    op.create_index('ix_rentals_user_id_rental_date_id', 'rentals', ['user_id', 'rental_date', 'id'], unique=False)
+    op.create_index('ix_rentals_user_id_active', 'rentals', ['user_id'], unique=False, postgresql_where=sa.text('return_date IS NULL'))
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    op.rename_table('rentals', 'rentals_unpartitioned')
+    op.execute('ALTER TABLE rentals_unpartitioned RENAME CONSTRAINT rentals_pkey TO rentals_unpartitioned_pkey')
+    op.drop_index('ix_rentals_car_id_rental_date', table_name='rentals_unpartitioned')
+    op.drop_index('ix_rentals_rental_date_brin', table_name='rentals_unpartitioned')
+    op.drop_index('ix_rentals_user_id_rental_date_id', table_name='rentals_unpartitioned')
+
+    op.execute("""
+        CREATE TABLE rentals (
+            id INTEGER NOT NULL DEFAULT nextval('rentals_id_seq'),
+            rental_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            return_date TIMESTAMP WITHOUT TIME ZONE,
+            total_fee NUMERIC(10, 2),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            car_id INTEGER NOT NULL REFERENCES cars (id),
+            CONSTRAINT rentals_pkey PRIMARY KEY (id, rental_date)
+        ) PARTITION BY RANGE (rental_date)
+    """)
+    op.execute('CREATE TABLE rentals_default PARTITION OF rentals DEFAULT')
+
+    first_rental = bind.execute(sa.text('SELECT min(rental_date) FROM rentals_unpartitioned')).scalar()
+    current_month = datetime.utcnow().date().replace(day=1)
+    month = (first_rental or datetime.utcnow()).date().replace(day=1)
+    while month <= _add_months(current_month, MONTHS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE rentals_y{month.year:04d}m{month.month:02d} PARTITION OF rentals "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+
+    op.execute("""
+        INSERT INTO rentals (id, rental_date, return_date, total_fee, user_id, car_id)
+        SELECT id, rental_date, return_date, total_fee, user_id, car_id FROM rentals_unpartitioned
+    """)
+    op.execute('ALTER SEQUENCE rentals_id_seq OWNED BY rentals.id')
+    op.drop_table('rentals_unpartitioned')
+    _create_indexes()
+
+
+def downgrade():
+    op.rename_table('rentals', 'rentals_partitioned')
+    op.execute('ALTER TABLE rentals_partitioned RENAME CONSTRAINT rentals_pkey TO rentals_partitioned_pkey')
+    op.drop_index('ix_rentals_car_id_rental_date', table_name='rentals_partitioned')
+    op.drop_index('ix_rentals_rental_date_brin', table_name='rentals_partitioned')
+    op.drop_index('ix_rentals_user_id_rental_date_id', table_name='rentals_partitioned')
+    op.drop_index('ix_rentals_user_id_active', table_name='rentals_partitioned')
+
+    op.execute("""
+        CREATE TABLE rentals (
+            id INTEGER NOT NULL DEFAULT nextval('rentals_id_seq'),
+            rental_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            return_date TIMESTAMP WITHOUT TIME ZONE,
+            total_fee NUMERIC(10, 2),
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            car_id INTEGER NOT NULL REFERENCES cars (id),
+            CONSTRAINT rentals_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO rentals (id, rental_date, return_date, total_fee, user_id, car_id)
+        SELECT id, rental_date, return_date, total_fee, user_id, car_id FROM rentals_partitioned
+    """)
+    op.execute('ALTER SEQUENCE rentals_id_seq OWNED BY rentals.id')
+    op.execute('DROP TABLE rentals_partitioned CASCADE')
+
+    op.create_index('ix_rentals_car_id_rental_date', 'rentals', ['car_id', 'rental_date'], unique=False)
+    op.create_index('ix_rentals_rental_date_brin', 'rentals', ['rental_date'], unique=False, postgresql_using='brin')
+    op.create_index('ix_rentals_user_id_rental_date_id', 'rentals', ['user_id', 'rental_date', 'id'], unique=False)
@@ -1,7 +1,9 @@
 import os
 from app.app import create_app
+from app.warmup import prepare_for_fork
 
 flask_app = create_app()
+prepare_for_fork(flask_app)
 
 if __name__ == "__main__":
     port = int(os.environ.get("APP_PORT", 5005))